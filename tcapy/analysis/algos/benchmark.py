@@ -19,6 +19,8 @@ from tcapy.util.mediator import Mediator
 # from tcapy.util.loggermanager import LoggerManager
 from tcapy.util.timeseries import TimeSeriesOps
 
+from tcapy.analysis.algos.marketindex import WeightedPriceIndex, RangeMinMaxIndex, RangeMedianIndex, MarketContext
+
 from tcapy.util.loggermanager import LoggerManager
 from tcapy.util.customexceptions import *
 
@@ -37,6 +39,25 @@ class Benchmark(ABC):
 
     """
 
+    def get_output_fields(self):
+        """Gets the fields this benchmark adds to the trade/order data, which is used by CalcPlanner to work out if it
+        needs to be calculated. None implies it should always be calculated (eg. if it modifies the trade/orders).
+
+        Returns
+        -------
+        str (list)
+        """
+        return None
+
+    def get_required_fields(self):
+        """Gets the trade/order fields this benchmark needs, which might be calculated by other benchmarks/metrics
+
+        Returns
+        -------
+        str (list)
+        """
+        return []
+
 ########################################################################################################################
 
 class BenchmarkMarket(Benchmark):
@@ -272,12 +293,34 @@ class BenchmarkTrade(Benchmark):
         self._time_series_ops = Mediator.get_time_series_ops()
 
     @abc.abstractmethod
-    def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, field=None):
+    def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, field=None,
+                            market_context=None):
         pass
 
     def _add_benchmark_to_trade(self, trade_order_df, market_df, field=None):
         pass
 
+    def _get_market_context(self, market_df, market_context=None):
+        """Gets the MarketContext for the market data, which is shared between benchmarks/metrics for the same ticker.
+        If one hasn't been supplied (or it's for different market data), a temporary one is created.
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            market data
+
+        market_context : MarketContext
+            Shared MarketContext created by the caller
+
+        Returns
+        -------
+        MarketContext
+        """
+        if market_context is not None and market_context.is_market_data(market_df):
+            return market_context
+
+        return MarketContext(market_df)
+
     def _check_empty_benchmark_market_trade_data(self, trade_order_name, trade_order_df, market_df):
         """Should we calculate a benchmark for trade/orders (eg. sometimes we might only wish to calculate benchmarks
         for orders but not for trades).
@@ -330,8 +373,12 @@ class BenchmarkArrival(BenchmarkTrade):
         self._overwrite_time_of_day = overwrite_time_of_day
         self._overwrite_timezone = overwrite_timezone
 
+    def get_output_fields(self):
+        return [self._benchmark_name]
+
     def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, bid_benchmark=None,
-                            ask_benchmark=None, start_time_before_offset=None, overwrite_time_of_day=None, overtime_zone=None):
+                            ask_benchmark=None, start_time_before_offset=None, overwrite_time_of_day=None, overtime_zone=None,
+                            market_context=None):
         if self._check_empty_benchmark_market_trade_data(trade_order_name, trade_order_df, market_df):
             return trade_order_df, market_df
 
@@ -342,12 +389,14 @@ class BenchmarkArrival(BenchmarkTrade):
         if overtime_zone is None: overtime_zone = self._overwrite_time_of_day
 
         if bid_benchmark in market_df.columns and ask_benchmark in market_df.columns:
-            trade_order_df[self._benchmark_name] = np.nan
+            market_context = self._get_market_context(market_df, market_context=market_context)
+
+            benchmark = np.empty(len(trade_order_df.index)); benchmark.fill(np.nan)
 
-            # Deal with all the buy trades (ie. buying at the ask!)
-            is_side = trade_order_df['side'] == 1
-            side_dt = trade_order_df.index[is_side]
+            side = trade_order_df['side'].values
+            side_dt = trade_order_df.index
 
+            # Offset time and then overwrite if specified by user
             if start_time_before_offset is not None:
                 side_dt = side_dt - self._time_series_ops.get_time_delta(start_time_before_offset)
 
@@ -355,24 +404,16 @@ class BenchmarkArrival(BenchmarkTrade):
                 side_dt = self._time_series_ops.overwrite_time_of_day_in_datetimeindex(side_dt, overwrite_time_of_day,
                             old_tz=trade_order_df.index.tz, overwrite_timezone=overtime_zone)
 
-            # TODO work on actual rather than copy
-            benchmark, actual_dt = self._time_series_ops.vlookup_style_data_frame(side_dt, market_df, ask_benchmark)
-            trade_order_df[self._benchmark_name][is_side] = benchmark
+            # Deal with all the buy trades (ie. buying at the ask!), the search of the market data is shared with the
+            # sell trades (and also other benchmarks/metrics which search for the same times)
+            is_side = side == 1
+            benchmark[is_side], actual_dt = market_context.vlookup(side_dt, ask_benchmark, mask=is_side)
 
             # Now, do all the sell trades (ie. selling at the bid!)
-            is_side = trade_order_df['side'] == -1
-            side_dt = trade_order_df.index[is_side]
+            is_side = side == -1
+            benchmark[is_side], actual_dt = market_context.vlookup(side_dt, bid_benchmark, mask=is_side)
 
-            # Offset time and then overwrite if specified by user
-            if start_time_before_offset is not None:
-                side_dt = side_dt - self._time_series_ops.get_time_delta(start_time_before_offset)
-
-            if overwrite_time_of_day is not None:
-                side_dt = self._time_series_ops.overwrite_time_of_day_in_datetimeindex(side_dt, overwrite_time_of_day,
-                            old_tz=trade_order_df.index.tz, overwrite_timezone=overtime_zone)
-
-            benchmark, actual_dt = self._time_series_ops.vlookup_style_data_frame(side_dt, market_df, bid_benchmark)
-            trade_order_df[self._benchmark_name][is_side] = benchmark
+            trade_order_df[self._benchmark_name] = benchmark
 
             # # find the nearest price as arrival
             # series, dt = self._time_series_ops.vlookup_style_data_frame(market_trade_order_df.index, market_df, field)
@@ -409,12 +450,15 @@ class BenchmarkWeighted(BenchmarkTrade):
         self._overwrite_time_of_day = overwrite_time_of_day
         self._overwrite_timezone = overwrite_timezone
 
+    def get_output_fields(self):
+        return [self._benchmark_name]
+
     def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, bid_benchmark=None,
                             ask_benchmark=None,
                             weighting_field=None,
                             benchmark_date_start_field=None,
                             benchmark_date_end_field=None, start_time_before_offset=None, finish_time_after_offset=None,
-                            overwrite_time_of_day=None, overwrite_timezone=None):
+                            overwrite_time_of_day=None, overwrite_timezone=None, market_context=None):
 
         if self._check_empty_benchmark_market_trade_data(trade_order_name, trade_order_df, market_df):
             return trade_order_df, market_df
@@ -466,17 +510,21 @@ class BenchmarkWeighted(BenchmarkTrade):
             if finish_time_after_offset is not None:
                 date_end = date_end + self._time_series_ops.get_time_delta(finish_time_after_offset)
 
+            market_context = self._get_market_context(market_df, market_context=market_context)
+
             # date_start = np.searchsorted(market_df.index, date_start)
             # date_end = np.searchsorted(market_df.index, date_end)
-            date_start = market_df.index.searchsorted(date_start)
-            date_end = market_df.index.searchsorted(date_end)
-            bid_price = market_df[bid_benchmark].values
-            ask_price = market_df[ask_benchmark].values
+            date_start = market_context.search_sorted(date_start)
+            date_end = market_context.search_sorted(date_end)
 
             try:
+                # Typically, both will be the mid, in which case we only need to precompute benchmarks on one of them
+                bid_index = self._get_price_index(market_context, bid_benchmark, weighting_field=weighting_field)
+                ask_index = self._get_price_index(market_context, ask_benchmark, weighting_field=weighting_field)
+
                 trade_order_df[self._benchmark_name] = \
-                    self._benchmark_calculation(trade_order_df, bid_price, ask_price, date_start, date_end,
-                                                weights=self._generate_weights(market_df, weighting_field=weighting_field))
+                    self._benchmark_calculation(trade_order_df, bid_index, ask_index, date_start, date_end,
+                                                len(market_context))
             except:
                 LoggerManager.getLogger(__name__).warning(
                     self._benchmark_name + " not calculated (check if has correct input fields)")
@@ -493,34 +541,46 @@ class BenchmarkWeighted(BenchmarkTrade):
 
         return None
 
-    def _benchmark_calculation(self, trade_order_df, bid_price, ask_price, date_start, date_end, weights=None):
+    def _benchmark_calculation(self, trade_order_df, bid_index, ask_index, date_start, date_end, market_length):
 
-        benchmark = []
+        date_start = np.asarray(date_start); date_end = np.asarray(date_end)
 
-        for i in range(0, len(trade_order_df.index)):
-            # If the trade is a buy
-            if trade_order_df['side'][i] == 1:
-                price = ask_price
+        self._check_market_overlap(market_length, date_start, date_end)
 
-            # If the trade is a sell
-            elif trade_order_df['side'][i] == -1:
-                price = bid_price
+        side = trade_order_df['side'].values
 
-            if date_start[i] == date_end[i]:
-                benchmark.append(price[date_start[i]])
-            else:
-                try:
-                    benchmark.append(
-                        np.average(price[date_start[i]:date_end[i]], weights=weights[date_start[i]:date_end[i]]))
-                except Exception as e:
-                    err_msg = self._benchmark_name + " cannot be calculated, given market data does not fully overlap with trade data: " \
-                              + str(e)
+        # Buys are benchmarked against the ask and sells against the bid
+        return np.where(side == 1, self._get_price(ask_index, date_start, date_end, side=1),
+                        np.where(side == -1, self._get_price(bid_index, date_start, date_end, side=-1), np.nan))
+
+    def _get_price_index(self, market_context, field, weighting_field=None):
+        """Gets an index for the whole of the market data (eg. cumulative sums of price x weight), so we can answer
+        all the trade/order windows in a batch, rather than scanning over the ticks in every window separately. The
+        index is cached in the MarketContext, so it's only built once per ticker (eg. for both trades and orders).
+        """
+        return market_context.get_price_index(self._get_price_index_key(field, weighting_field=weighting_field),
+            lambda: self._create_price_index(market_context.get_field(field),
+                weights=self._generate_weights(market_context.get_market_df(), weighting_field=weighting_field)))
 
-                    LoggerManager.getLogger(__name__).error(err_msg)
+    def _get_price_index_key(self, field, weighting_field=None):
+        return ('weighted', field, weighting_field)
 
-                    raise TradeMarketNonOverlapException(err_msg)
+    def _create_price_index(self, price, weights=None):
+        return WeightedPriceIndex(price, weights=weights)
+
+    def _get_price(self, price_index, date_start, date_end, side=None):
+        return price_index.weighted_average(date_start, date_end)
+
+    def _check_market_overlap(self, market_length, date_start, date_end):
+        """Checks that every trade/order window lies within the market data (otherwise we can't calculate a benchmark
+        for it).
+        """
+        if ((date_start == date_end) & (date_start >= market_length)).any() or (date_end > market_length).any():
+            err_msg = self._benchmark_name + " cannot be calculated, given market data does not fully overlap with trade data"
 
-        return benchmark
+            LoggerManager.getLogger(__name__).error(err_msg)
+
+            raise TradeMarketNonOverlapException(err_msg)
 
 ########################################################################################################################
 
@@ -567,6 +627,9 @@ class BenchmarkTWAP(BenchmarkWeighted):
 
         self._benchmark_name = 'twap' + benchmark_post_fix
 
+    def _get_price_index_key(self, field, weighting_field=None):
+        return ('twap', field)
+
     def _generate_weights(self, market_df, weighting_field=None):
         weights = market_df.index.tz_convert(None).to_series().diff().values / np.timedelta64(1, 's')
 
@@ -598,36 +661,14 @@ class BenchmarkMedian(BenchmarkWeighted):
 
         self._benchmark_name = 'median' + benchmark_post_fix
 
-    def _benchmark_calculation(self, trade_order_df, bid_price, ask_price, date_start, date_end, weights=None):
-
-        benchmark = []
-
-        for i in range(0, len(trade_order_df.index)):
-            # If the trade is a buy
-            if trade_order_df['side'][i] == 1:
-                price = ask_price
-
-            # If the trade is a sell
-            elif trade_order_df['side'][i] == -1:
-                price = bid_price
-
-            if date_start[i] == date_end[i]:
-                benchmark.append(price[date_start[i]])
-            else:
-                try:
-                    benchmark.append(self._get_price(price[date_start[i]:date_end[i]], side=trade_order_df['side'][i]))
-                except Exception as e:
-                    err_msg = self._benchmark_name + " cannot be calculated, given market data does not fully overlap with trade data: " \
-                              + str(e)
-
-                    LoggerManager.getLogger(__name__).error(err_msg)
-
-                    raise TradeMarketNonOverlapException(err_msg)
+    def _get_price_index_key(self, field, weighting_field=None):
+        return ('median', field)
 
-        return benchmark
+    def _create_price_index(self, price, weights=None):
+        return RangeMedianIndex(price)
 
-    def _get_price(self, price, side=None):
-        return np.median(price)
+    def _get_price(self, price_index, date_start, date_end, side=None):
+        return price_index.median(date_start, date_end)
 
     def _generate_weights(self, market_df, weighting_field=None):
         return None
@@ -655,11 +696,17 @@ class BenchmarkBest(BenchmarkMedian):
 
         self._benchmark_name = 'best' + benchmark_post_fix
 
-    def _get_price(self, price, side=None):
+    def _get_price_index_key(self, field, weighting_field=None):
+        return ('min_max', field)
+
+    def _create_price_index(self, price, weights=None):
+        return RangeMinMaxIndex(price)
+
+    def _get_price(self, price_index, date_start, date_end, side=None):
         if side == 1:
-            return np.min(price)
+            return price_index.min(date_start, date_end)
         elif side == -1:
-            return np.max(price)
+            return price_index.max(date_start, date_end)
 
 
 ########################################################################################################################
@@ -683,13 +730,19 @@ class BenchmarkWorst(BenchmarkMedian):
                                             start_time_before_offset=start_time_before_offset, finish_time_after_offset=finish_time_after_offset,
                                             overwrite_time_of_day=overwrite_time_of_day, overwrite_timezone=overwrite_timezone)
 
-        self._benchmark_name = 'best' + benchmark_post_fix
+        self._benchmark_name = 'worst' + benchmark_post_fix
+
+    def _get_price_index_key(self, field, weighting_field=None):
+        return ('min_max', field)
+
+    def _create_price_index(self, price, weights=None):
+        return RangeMinMaxIndex(price)
 
-    def _get_price(self, price, side=None):
+    def _get_price(self, price_index, date_start, date_end, side=None):
         if side == 1:
-            return np.max(price)
+            return price_index.max(date_start, date_end)
         elif side == -1:
-            return np.min(price)
+            return price_index.min(date_start, date_end)
 
 ########################################################################################################################
 
@@ -704,7 +757,8 @@ class BenchmarkTradeOffset(BenchmarkTrade):
         self._trade_offset_ms = trade_offset_ms
         self._date_columns = date_columns
 
-    def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, trade_offset_ms=None, date_columns=None):
+    def calculate_benchmark(self, trade_order_df=None, market_df=None, trade_order_name=None, trade_offset_ms=None,
+                            date_columns=None, market_context=None):
 
         if trade_offset_ms is None: trade_offset_ms = self._trade_offset_ms
         if date_columns is None: date_columns = self._date_columns
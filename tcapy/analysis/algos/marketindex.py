@@ -0,0 +1,586 @@
+from __future__ import print_function, division
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+import numpy as np
+import pandas as pd
+
+from tcapy.conf.constants import Constants
+from tcapy.util.customexceptions import *
+from tcapy.util.loggermanager import LoggerManager
+from tcapy.util.mediator import Mediator
+
+constants = Constants()
+
+########################################################################################################################
+
+class WeightedPriceIndex(object):
+    """Precomputes the cumulative sums of price x weight and of the weights for a column of market data, so that the
+    weighted average price over any window of ticks can be found in O(1), rather than having to average over every tick
+    in that window. It is used by BenchmarkWeighted (and hence BenchmarkVWAP and BenchmarkTWAP) to compute benchmarks for
+    many trades/orders at once, using the start/end indices found by searching the market data.
+
+    """
+
+    def __init__(self, price, weights=None):
+        """Builds the cumulative sums for a particular market data field and its weights.
+
+        Parameters
+        ----------
+        price : np.ndarray
+            Prices to be averaged (eg. the mid from market data)
+
+        weights : np.ndarray (default: None)
+            Weighting of each price (eg. volume for VWAP or time since the last tick for TWAP). If None, every price will
+            be equally weighted
+        """
+        price = np.asarray(price, dtype=np.float64)
+
+        if weights is None:
+            weights = np.ones(len(price))
+
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), price.shape)
+
+        is_finite = np.isfinite(price) & np.isfinite(weights)
+
+        # Accumulate prices relative to a reference level, so the running sums stay small and we don't lose precision when
+        # differencing them over long periods of tick data
+        self._reference_price = price[is_finite][0] if is_finite.any() else 0.0
+
+        self._price = price
+        self._cum_price_weight = self._cumsum_with_zero(np.where(is_finite, (price - self._reference_price) * weights, 0.0))
+        self._cum_weight = self._cumsum_with_zero(np.where(is_finite, weights, 0.0))
+
+        # Keep a count of any missing points, so windows which contain them will return NaN (like np.average)
+        self._cum_nan = self._cumsum_with_zero(~is_finite)
+
+    def _cumsum_with_zero(self, array):
+        cum = np.zeros(len(array) + 1, dtype=np.float64 if array.dtype != bool else np.int64)
+        np.cumsum(array, out=cum[1:])
+
+        return cum
+
+    def __len__(self):
+        return len(self._price)
+
+    def weighted_average(self, start, end):
+        """Calculates the weighted average price for each window of ticks [start, end). Where the start and end of a
+        window are the same (eg. for a trade, rather than an order), the price at that point is returned.
+
+        Parameters
+        ----------
+        start : np.ndarray (int)
+            Index of first tick in each window
+
+        end : np.ndarray (int)
+            Index after the last tick in each window
+
+        Returns
+        -------
+        np.ndarray
+        """
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+
+        weight_sum = self._cum_weight[end] - self._cum_weight[start]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = self._reference_price + \
+                      (self._cum_price_weight[end] - self._cum_price_weight[start]) / weight_sum
+
+        average[weight_sum == 0] = np.nan
+        average[(self._cum_nan[end] - self._cum_nan[start]) > 0] = np.nan
+
+        # For windows without any length, just take the price at that point
+        is_point = start == end
+        average[is_point] = self._price[start[is_point]]
+
+        return average
+
+########################################################################################################################
+
+class RangeMinMaxIndex(object):
+    """Answers the minimum/maximum price over any window of ticks, for many windows at once. Underneath, it splits the
+    prices into fixed size blocks, storing the running min/max within each block, together with a sparse table over the
+    min/max of each block. Windows which span several blocks can then be answered in O(1), whilst keeping memory close
+    to O(n) (a sparse table over every tick would need O(n log n) memory, which is too large for months of tick data).
+
+    Windows which lie within a single block are computed directly (they are at most one block in length). The sparse
+    tables are only built on first use, so asking only for the minimum won't build the maximum table.
+
+    """
+
+    def __init__(self, price, block_size=constants.range_index_block_size):
+        self._price = np.asarray(price, dtype=np.float64)
+        self._block_size = block_size
+
+        # Add a sentinel point at the end, so windows finishing on the last tick can be reduced directly (reduceat always
+        # reduces up to the next index)
+        self._price_with_sentinel = np.append(self._price, np.nan)
+
+        self._tables = {}
+
+    def __len__(self):
+        return len(self._price)
+
+    def min(self, start, end):
+        """Calculates the minimum price for each window of ticks [start, end)
+
+        Parameters
+        ----------
+        start : np.ndarray (int)
+            Index of first tick in each window
+
+        end : np.ndarray (int)
+            Index after the last tick in each window
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return self._query(np.minimum, start, end)
+
+    def max(self, start, end):
+        """Calculates the maximum price for each window of ticks [start, end)
+
+        Parameters
+        ----------
+        start : np.ndarray (int)
+            Index of first tick in each window
+
+        end : np.ndarray (int)
+            Index after the last tick in each window
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return self._query(np.maximum, start, end)
+
+    def _build(self, ufunc):
+        if ufunc.__name__ in self._tables:
+            return self._tables[ufunc.__name__]
+
+        block_size = self._block_size
+        no_of_blocks = max(1, int(np.ceil(len(self._price) / block_size)))
+
+        # Pad the final block with the identity of the operation (NaNs are left in place, so they propagate like np.min)
+        padding = np.inf if ufunc is np.minimum else -np.inf
+
+        blocks = np.full(no_of_blocks * block_size, padding)
+        blocks[0:len(self._price)] = self._price
+        blocks = blocks.reshape(no_of_blocks, block_size)
+
+        prefix = ufunc.accumulate(blocks, axis=1)
+        suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+
+        # Sparse table over the blocks: level j stores the result over 2^j consecutive blocks
+        sparse_table = [prefix[:, -1]]
+
+        j = 1
+
+        while (1 << j) <= no_of_blocks:
+            previous = sparse_table[-1]
+            half = 1 << (j - 1)
+
+            sparse_table.append(ufunc(previous[:-half], previous[half:]))
+
+            j = j + 1
+
+        self._tables[ufunc.__name__] = (prefix.ravel(), suffix.ravel(), sparse_table)
+
+        return self._tables[ufunc.__name__]
+
+    def _query(self, ufunc, start, end):
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+
+        prefix, suffix, sparse_table = self._build(ufunc)
+
+        result = np.empty(len(start), dtype=np.float64)
+
+        # Use inclusive finish point, and treat windows without any length as the single point at the start
+        finish = np.maximum(end - 1, start)
+
+        start_block = start // self._block_size
+        finish_block = finish // self._block_size
+
+        # Windows within a single block are short, so just reduce directly over the underlying prices
+        is_same_block = start_block == finish_block
+
+        if is_same_block.any():
+            bounds = np.empty(2 * is_same_block.sum(), dtype=np.int64)
+            bounds[0::2] = start[is_same_block]
+            bounds[1::2] = finish[is_same_block] + 1
+
+            result[is_same_block] = ufunc.reduceat(self._price_with_sentinel, bounds)[0::2]
+
+        # Otherwise combine the partial blocks at either end, with the complete blocks in between
+        is_multi_block = ~is_same_block
+
+        if is_multi_block.any():
+            s = start[is_multi_block]; f = finish[is_multi_block]
+            sb = start_block[is_multi_block]; fb = finish_block[is_multi_block]
+
+            multi = ufunc(suffix[s], prefix[f])
+
+            no_of_inner_blocks = fb - sb - 1
+            has_inner = no_of_inner_blocks > 0
+
+            level = np.zeros(len(s), dtype=np.int64)
+            level[has_inner] = np.floor(np.log2(no_of_inner_blocks[has_inner])).astype(np.int64)
+
+            for j in np.unique(level[has_inner]):
+                is_level = has_inner & (level == j)
+
+                inner = ufunc(sparse_table[j][sb[is_level] + 1], sparse_table[j][fb[is_level] - (1 << j)])
+
+                multi[is_level] = ufunc(multi[is_level], inner)
+
+            result[is_multi_block] = multi
+
+        return result
+
+########################################################################################################################
+
+class RangeMedianIndex(object):
+    """Answers the median price over any window of ticks, for many windows at once, using a wavelet matrix. Prices are
+    replaced by their rank amongst all the distinct prices, and for each bit of those ranks (from the most significant
+    bit), we store the prefix counts of zero bits, after stably sorting by the higher bits. The k-th smallest price in
+    any window can then be found with one step per bit, which is vectorised across all the windows.
+
+    Tick prices typically have relatively few distinct values, so the number of bits (and hence memory) remains small.
+
+    """
+
+    def __init__(self, price):
+        self._price = np.asarray(price, dtype=np.float64)
+
+        # Keep track of missing points, so windows which contain them will return NaN (like np.median)
+        is_nan = np.isnan(self._price)
+
+        self._cum_nan = np.zeros(len(self._price) + 1, dtype=np.int64)
+        np.cumsum(is_nan, out=self._cum_nan[1:])
+
+        self._distinct_price, rank = np.unique(np.where(is_nan, -np.inf, self._price), return_inverse=True)
+
+        rank = rank.astype(np.int64)
+
+        self._bits = max(1, int(np.ceil(np.log2(max(len(self._distinct_price), 2)))))
+
+        # Prefix counts are stored for every tick and bit, so keep them as small as possible
+        count_dtype = np.int32 if len(rank) < np.iinfo(np.int32).max else np.int64
+
+        self._zero_count = []
+        self._no_of_zeros = []
+
+        for bit in range(self._bits - 1, -1, -1):
+            is_one = ((rank >> bit) & 1).astype(bool)
+
+            zero_count = np.zeros(len(rank) + 1, dtype=count_dtype)
+            np.cumsum(~is_one, out=zero_count[1:])
+
+            self._zero_count.append(zero_count)
+            self._no_of_zeros.append(zero_count[-1])
+
+            # Stable partition, with the zeros first
+            rank = np.concatenate((rank[~is_one], rank[is_one]))
+
+    def __len__(self):
+        return len(self._price)
+
+    def kth_smallest(self, start, end, k):
+        """Finds the k-th smallest price (0 based) in each window of ticks [start, end)
+
+        Parameters
+        ----------
+        start : np.ndarray (int)
+            Index of first tick in each window
+
+        end : np.ndarray (int)
+            Index after the last tick in each window
+
+        k : np.ndarray (int)
+            Which order statistic to find in each window, must be smaller than the window length
+
+        Returns
+        -------
+        np.ndarray
+        """
+        l = np.array(start, dtype=np.int64)
+        r = np.array(end, dtype=np.int64)
+        k = np.array(k, dtype=np.int64)
+
+        rank = np.zeros(len(l), dtype=np.int64)
+
+        for level in range(0, self._bits):
+            zero_count = self._zero_count[level]
+
+            zeros_l = zero_count[l]
+            zeros_r = zero_count[r]
+            zeros_in_window = zeros_r - zeros_l
+
+            is_one = k >= zeros_in_window
+
+            k = np.where(is_one, k - zeros_in_window, k)
+            l = np.where(is_one, self._no_of_zeros[level] + l - zeros_l, zeros_l)
+            r = np.where(is_one, self._no_of_zeros[level] + r - zeros_r, zeros_r)
+
+            rank = (rank << 1) | is_one
+
+        return self._distinct_price[rank]
+
+    def median(self, start, end):
+        """Calculates the median price in each window of ticks [start, end). Where the start and end of a window are the
+        same, the price at that point is returned.
+
+        Parameters
+        ----------
+        start : np.ndarray (int)
+            Index of first tick in each window
+
+        end : np.ndarray (int)
+            Index after the last tick in each window
+
+        Returns
+        -------
+        np.ndarray
+        """
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+
+        # Treat windows without any length as the single point at the start
+        end = np.maximum(end, start + 1)
+
+        length = end - start
+
+        # For windows with an even number of points take the average of the middle two (like np.median)
+        median = (self.kth_smallest(start, end, (length - 1) // 2) + self.kth_smallest(start, end, length // 2)) / 2.0
+
+        median[(self._cum_nan[end] - self._cum_nan[start]) > 0] = np.nan
+
+        return median
+
+########################################################################################################################
+
+class MarketContext(object):
+    """Holds the numpy representation of the market data for a single ticker, so that it can be shared by every
+    benchmark and metric in a TCA calculation, rather than each of them separately converting the market data and
+    searching it for the same trade/order times. It caches
+
+    - the int64 timestamps of the market data
+    - numpy arrays for market data fields (eg. bid/ask/mid)
+    - positions of trade/order times in the market data (eg. the arrival and slippage benchmarks both look up the same
+    trade times)
+    - range indices for benchmarks (eg. cumulative sums for VWAP), which are built once across trades and orders
+
+    It is created once per ticker in TCATickerLoader.calculate_metrics_single_ticker. If a benchmark/metric is called
+    without a MarketContext, it will create a temporary one.
+
+    """
+
+    def __init__(self, market_df):
+        self._market_df = market_df
+        self._time_series_ops = Mediator.get_time_series_ops()
+
+        self._index_int64 = market_df.index.asi8
+
+        self._fields = {}
+        self._positions = {}
+        self._price_indices = {}
+
+    def is_market_data(self, market_df):
+        """Checks whether this MarketContext represents a particular market data DataFrame
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            Market data
+
+        Returns
+        -------
+        bool
+        """
+        return market_df is self._market_df
+
+    def get_market_df(self):
+        return self._market_df
+
+    def get_index_int64(self):
+        return self._index_int64
+
+    def __len__(self):
+        return len(self._index_int64)
+
+    def get_field(self, field):
+        """Gets a market data field as a float64 numpy array (only converted the first time it is requested)
+
+        Parameters
+        ----------
+        field : str
+            Market data field (eg. 'mid')
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if field not in self._fields:
+            self._fields[field] = self._market_df[field].values.astype(np.float64)
+
+        return self._fields[field]
+
+    def _convert_to_int64(self, dt, timedelta_amount=None):
+        if not(hasattr(dt, 'asi8')):
+            dt = pd.DatetimeIndex(dt)
+
+        dt_int64 = dt.asi8
+
+        if timedelta_amount is not None:
+            dt_int64 = dt_int64 + pd.Timedelta(timedelta_amount).value
+
+        return dt_int64
+
+    def search_int64(self, dt_int64, just_before_point=True):
+        """Finds the positions of the nearest points in the market data for int64 nanosecond timestamps (see
+        TimeSeriesOps.search_int64_index), which can be of any shape (eg. trades x markout windows).
+
+        Parameters
+        ----------
+        dt_int64 : np.ndarray (int64)
+            Timestamps to be looked up
+
+        just_before_point : bool (default: True)
+            Should we fetch the point just before (in the case of not matching), otherwise the point just after
+
+        Returns
+        -------
+        np.ndarray (int)
+        """
+        return self._search(np.asarray(dt_int64, dtype=np.int64), just_before_point)
+
+    def _search(self, dt_int64, just_before_point):
+        # Key by the contents of the times, so we only search again when we get different times
+        key = (just_before_point, dt_int64.shape, hash(dt_int64.tobytes()))
+
+        if key in self._positions:
+            cached_dt_int64, positions = self._positions[key]
+
+            if np.array_equal(cached_dt_int64, dt_int64):
+                return positions
+
+        if just_before_point is None:
+            positions = np.searchsorted(self._index_int64, dt_int64)
+        else:
+            positions = self._time_series_ops.search_int64_index(self._index_int64, dt_int64,
+                                                                 just_before_point=just_before_point)
+
+        self._positions[key] = (dt_int64, positions)
+
+        return positions
+
+    def search_sorted(self, dt):
+        """Finds the positions where times would be inserted into the market data (like DatetimeIndex.searchsorted),
+        for example to find the start/end of orders
+
+        Parameters
+        ----------
+        dt : DatetimeIndex
+            Times to search for
+
+        Returns
+        -------
+        np.ndarray (int)
+        """
+        return self._search(self._convert_to_int64(dt), None)
+
+    def search_series(self, dt, timedelta_amount=None, just_before_point=True):
+        """Finds the positions of the nearest points in the market data for times (like TimeSeriesOps.search_series)
+
+        Parameters
+        ----------
+        dt : DatetimeIndex
+            Times to search for (eg. from trade data)
+
+        timedelta_amount : TimeDelta (default: None)
+            How much we wish to perturb our search times
+
+        just_before_point : bool (default: True)
+            Should we fetch the point just before (in the case of not matching), otherwise the point just after
+
+        Returns
+        -------
+        np.ndarray (int)
+        """
+        return self._search(self._convert_to_int64(dt, timedelta_amount=timedelta_amount), just_before_point)
+
+    def vlookup(self, dt, field, timedelta_amount=None, just_before_point=True, mask=None):
+        """Does a VLOOKUP style search in the market data (like TimeSeriesOps.vlookup_style_data_frame) for a set of
+        times. The search is done on all the times (and cached), before applying the mask, so that different subsets
+        of the same trades (eg. buys and sells) share the same search.
+
+        Parameters
+        ----------
+        dt : DatetimeIndex
+            Times to be looked up (eg. from trade data)
+
+        field : str
+            Market data field to output
+
+        timedelta_amount : TimeDelta (default: None)
+            How much we wish to perturb our search times
+
+        just_before_point : bool (default: True)
+            Should we fetch the point just before (in the case of not matching), otherwise the point just after
+
+        mask : np.ndarray (bool)
+            Only output these times (eg. only buy trades)
+
+        Returns
+        -------
+        np.ndarray, np.ndarray (datetime64[ns])
+        """
+        positions = self.search_series(dt, timedelta_amount=timedelta_amount, just_before_point=just_before_point)
+        dt_int64 = self._convert_to_int64(dt)
+
+        if mask is not None:
+            positions = positions[mask]
+            dt_int64 = dt_int64[mask]
+
+        # Check that our input times are within the bounds of our market data
+        if len(dt_int64) > 0:
+            if dt_int64[0] <= self._index_int64[0] or dt_int64[-1] >= self._index_int64[-1]:
+                err_msg = "Lookup data (eg. trade) does not fully overlap with the main search space of data (eg. market)"
+
+                LoggerManager.getLogger(__name__).error(err_msg)
+
+                raise ValidationException(err_msg)
+
+        # Return our VLOOKUPed values and alongside it, the time stamps of those observations
+        return self.get_field(field)[positions], self._index_int64[positions].view('datetime64[ns]')
+
+    def get_price_index(self, key, create_price_index):
+        """Gets a range index (eg. WeightedPriceIndex) for the market data, creating it only the first time it is
+        requested
+
+        Parameters
+        ----------
+        key : tuple
+            Identifies the type of index and the fields it was created from
+
+        create_price_index : function
+            Creates the range index if it doesn't already exist
+
+        Returns
+        -------
+        WeightedPriceIndex, RangeMinMaxIndex or RangeMedianIndex
+        """
+        if key not in self._price_indices:
+            self._price_indices[key] = create_price_index()
+
+        return self._price_indices[key]
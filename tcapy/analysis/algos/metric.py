@@ -17,6 +17,8 @@ import pandas as pd
 from tcapy.util.mediator import Mediator
 from tcapy.conf.constants import Constants
 
+from tcapy.analysis.algos.marketindex import MarketContext
+
 from tcapy.util.loggermanager import LoggerManager
 
 # Compatible with Python 2 *and* 3:
@@ -50,9 +52,30 @@ class Metric(ABC):
         self._trade_order_list = trade_order_list
 
     @abc.abstractmethod
-    def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None):
+    def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None, market_context=None):
         pass
 
+    def _get_market_context(self, market_df, market_context=None):
+        """Gets the MarketContext for the market data, which is shared between benchmarks/metrics for the same ticker.
+        If one hasn't been supplied (or it's for different market data), a temporary one is created.
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            Market data
+
+        market_context : MarketContext
+            Shared MarketContext created by the caller
+
+        Returns
+        -------
+        MarketContext
+        """
+        if market_context is not None and market_context.is_market_data(market_df):
+            return market_context
+
+        return MarketContext(market_df)
+
     def _get_benchmark_field(self, market_df, benchmark):
 
         if benchmark in market_df.columns:
@@ -76,6 +99,26 @@ class Metric(ABC):
     def get_metric_name(self):
         return self._metric_name
 
+    def get_output_fields(self):
+        """Gets the fields this metric adds to the trade/order data, which is used by CalcPlanner to work out if it
+        needs to be calculated. None implies it should always be calculated.
+
+        Returns
+        -------
+        str (list)
+        """
+        return None
+
+    def get_required_fields(self):
+        """Gets the trade/order fields this metric needs, which might be calculated by benchmarks (eg. 'arrival' for
+        implementation shortfall)
+
+        Returns
+        -------
+        str (list)
+        """
+        return []
+
     def _combine_metric_trade(self, metric_df, trade_df, join_on='id'):
         """ Converts metrics into Joins together metric and trade dataframes, and assigns them to field variables, before returning
 
@@ -104,18 +147,20 @@ class Metric(ABC):
 
         return metric_trade_df, metric_df
 
-    def _get_benchmark_time_points(self, trade_df, market_df, metric_df, is_side, benchmark_label, output_label,
+    def _get_benchmark_time_points(self, trade_df, market_context, metric_df, is_side, benchmark_label, output_label,
                                    timedelta_amount=None, just_before_point=False):
         """Gets all the trade times and searches market data for those points, and returns the nearest market data to
-        those points. Analogous to doing a VLOOKUP on market data, using trade data as an input.
+        those points. Analogous to doing a VLOOKUP on market data, using trade data as an input. The search is done
+        for all the trades at once (and cached in the MarketContext), so it is shared between buys and sells, and
+        other benchmarks/metrics searching for the same points (eg. arrival price and slippage).
 
         Parameters
         ----------
         trade_df : DataFrame
             Contains all the trade executions
 
-        market_df : DataFrame
-             Market data
+        market_context : MarketContext
+             Market data (and cached searches of it)
 
         metric_df : DataFrame
             To be filled with benchmark time points
@@ -140,7 +185,7 @@ class Metric(ABC):
         DataFrame with market prices corresponding to trades times
         """
 
-        side_dt = trade_df.index[is_side]
+        is_side = np.asarray(is_side)
 
         if (isinstance(benchmark_label, str)): benchmark_label = [benchmark_label]
         if (isinstance(output_label, str)): output_label = [output_label]
@@ -152,25 +197,23 @@ class Metric(ABC):
             dt = None
 
             # First check if the benchmark label is in the market data (eg. for bid/mid/ask), in which grab from there
-            if benchmark_label_ in market_df.columns:
+            if benchmark_label_ in market_context.get_market_df().columns:
 
-                benchmark, dt = self._time_series_ops.vlookup_style_data_frame(side_dt, market_df, benchmark_label_,
-                                                                              timedelta_amount=timedelta_amount,
-                                                                              just_before_point=just_before_point)
+                benchmark, dt = market_context.vlookup(trade_df.index, benchmark_label_,
+                                                       timedelta_amount=timedelta_amount,
+                                                       just_before_point=just_before_point, mask=is_side)
 
             # Otherwise it could be a column in the trade data (eg. VWAP, TWAP etc. which need to calculated for each
             # trade individually beforehand)
             else:
-                benchmark = trade_df[benchmark_label_]
+                benchmark = trade_df[benchmark_label_].values[is_side]
 
-            # metric_df.loc[output_label_, is_side] = benchmark
-            metric_df[output_label_][is_side] = benchmark
+            metric_df.loc[is_side, output_label_] = benchmark
 
             # mark time of "benchmark" (for slippage and market impact points)
             if output_label_ + '_time' in metric_df.columns:
                 if dt is not None:
-                    dt = pd.to_datetime(dt).astype('datetime64[ns]')
-                    metric_df[output_label_ + '_time'][is_side] = pd.Series(index=benchmark.index, data=dt)
+                    metric_df.loc[is_side, output_label_ + '_time'] = dt
 
                 #metric_df[output_label + '_time'] = metric_df[
                  #   output_label + '_time']
@@ -212,9 +255,16 @@ class MetricSlippage(MetricCalc):
 
         self._metric_name = 'slippage' + metric_post_fix
 
+    def get_output_fields(self):
+        return [self._metric_name, self._metric_name + '_benchmark', self._metric_name + '_benchmark_time',
+                self._metric_name + '_anomalous', 'spread_to_benchmark']
+
+    def get_required_fields(self):
+        return [self._bid_benchmark, self._ask_benchmark]
+
     def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None, executed_price=None,
                          mid_benchmark=None, bid_benchmark=None, ask_benchmark=None, bid_mid_spread=None,
-                         ask_mid_spread=None):
+                         ask_mid_spread=None, market_context=None):
         """Calculates the difference between the execution and the benchmark as a percentage, so that it is comparable
         across many assets. Also records the market prices used in the slippage calculation. We calculate slippage such
         that a positive number implies we have made money on a trade, whilst a negative number always implies a cost to
@@ -240,6 +290,9 @@ class MetricSlippage(MetricCalc):
         ask_mid_spread : str
             Field which contains the spread between the mid and ask (where negative implied ask is above the mid)
 
+        market_context : MarketContext
+            Shared searches of the market data (eg. with the arrival benchmark)
+
         Returns
         -------
         DataFrame with slippage _calculations
@@ -286,10 +339,12 @@ class MetricSlippage(MetricCalc):
 
                 metric_df['spread_to_benchmark'] = np.nan
 
-        metric_df = self._get_benchmark_time_points(trade_order_df, market_df, metric_df, is_sell, bid_benchmark_list,
+        market_context = self._get_market_context(market_df, market_context=market_context)
+
+        metric_df = self._get_benchmark_time_points(trade_order_df, market_context, metric_df, is_sell, bid_benchmark_list,
                                                     metric_list, just_before_point=True)
 
-        metric_df = self._get_benchmark_time_points(trade_order_df, market_df, metric_df, is_buy, ask_benchmark_list,
+        metric_df = self._get_benchmark_time_points(trade_order_df, market_context, metric_df, is_buy, ask_benchmark_list,
                                                     metric_list, just_before_point=True)
 
         # Make sign consistent for buys and sells for slippage (or negative is always a cost for the client)
@@ -349,8 +404,14 @@ class MetricMarketImpact(MetricCalc):
         self._ask_benchmark = ask_benchmark
         self._market_impact_multiplier = market_impact_multipler
 
+    def get_output_fields(self):
+        return [self._metric_name, self._metric_name + '_benchmark', self._metric_name + '_benchmark_time']
+
+    def get_required_fields(self):
+        return [self._bid_benchmark, self._ask_benchmark]
+
     def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None, executed_price=None,
-                         bid_benchmark=None, ask_benchmark=None, market_impact_multiplier=None):
+                         bid_benchmark=None, ask_benchmark=None, market_impact_multiplier=None, market_context=None):
         if not (self._check_calculate_metric(trade_order_name)): return trade_order_df, None
 
         if executed_price is None: executed_price = self._executed_price
@@ -363,11 +424,8 @@ class MetricMarketImpact(MetricCalc):
         bid_benchmark = self._get_benchmark_field(market_df, bid_benchmark)
         ask_benchmark = self._get_benchmark_field(market_df, ask_benchmark)
 
-        # strip down market data as much as possible (this is a massive dataset) to only the benchmark fields
-        if bid_benchmark == ask_benchmark:
-            market_df = pd.DataFrame(market_df[[bid_benchmark]])
-        else:
-            market_df = pd.DataFrame(market_df[[bid_benchmark, ask_benchmark]])
+        # Only the benchmark fields are extracted from the (massive) market data, and cached for other metrics
+        market_context = self._get_market_context(market_df, market_context=market_context)
 
         is_sell = trade_order_df['side'] == -1
         is_buy = trade_order_df['side'] == 1
@@ -383,11 +441,11 @@ class MetricMarketImpact(MetricCalc):
 
         # Market impact (sell then buy trades)
         time_delta = self._time_series_ops.get_time_delta(self._market_impact_gap)
-        metric_df = self._get_benchmark_time_points(trade_order_df, market_df, metric_df, is_sell, bid_benchmark,
+        metric_df = self._get_benchmark_time_points(trade_order_df, market_context, metric_df, is_sell, bid_benchmark,
                                                     self._metric_name + '_benchmark', timedelta_amount=time_delta,
                                                     just_before_point=False)
 
-        metric_df = self._get_benchmark_time_points(trade_order_df, market_df, metric_df, is_buy, ask_benchmark,
+        metric_df = self._get_benchmark_time_points(trade_order_df, market_context, metric_df, is_buy, ask_benchmark,
                                                     self._metric_name + '_benchmark', timedelta_amount=time_delta,
                                                     just_before_point=False)
 
@@ -532,11 +590,22 @@ class MetricExecutedPriceNotional(MetricCalc):
                                                                       executed_notional, aggregated_ids,
                                                                       unweighted_data_col=aggregated_notional_fields)
 
-        # join the upper order with the derived fields for trade price, notional etc.
-        metric_upper_order_df = upper_trade_order_df.join(metric_df, on=upper_id)
+        # join the upper order with the derived fields for trade price, notional etc. by looking up the position of each
+        # upper order ID in the aggregated IDs (-1 where an upper order has no lower orders)
+        metric_upper_order_df = upper_trade_order_df.copy()
+
+        ix = metric_df.index.get_indexer(upper_trade_order_df[upper_id].values)
+        has_lower = ix >= 0
+
+        for col in metric_df.columns:
+            values = np.empty(len(ix)); values.fill(np.nan)
+            values[has_lower] = metric_df[col].values[ix[has_lower]]
+
+            # for lower orders which are fully cancelled their executed notional won't exist (IE. will be zero!)
+            if col == executed_notional:
+                values[np.isnan(values)] = 0
 
-        # for lower orders which are fully cancelled their executed notional won't exist (IE. will be zero!)
-        metric_upper_order_df[executed_notional].fillna(0, inplace=True)
+            metric_upper_order_df[col] = values
 
         # cancelled notional can be inferred from notional - executed notional
         if notional in metric_upper_order_df.columns:
@@ -578,12 +647,10 @@ class MetricDisplay(Metric):
 
     def _mult_metric_table_by_side(self, trade_order_df, metric_df):
 
-        # duplicate side column for every column of metric to be multiplied
-        side_multiplier = np.repeat(trade_order_df['side'].values[np.newaxis, :], len(metric_df.columns), 0).transpose()
-
-        # multiply every column by the trade/order side
+        # multiply every column by the trade/order side (broadcasting the side across every column)
         metric_df = pd.DataFrame(index=metric_df.index, columns=metric_df.columns,
-                                     data=constants.market_impact_multiplier * metric_df * side_multiplier)
+                                 data=constants.market_impact_multiplier * metric_df.values *
+                                      trade_order_df['side'].values[:, np.newaxis])
 
         return metric_df
 
@@ -629,14 +696,19 @@ class MetricMarkout(MetricDisplay):
 
         self._metric_name = None
 
+    def get_output_fields(self):
+        return ['markout'] + ['markout_' + x for x in self._str_windows]
+
     def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None,
-                         bid_benchmark=None, ask_benchmark=None):
+                         bid_benchmark=None, ask_benchmark=None, market_context=None):
         if not (self._check_calculate_metric(trade_order_name)): return trade_order_df, None
 
         if bid_benchmark is None: bid_benchmark = self._bid_benchmark
         if ask_benchmark is None: ask_benchmark = self._ask_benchmark
 
-        metric_df = self._calculate_markout(trade_order_df, market_df,
+        market_context = self._get_market_context(market_df, market_context=market_context)
+
+        metric_df = self._calculate_markout(trade_order_df, market_context,
                                             bid_benchmark=bid_benchmark, ask_benchmark=ask_benchmark)
 
         metric_df.columns = ['markout_' + x for x in metric_df.columns]
@@ -651,78 +723,86 @@ class MetricMarkout(MetricDisplay):
 
         return metric_trade_df, metric_df
 
-    def _calculate_markout(self, trade_order_df, market_df, bid_benchmark=None, ask_benchmark=None):
+    def _calculate_markout(self, trade_order_df, market_context, bid_benchmark=None, ask_benchmark=None):
 
-        metric_df = pd.DataFrame(index=trade_order_df.index, columns=self._str_windows)
+        # Get the market prices at every markout window for every trade (buys at the ask and sells at the bid), alongside
+        # the price at the trade time (ie. the 0 point)
+        price, zero_price = self._fill_markout_window_with_prices(trade_order_df, market_context,
+                                                                  bid_benchmark=bid_benchmark, ask_benchmark=ask_benchmark)
 
-        # fill markout window with market prices for all "buy" side trades
-        metric_df = self._fill_markout_window_with_prices(trade_order_df, market_df, metric_df, 1, ask_benchmark)
+        # Now calculate the returns for each window, against the 0 point (ie. this will be cumulative returns)
+        markout = (price / zero_price[:, np.newaxis]) - 1.0
 
-        # fill markout window with market prices for all "sell" side trades
-        metric_df = self._fill_markout_window_with_prices(trade_order_df, market_df, metric_df, -1, bid_benchmark)
+        # Fill the 0ms/s time with 0 (by definition returns will be 0 here!)
+        markout[:, np.asarray(self._markout_windows) == 0] = 0.0
 
-        # now calculate the returns for each window, against the 0 point (ie. this will be cumulative returns)
-        zero_mark_str = '0' + self._markout_unit_of_measure
+        return pd.DataFrame(index=trade_order_df.index, columns=self._str_windows, data=markout)
 
-        for window in self._markout_windows:
+    def _fill_markout_window_with_prices(self, trade_order_df, market_context, bid_benchmark=None, ask_benchmark=None):
+        """Finds the market prices for every trade at each markout window. Rather than searching the market data
+        separately for each window and side, we create a matrix of (trades x windows) target times, which is resolved
+        with a single binary search of the market data timestamps.
 
-            # ignore window at 0 (by definition returns will be 0 here!)
-            if window != 0:
-                window_str = str(window) + self._markout_unit_of_measure
+        Parameters
+        ----------
+        trade_order_df : DataFrame
+            Trades/orders
 
-                metric_df[window_str] = (metric_df[window_str] / metric_df[zero_mark_str]) - 1.0
-                metric_df[window_str] = metric_df[window_str].astype(float)
+        market_context : MarketContext
+            Market data (and cached searches of it)
 
-        # fill the 0ms/s time with 0
-        metric_df.loc[:, zero_mark_str] = 0.0
+        bid_benchmark : str
+            Field for the bid quotes (for sell trades)
 
-        return metric_df
+        ask_benchmark : str
+            Field for the ask quotes (for buy trades)
+
+        Returns
+        -------
+        np.ndarray (trades x windows), np.ndarray (trades)
+        """
+        bid_benchmark = self._get_benchmark_field(market_context.get_market_df(), bid_benchmark)
+        ask_benchmark = self._get_benchmark_field(market_context.get_market_df(), ask_benchmark)
 
-    def _fill_markout_window_with_prices(self, trade_order_df, market_df, metric_df, side, benchmark):
-        benchmark = self._get_benchmark_field(market_df, benchmark)
+        # Shift the trade times by each markout window (with the extra first column for the trade time itself)
+        window_offsets = np.append(0, self._get_markout_window_offsets())
 
-        # create columns for the markout window
-        for window in self._markout_windows:
-            is_side = trade_order_df['side'] == side
+        target_time = trade_order_df.index.asi8[:, np.newaxis] + window_offsets[np.newaxis, :]
 
-            sided_trades = trade_order_df[is_side].index
+        # Find all the indices in the market data that corresponds to (approximately) the time we want (should get the
+        # very next tick)
+        ix_price = market_context.search_int64(target_time, just_before_point=False)
 
-            # sometimes we might not have any specific sided trades in a series, so must check!
-            if len(sided_trades) > 0:
-                # shift the time by x milliseconds
-                if self._markout_unit_of_measure == 'ms':
-                    time_move = timedelta(microseconds=window * 1000)
-                elif self._markout_unit_of_measure == 's':
-                    time_move = timedelta(seconds=window)
-                elif self._markout_unit_of_measure == 'm':
-                    time_move = timedelta(minutes=window)
+        side = trade_order_df['side'].values[:, np.newaxis]
 
-                # time_shifted = sided_trades + time_move
+        bid_price = market_context.get_field(bid_benchmark)
+        ask_price = market_context.get_field(ask_benchmark)
 
-                # find all the indices in the market data that corresponds to (approximately) the time we want (should get the
-                # very next tick
+        price = np.full(target_time.shape, np.nan, dtype=np.float64)
 
-                # super slow implementation.. given massive loop
-                # ix_price_1 = [market_df.index.get_loc(x, method='nearest') for x in time_shifted]
+        is_buy = np.broadcast_to(side == 1, target_time.shape)
+        is_sell = np.broadcast_to(side == -1, target_time.shape)
 
-                # much faster vectorised version (we need to offset by + 1, such we get the NEXT tick after the point we want
-                ix_price = self._time_series_ops.search_series(market_df, sided_trades, timedelta_amount=time_move,
-                                                               just_before_point=False)
+        price[is_buy] = ask_price[ix_price[is_buy]]
+        price[is_sell] = bid_price[ix_price[is_sell]]
 
-                # ix_price = market_df.index.searchsorted(time_shifted) + 1
+        return price[:, 1:], price[:, 0]
 
-                # on the very rare occasion that we are right at the end of the series, adjust those to the last ones (otherwise
-                # will get array out of bounds exception!)
-                # TODO
-                # if ix_price[-1] > len(market_df.index): ix_price[-1] = ix_price[-1] - 1
-                # ix_price[ix_price > len(market_df.index)] = len(market_df.index) - 1
+    def _get_markout_window_offsets(self):
+        """Converts the markout windows into offsets in nanoseconds
 
-                # Now fill the column with the market price at the shifted time
-                # metric_df.ix[is_side, str(window) + self._markout_unit_of_measure] = market_df.ix[
-                #     ix_price, benchmark].values.T
-                metric_df[str(window) + self._markout_unit_of_measure][is_side] = market_df[benchmark][ix_price].values.T
+        Returns
+        -------
+        np.ndarray (int64)
+        """
+        if self._markout_unit_of_measure == 'ms':
+            time_move = timedelta(milliseconds=1)
+        elif self._markout_unit_of_measure == 's':
+            time_move = timedelta(seconds=1)
+        elif self._markout_unit_of_measure == 'm':
+            time_move = timedelta(minutes=1)
 
-        return metric_df
+        return np.round(np.asarray(self._markout_windows, dtype=np.float64) * pd.Timedelta(time_move).value).astype(np.int64)
 
 ########################################################################################################################
 
@@ -777,8 +857,11 @@ class MetricWideBenchmarkMarkout(MetricMarkout):
 
         self._metric_name = None
 
+    def get_output_fields(self):
+        return list(self._str_windows)
+
     def calculate_metric(self, trade_order_df=None, market_df=None, trade_order_name=None, bid_benchmark=None,
-                         ask_benchmark=None, wide_benchmark=None):
+                         ask_benchmark=None, wide_benchmark=None, market_context=None):
         if not (self._check_calculate_metric(trade_order_name)): return trade_order_df, None
 
         # if parameters have not been set, take whatever has been set in the field variables
@@ -786,7 +869,9 @@ class MetricWideBenchmarkMarkout(MetricMarkout):
         if ask_benchmark is None: ask_benchmark = self._ask_benchmark
         if wide_benchmark is None: wide_benchmark = self._wide_benchmark
 
-        metric_df = self._calculate_markout(trade_order_df, market_df,
+        market_context = self._get_market_context(market_df, market_context=market_context)
+
+        metric_df = self._calculate_markout(trade_order_df, market_context,
                                             bid_benchmark=bid_benchmark, ask_benchmark=ask_benchmark)
         metric_df['id'] = trade_order_df['id']
 
@@ -52,6 +52,24 @@ class ResultsForm(ABC):
 
         return True
 
+    def get_required_fields(self, market_trade_order_name=None):
+        """Gets the trade/order fields (eg. metrics) which this ResultsForm summarises, aggregates by or filters on, so
+        CalcPlanner can work out which benchmarks/metrics need to be calculated (and which columns need to be loaded)
+
+        Parameters
+        ----------
+        market_trade_order_name : str
+            Name of the trade/order DataFrame (eg. 'trade_df')
+
+        Returns
+        -------
+        str (list)
+        """
+        if not(self._check_calculate_results(market_trade_order_name)): return []
+
+        return self._util_func.flatten_list_of_lists([self._metric_name, getattr(self, '_weighting_field', None),
+                                                      self._aggregate_by_field, list(self._tag_value_combinations.keys())])
+
     @abc.abstractmethod
     def aggregate_results(self, market_trade_order_df=None, market_df=None, trade_order_name=None, metric_name=None,
                           ticker=None, aggregate_by_field=None, filter_nan=True):
@@ -80,6 +98,12 @@ class TableResultsForm(ResultsForm):
 
         self._results_form_tag = 'table'
 
+    def get_required_fields(self, market_trade_order_name=None):
+        if not(self._check_calculate_results(market_trade_order_name)): return []
+
+        return self._util_func.flatten_list_of_lists([self._metric_name, self._weighting_field, self._keep_fields,
+                                                      self._aggregate_by_field, list(self._tag_value_combinations.keys())])
+
 
     def aggregate_results(self, market_trade_order_df=None, market_df=None, filter_by=[], market_trade_order_name=None,
                           metric_name=None, ticker=None,
@@ -179,6 +203,11 @@ class ScatterResultsForm(ResultsForm):
 
         self._results_form_tag = 'scatter'
 
+    def get_required_fields(self, market_trade_order_name=None):
+        if not(self._check_calculate_results(market_trade_order_name)): return []
+
+        return list(self._scatter_fields) + list(self._tag_value_combinations.keys())
+
     def aggregate_results(self, market_trade_order_df=None, market_df=None, market_trade_order_name=None,
                           scatter_fields=None,
                           tag_value_combinations={}, replace_text={},
@@ -463,6 +492,18 @@ class JoinTables(object):
         self._time_series_ops = Mediator.get_time_series_ops()
         self._util_func = Mediator.get_util_func()
 
+    def get_table_list(self):
+        """Gets the names of the tables to be joined (eg. outputs of ResultsForm, or trade/order DataFrames)
+
+        Returns
+        -------
+        str (list)
+        """
+        if 'table_list' not in self._tables_dict.keys():
+            return []
+
+        return self._tables_dict['table_list']
+
     def aggregate_tables(self, df_dict={}, tables_dict={}, round_figures_by=None, scalar=None):
         logger = LoggerManager.getLogger(__name__)
 
@@ -0,0 +1,204 @@
+from __future__ import division, print_function
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+from tcapy.conf.constants import Constants
+from tcapy.util.loggermanager import LoggerManager
+
+from tcapy.analysis.tradeorderfilter import TradeOrderFilterTag, TradeOrderFilterTimeOfDayWeekMonth
+
+constants = Constants()
+
+class CalcPlanner(object):
+    """Works out which of the benchmarks and metrics in a TCARequest actually need to be calculated for a trade/order
+    DataFrame. It builds a dependency graph from the fields displayed by the results_form, metric_display and join_tables,
+    to the metrics which output those fields, and then to the benchmarks those metrics need (eg. implementation shortfall
+    needs the arrival price). Only this closure is calculated, in dependency order.
+
+    Benchmarks/metrics which don't declare their output fields (eg. BenchmarkTradeOffset, which shifts trade times), are
+    always calculated.
+
+    """
+
+    def get_required_fields(self, tca_request, trade_order_name):
+        """Gets the trade/order fields which are displayed by the output of a TCARequest.
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            Defines the results_form, metric_display and join_tables which display the trades/orders
+
+        trade_order_name : str
+            Name of the trade/order DataFrame (eg. 'trade_df')
+
+        Returns
+        -------
+        set (str) or None (if all fields are needed)
+        """
+        fields = []
+
+        for r in tca_request.results_form:
+            fields.extend(r.get_required_fields(market_trade_order_name=trade_order_name))
+
+        for m in tca_request.metric_display:
+            if isinstance(m, str):
+                fields.append(m)
+            else:
+                output_fields = m.get_output_fields()
+
+                if output_fields is None: return None
+
+                fields.extend(output_fields)
+
+        for j in tca_request.join_tables:
+            # If the raw trade/orders are being output, then we need every field
+            if trade_order_name in j.get_table_list():
+                return None
+
+        # Benchmarks which are plotted alongside the market data (see TCATickerLoaderImpl._calculate_additional_metrics)
+        if tca_request.tca_type == 'detailed' or tca_request.summary_display == 'candlestick':
+            fields.extend(constants.sparse_market_trade_fields)
+
+        fields.extend(tca_request.extra_lines_to_plot)
+
+        return set([f for f in fields if f is not None])
+
+    def plan_calcs(self, tca_request, trade_order_name):
+        """Gets the benchmarks and metrics which need to be calculated for a trade/order DataFrame (in dependency
+        order). If lazy_calcs hasn't been set in the TCARequest, all the benchmarks and metrics are returned.
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            Defines the benchmark_calcs, metric_calcs and what is displayed
+
+        trade_order_name : str
+            Name of the trade/order DataFrame (eg. 'trade_df')
+
+        Returns
+        -------
+        Benchmark (list), Metric (list)
+        """
+        benchmark_calcs = tca_request.benchmark_calcs
+        metric_calcs = tca_request.metric_calcs
+
+        if not(tca_request.lazy_calcs):
+            return benchmark_calcs, metric_calcs
+
+        required_fields = self.get_required_fields(tca_request, trade_order_name)
+
+        if required_fields is None:
+            return benchmark_calcs, metric_calcs
+
+        # Benchmarks are always calculated before metrics, so they can't depend on them
+        calcs = self._sort_calcs(self._get_closure(benchmark_calcs + metric_calcs, required_fields))
+
+        benchmark_calcs_planned = [c for c in calcs if c in benchmark_calcs]
+        metric_calcs_planned = [c for c in calcs if c in metric_calcs]
+
+        LoggerManager.getLogger(__name__).debug("For " + trade_order_name + " calculating "
+            + str([type(c).__name__ for c in calcs]) + " from "
+            + str([type(c).__name__ for c in benchmark_calcs + metric_calcs]))
+
+        return benchmark_calcs_planned, metric_calcs_planned
+
+    def get_trade_order_fields(self, tca_request, trade_order_name):
+        """Gets the columns which need to be loaded for a trade/order DataFrame, which are those used internally by
+        tcapy (constants.sql_trade_order_core_fields), alongside those needed by the results forms, metric_display,
+        the planned benchmarks/metrics and the trade/order filters. Only applies if lazy_calcs has been set, otherwise
+        all the columns are needed (as the trade/orders are output in full).
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            Defines the calculations, filters and what is displayed
+
+        trade_order_name : str
+            Name of the trade/order DataFrame (eg. 'trade_df')
+
+        Returns
+        -------
+        str (list) or None (if all columns are needed)
+        """
+        if not(tca_request.lazy_calcs):
+            return None
+
+        fields = self.get_required_fields(tca_request, trade_order_name)
+
+        if fields is None:
+            return None
+
+        benchmark_calcs, metric_calcs = self.plan_calcs(tca_request, trade_order_name)
+
+        for c in benchmark_calcs + metric_calcs:
+            fields.update(c.get_required_fields())
+
+        for f in tca_request.trade_order_filter:
+            if isinstance(f, TradeOrderFilterTag):
+                fields.update(f.get_tag_value_combinations().keys())
+
+            # Any other filters might need any of the columns
+            elif not(isinstance(f, TradeOrderFilterTimeOfDayWeekMonth)):
+                return None
+
+        fields.update(constants.sql_trade_order_core_fields)
+
+        return sorted(fields)
+
+    def _get_closure(self, calcs, required_fields):
+        """Finds all the calcs which output the required fields, and in turn the calcs which output the fields they need
+        """
+        required_fields = set(required_fields)
+        needed = [False] * len(calcs)
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for i in range(0, len(calcs)):
+                if not(needed[i]):
+                    output_fields = calcs[i].get_output_fields()
+
+                    if output_fields is None or len(required_fields.intersection(output_fields)) > 0:
+                        needed[i] = True
+                        changed = True
+
+                        required_fields.update(calcs[i].get_required_fields())
+
+        return [calcs[i] for i in range(0, len(calcs)) if needed[i]]
+
+    def _sort_calcs(self, calcs):
+        """Sorts calcs so that any calc comes after the calcs which output the fields it needs, otherwise keeping the
+        order specified by the user
+        """
+        dependencies = []
+
+        for c in calcs:
+            required_fields = set(c.get_required_fields())
+
+            dependencies.append(set([j for j in range(0, len(calcs)) if calcs[j] is not c
+                                     and calcs[j].get_output_fields() is not None
+                                     and len(required_fields.intersection(calcs[j].get_output_fields())) > 0]))
+
+        sorted_ix = []
+
+        while len(sorted_ix) < len(calcs):
+            ready = [i for i in range(0, len(calcs)) if i not in sorted_ix and dependencies[i].issubset(sorted_ix)]
+
+            # Circular dependencies, so keep the remaining calcs in the order specified by the user
+            if ready == []:
+                ready = [i for i in range(0, len(calcs)) if i not in sorted_ix]
+
+                LoggerManager.getLogger(__name__).warning("Circular dependencies between "
+                    + str([type(calcs[i]).__name__ for i in ready]))
+
+            sorted_ix.append(ready[0])
+
+        return [calcs[i] for i in sorted_ix]
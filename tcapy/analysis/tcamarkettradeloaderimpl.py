@@ -27,7 +27,7 @@ import traceback
 constants = Constants()
 
 from tcapy.conf.celery_calls import calculate_metrics_single_ticker_via_celery, \
-    get_market_trade_holder_via_celery, get_market_trade_holder_and_calculate_metrics_single_ticker_via_celery
+    get_market_trade_holder_list_via_celery, get_market_trade_holder_list_and_calculate_metrics_single_ticker_via_celery
 from celery import chord, group
 
 class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
@@ -178,6 +178,12 @@ class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
                         tca_request_single_ticker, tca_request_single_ticker.ticker,
                         period=tca_request_single_ticker.multithreading_params['cache_period'])
 
+                    # Each Celery task loads several consecutive date chunks together (fetching all their cached
+                    # periods in a single call), rather than one chunk per task
+                    tca_request_date_batch = self._batch_tca_request_by_date(
+                        tca_request_date_split,
+                        tca_request_single_ticker.multithreading_params.get('chunks_per_task', 1))
+
                     if not(constants.multithreading_params['splice_request_by_dates']) \
                                 or tca_request_list[0].tca_type == 'detailed' \
                                 or tca_request_list[0].tca_type == 'compliance' \
@@ -186,17 +192,19 @@ class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
 
                         if 'celery' in parallel_library:
                             # Load all the data for this ticker and THEN calculate the metrics on it
-                            result.append(chord((get_market_trade_holder_via_celery.s(tca_request_data)
-                                                 for tca_request_data in tca_request_date_split),
+                            result.append(chord((get_market_trade_holder_list_via_celery.s(tca_request_data)
+                                                 for tca_request_data in tca_request_date_batch),
                                                 calculate_metrics_single_ticker_via_celery.s(tca_request_single_ticker,
                                                                                              dummy_market)).apply_async())
                         elif parallel_library == 'single':
                             # This is not actually parallel, but is mainly for debugging purposes
-                            for tca_request_s in tca_request_date_split:
+                            # Load the data for all the chunks at once (fetching all the cached periods in a single
+                            # call), rather than making separate calls for every chunk
+                            market_trade_order_list = tca_ticker_loader.get_market_trade_order_holder_list(
+                                tca_request_date_split)
 
-                                # print(tca_request_s.start_date)
-                                market_df, trade_order_df_dict = tca_ticker_loader.get_market_trade_order_holder(
-                                    tca_request_s, return_cache_handles=False)
+                            for tca_request_s, (market_df, trade_order_df_dict) in \
+                                    zip(tca_request_date_split, market_trade_order_list):
 
                                 market_df, trade_order_df_list, ticker, trade_order_keys = \
                                     tca_ticker_loader.calculate_metrics_single_ticker((market_df, trade_order_df_dict),
@@ -217,9 +225,10 @@ class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
                         if 'celery' == parallel_library:
 
                             # For each ticker/date combination load data and process chunk (so can do fully in parallel)
-                            result.append(group(get_market_trade_holder_and_calculate_metrics_single_ticker_via_celery.s(
-                                         tca_request_data,
-                                         dummy_market) for tca_request_data in tca_request_date_split).apply_async())
+                            result.append(group(
+                                get_market_trade_holder_list_and_calculate_metrics_single_ticker_via_celery.s(
+                                    tca_request_data, dummy_market)
+                                for tca_request_data in tca_request_date_batch).apply_async())
 
                 # Now combine the results from the parallel operations, if using celery
                 if 'celery' in parallel_library:
@@ -227,7 +236,8 @@ class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
                     # Careful, when the output is empty!
                     output = [p.get(timeout=constants.celery_timeout_seconds) for p in result if p is not None]
 
-                    # If pipelined/splice_request_by_dates will have two lists so flatten it into one
+                    # If pipelined/splice_request_by_dates will have nested lists (also for each batch of date chunks)
+                    # so flatten it into one
                     output = self._util_func.flatten_list_of_lists(output)
 
                     for market_df, trade_order_df_list, ticker, trade_order_keys in output:
@@ -367,5 +377,25 @@ class TCAMarketTradeLoaderImpl(TCAMarketTradeLoader):
 
         return tca_request_list
 
+    def _batch_tca_request_by_date(self, tca_request_list, chunks_per_task):
+        """Groups consecutive date chunks of a TCARequest (from _split_tca_request_by_date) into batches, which can each
+        be loaded together by a single task
+
+        Parameters
+        ----------
+        tca_request_list : TCARequest (list)
+            Consecutive date chunks of a TCARequest
+
+        chunks_per_task : int
+            Maximum number of date chunks in each batch
+
+        Returns
+        -------
+        TCARequest (list) (list)
+        """
+        chunks_per_task = max(1, int(chunks_per_task))
+
+        return [tca_request_list[i:i + chunks_per_task] for i in range(0, len(tca_request_list), chunks_per_task)]
+
     def get_tca_version(self):
         return 'pro'
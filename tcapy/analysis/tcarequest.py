@@ -21,6 +21,12 @@ constants = Constants()
 import datetime
 import pytz
 
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
 class DataRequest(object):
     """Has parameters for any type of data request or TCA computation we make. This is subclassed by, MarketRequest,
     TradeRequest and TCARequest
@@ -243,7 +249,8 @@ class TradeRequest(DataRequest):
                  trade_data_database_name=None,
                  # market_data_database_table=None,
                  use_multithreading=constants.use_multithreading, multithreading_params=constants.multithreading_params, data_norm=None,
-                 trade_order_type=None, trade_order_mapping=None, event_type='trade'):
+                 trade_order_type=None, trade_order_mapping=None, event_type='trade', trade_order_fields=None,
+                 trade_order_filters=None):
 
         if trade_request is not None:
             start_date = trade_request.start_date
@@ -270,6 +277,10 @@ class TradeRequest(DataRequest):
             if hasattr(trade_request, 'trade_order_type'): # only TradeRequest has trade_order_type
                 trade_order_type = trade_request.trade_order_type
 
+            if hasattr(trade_request, 'trade_order_fields'): # only TradeRequest has trade_order_fields/filters
+                trade_order_fields = trade_request.trade_order_fields
+                trade_order_filters = trade_request.trade_order_filters
+
             event_type = trade_request.event_type
             trade_order_mapping = trade_request.trade_order_mapping
         # constants = Constants()
@@ -293,6 +304,10 @@ class TradeRequest(DataRequest):
         self.trade_order_type = trade_order_type
         self.event_type = event_type
 
+        # Columns and filters which can be pushed down into the database query (eg. for SQL)
+        self.trade_order_fields = trade_order_fields
+        self.trade_order_filters = trade_order_filters
+
         if trade_order_mapping is None and 'csv' not in self.data_store and '.h5' not in self.data_store:
             trade_order_mapping = constants.trade_order_mapping[self.data_store]
 
@@ -337,6 +352,22 @@ class TradeRequest(DataRequest):
     def event_type(self, event_type):
         self.__reload = event_type
 
+    @property
+    def trade_order_fields(self):
+        return self.__trade_order_fields
+
+    @trade_order_fields.setter
+    def trade_order_fields(self, trade_order_fields):
+        self.__trade_order_fields = trade_order_fields
+
+    @property
+    def trade_order_filters(self):
+        return self.__trade_order_filters
+
+    @trade_order_filters.setter
+    def trade_order_filters(self, trade_order_filters):
+        self.__trade_order_filters = trade_order_filters
+
 class ComputationRequest(object):
     """Generate object for any long run computation/analysis"""
     pass
@@ -361,7 +392,7 @@ class TCARequest(TradeRequest, ComputationRequest):
                  event_type='trade', trade_order_mapping=None, trade_order_filter=[],
                  benchmark_calcs=[],
                  metric_calcs=[], results_form=[], metric_display=[], join_tables=[],
-                 extra_lines_to_plot=[],
+                 extra_lines_to_plot=[], lazy_calcs=constants.lazy_calcs,
                  tca_type='detailed',
                  reporting_currency=constants.reporting_currency, dummy_market=False, summary_display=None, access_control=None,
                  use_multithreading=constants.use_multithreading, multithreading_params=constants.multithreading_params, data_norm=None,
@@ -397,6 +428,7 @@ class TCARequest(TradeRequest, ComputationRequest):
             metric_display = tca_request.metric_display
             join_tables = tca_request.join_tables
             extra_lines_to_plot = tca_request.extra_lines_to_plot
+            lazy_calcs = tca_request.lazy_calcs
             
             tca_type = tca_request.tca_type
             reporting_currency = tca_request.reporting_currency
@@ -455,6 +487,7 @@ class TCARequest(TradeRequest, ComputationRequest):
         self.results_form = results_form
         self.join_tables = join_tables
         self.extra_lines_to_plot = extra_lines_to_plot
+        self.lazy_calcs = lazy_calcs  # only calculate benchmarks/metrics needed by results_form etc.?
         
         self.tca_type = tca_type
         self.reporting_currency = reporting_currency
@@ -480,6 +513,83 @@ class TCARequest(TradeRequest, ComputationRequest):
 
         return prop
 
+    # Don't change the output of TCAEngine, so are ignored by the fingerprint of a TCARequest
+    _fingerprint_ignore = ['reload', 'use_multithreading', 'multithreading_params']
+
+    # Order of these doesn't matter
+    _fingerprint_unordered = ['ticker', 'venue']
+
+    def get_fingerprint(self):
+        """Gets a fingerprint of the TCARequest, which is the same for any TCARequest that would give the same output from
+        TCAEngine, even if it was created separately (eg. by another user) or has its tickers listed in a different order.
+        It covers the dates, tickers, data stores, offsets, the parameters of every benchmark, metric and results form,
+        alongside the tcapy version. Note, it doesn't say whether the underlying data has changed since.
+
+        Returns
+        -------
+        str
+        """
+        from tcapy import __version__
+
+        fingerprint = {'tcapy_version': constants.tcapy_version, 'version': __version__}
+
+        for k, v in vars(self).items():
+            # Properties are stored with mangled names (eg. _DataRequest__start_date)
+            k = k.split('__')[-1]
+
+            if k in self._fingerprint_ignore:
+                continue
+
+            v = self._get_canonical(v)
+
+            if k in self._fingerprint_unordered and isinstance(v, list):
+                v = sorted(v, key=str)
+
+            fingerprint[k] = v
+
+        return hashlib.md5(json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _get_canonical(self, obj):
+        """Converts an object (eg. a Metric) into a form which can be dumped to JSON, without anything specific to the
+        particular instance (such as memory addresses)
+        """
+        if obj is None or isinstance(obj, (str, bool, int, float)):
+            return obj
+        elif isinstance(obj, np.generic):
+            return obj.item()
+        elif isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date, np.datetime64)):
+            return str(pd.Timestamp(obj))
+        elif isinstance(obj, (pd.DataFrame, pd.Series)):
+            # Eg. trades uploaded to the API
+            return type(obj).__name__ + '_' \
+                   + hashlib.md5(pd.util.hash_pandas_object(obj, index=True).values.tobytes()).hexdigest() \
+                   + '_' + str(list(obj.columns) if isinstance(obj, pd.DataFrame) else obj.name)
+        elif isinstance(obj, dict):
+            return {str(k): self._get_canonical(v) for k, v in obj.items()}
+        elif isinstance(obj, (list, tuple)):
+            return [self._get_canonical(o) for o in obj]
+        elif isinstance(obj, (set, frozenset)):
+            return sorted([self._get_canonical(o) for o in obj], key=str)
+
+        class_name = type(obj).__module__ + '.' + type(obj).__qualname__
+
+        if callable(obj) and hasattr(obj, '__qualname__'):
+            return getattr(obj, '__module__', '') + '.' + obj.__qualname__
+
+        # Benchmarks, metrics, results forms etc. are identified by their parameters, but not by any helper objects
+        # they hold (eg. TimeSeriesOps)
+        if hasattr(obj, '__dict__') and type(obj).__module__.startswith('tcapy.') \
+                and not(type(obj).__module__.startswith('tcapy.util.')):
+
+            canonical = {'class': class_name}
+
+            for k, v in vars(obj).items():
+                canonical[k] = self._get_canonical(v)
+
+            return canonical
+
+        return class_name
+
     @property
     def market_data_store(self):
         return self.__market_data_store
@@ -595,6 +705,14 @@ class TCARequest(TradeRequest, ComputationRequest):
     def extra_lines_to_plot(self, extra_lines_to_plot):
         self.__extra_lines_to_plot = self._listify(extra_lines_to_plot)
 
+    @property
+    def lazy_calcs(self):
+        return self.__lazy_calcs
+
+    @lazy_calcs.setter
+    def lazy_calcs(self, lazy_calcs):
+        self.__lazy_calcs = lazy_calcs
+
     @property
     def tca_type(self):
         return self.__tca_type
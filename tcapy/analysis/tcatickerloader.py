@@ -17,6 +17,8 @@ from tcapy.data.datafactory import DataFactory
 
 from tcapy.analysis.algos.benchmark import *
 from tcapy.analysis.algos.metric import MetricExecutedPriceNotional
+from tcapy.analysis.algos.marketindex import MarketContext
+from tcapy.analysis.calcplanner import CalcPlanner
 
 from tcapy.conf.constants import Constants
 from tcapy.util.fxconv import FXConv
@@ -29,7 +31,8 @@ from tcapy.analysis.dataframeholder import DataFrameHolder
 
 from tcapy.analysis.tcarequest import TCARequest, MarketRequest, TradeRequest
 
-from tcapy.data.databasesource import DatabaseSource
+from tcapy.data.databasesource import DatabaseSource, DatabaseSourceSQL, DatabaseSourceDuckDB
+from tcapy.util.mediator import Mediator
 
 constants = Constants()
 
@@ -54,6 +57,7 @@ class TCATickerLoader(ABC):
 
         self._benchmark_mid = BenchmarkMarketMid()  # to calculate mid price from bid/ask quote market data
         self._trade_order_tag = TradeOrderFilterTag()  # to filter trade/orders according to the values of certain tags
+        self._calc_planner = CalcPlanner()  # to work out which benchmarks/metrics need to be calculated
         self._version = version
         self._volatile_cache_engine = volatile_cache_engine
 
@@ -215,6 +219,56 @@ class TCATickerLoader(ABC):
 
         return market_df
 
+    def _get_trade_order_push_down(self, tca_request, trade_order_type):
+        """Gets the columns and filters for trade/order data, which can be pushed down into the database query, rather
+        than loading every column and filtering afterwards. Only SQL databases and DuckDB support this (and only if
+        constants.sql_trade_order_push_down is set). The same filters are still applied later in pandas, so results
+        are unchanged.
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            Parameters for the TCA analysis
+
+        trade_order_type : str
+            Do we want trade or order data (eg. 'trade_df')?
+
+        Returns
+        -------
+        str (list), list of (str, str (list))
+        """
+        if not(constants.sql_trade_order_push_down):
+            return None, None
+
+        trade_request = TradeRequest(trade_request=tca_request)
+        trade_request.trade_order_type = trade_order_type
+
+        if not(isinstance(Mediator.get_database_source_picker().get_database_source(trade_request),
+                          (DatabaseSourceSQL, DatabaseSourceDuckDB))):
+            return None, None
+
+        fields = self._calc_planner.get_trade_order_fields(tca_request, trade_order_type)
+
+        # NOTE: venue and event type only filter TRADES (as orders do not have these)
+        filters = []
+
+        if trade_order_type == 'trade_df':
+            filters.append(('venue', tca_request.venue))
+            filters.append(('event_type', tca_request.event_type))
+
+        for f in tca_request.trade_order_filter:
+            if isinstance(f, TradeOrderFilterTag):
+                tag_value = f.get_tag_value_combinations()
+
+                for t in tag_value.keys():
+                    filters.append((t, tag_value[t]))
+
+        # 'All' implies we don't filter by that field
+        filters = [(t, v if isinstance(v, list) else [v]) for t, v in filters if v is not None]
+        filters = [(t, v) for t, v in filters if 'All' not in v]
+
+        return fields, filters
+
     def get_trade_order_data(self, tca_request, trade_order_type, start_date=None, finish_date=None):
         """Gets trade data for specified parameters (eg. start/finish dates _tickers). Will also try to find trades
         when they have booked in the inverted market convention, and change the fields appropriately. For example, if
@@ -232,8 +286,55 @@ class TCATickerLoader(ABC):
         -------
         DataFrame
         """
-        logger = LoggerManager().getLogger(__name__)
+        # by default, assume we want trade data (rather than order data)
+        if trade_order_type is None:
+            trade_order_type = 'trade_df'
+
+        if start_date is None and finish_date is None:
+            start_date = tca_request.start_date
+            finish_date = tca_request.finish_date
+
+        trade_request, inv_trade_request = self._create_trade_order_requests(tca_request, trade_order_type, start_date,
+                                                                            finish_date)
+
+        # Fetch all the trades done in that ticker (will be sparse-like randomly spaced tick data)
+        # assumed to be the correct convention (eg. GBPUSD)
+        trade_df = self._data_factory.fetch_table(data_request=trade_request)
 
+        # if fx see if inverted or not
+        if inv_trade_request is not None:
+            # Also fetch data in the inverted cross (eg. USDGBP) as some trades may be recorded this way
+            trade_inverted_df = self._invert_trade_order_data(
+                self._data_factory.fetch_table(data_request=inv_trade_request), trade_request.ticker)
+
+            # Only add inverted trades if they exist!
+            if trade_inverted_df is not None:
+                if trade_df is not None:
+                    trade_df = trade_df.append(trade_inverted_df)
+                    trade_df = trade_df.sort_index()
+                else:
+                    trade_df = trade_inverted_df
+
+        return self._convert_trade_order_data(trade_df, tca_request, trade_request, start_date, finish_date,
+                                              trade_order_type)
+
+    def get_trade_order_data_chunks(self, tca_request, trade_order_type, start_date=None, finish_date=None):
+        """Gets trade data in the same way as get_trade_order_data, but as a generator of DataFrames ordered by date, which
+        are streamed from the database (for SQL databases), so large requests (eg. multi-year) don't need to be held in
+        memory at once. Trades booked in the inverted market convention are merged into the chunks in date order.
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            What type of trade data do we want
+
+        trade_order_type : str
+            Do we want trade or order data?
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
         # by default, assume we want trade data (rather than order data)
         if trade_order_type is None:
             trade_order_type = 'trade_df'
@@ -242,15 +343,48 @@ class TCATickerLoader(ABC):
             start_date = tca_request.start_date
             finish_date = tca_request.finish_date
 
+        trade_request, inv_trade_request = self._create_trade_order_requests(tca_request, trade_order_type, start_date,
+                                                                            finish_date)
+
+        df_chunks_list = [self._data_factory.fetch_table_chunks(trade_request)]
+
+        if inv_trade_request is not None:
+            df_chunks_list.append(self._invert_trade_order_data(df, trade_request.ticker)
+                                  for df in self._data_factory.fetch_table_chunks(inv_trade_request))
+
+        chunk_start_date = start_date
+        empty = True
+
+        for trade_df in self._time_series_ops.merge_ordered_chunks(df_chunks_list):
+            # Market data (eg. to convert notionals) only needs to cover the dates since the previous chunk
+            trade_df = self._convert_trade_order_data(trade_df, tca_request, trade_request, chunk_start_date,
+                                                      trade_df.index[-1], trade_order_type)
+
+            if trade_df is not None and not(trade_df.empty):
+                chunk_start_date = trade_df.index[-1]; empty = False
+
+                yield trade_df
+
+        if empty:
+            self._check_is_empty_trade_order(None, tca_request, start_date, finish_date, trade_order_type)
+
+    def _create_trade_order_requests(self, tca_request, trade_order_type, start_date, finish_date):
+        """Creates the TradeRequest for trade/order data, and for FX spot, also for trades booked in the inverted cross
+        (eg. USDGBP for GBPUSD), otherwise None
+
+        Returns
+        -------
+        TradeRequest, TradeRequest
+        """
         # Create request for actual executed trades
         trade_request = TradeRequest(trade_request=tca_request)
 
         trade_request.start_date = start_date; trade_request.finish_date = finish_date
         trade_request.trade_order_type = trade_order_type
+        trade_request.trade_order_fields, trade_request.trade_order_filters = \
+            self._get_trade_order_push_down(tca_request, trade_order_type)
 
-        # Fetch all the trades done in that ticker (will be sparse-like randomly spaced tick data)
-        # assumed to be the correct convention (eg. GBPUSD)
-        trade_df = self._data_factory.fetch_table(data_request=trade_request)
+        inv_trade_request = None
 
         # if fx see if inverted or not
         if tca_request.asset_class == 'fx' and tca_request.instrument == 'spot':
@@ -260,31 +394,41 @@ class TCATickerLoader(ABC):
             inv_trade_request.start_date = start_date;
             inv_trade_request.finish_date = finish_date
             inv_trade_request.trade_order_type = trade_order_type
+            inv_trade_request.trade_order_fields = trade_request.trade_order_fields
+            inv_trade_request.trade_order_filters = trade_request.trade_order_filters
 
             inv_trade_request.ticker = self._fx_conv.reverse_notation(trade_request.ticker)
 
-            trade_inverted_df = self._data_factory.fetch_table(data_request=inv_trade_request)
+        return trade_request, inv_trade_request
 
-            # Only add inverted trades if they exist!
-            if trade_inverted_df is not None:
-                if not(trade_inverted_df.empty):
+    def _invert_trade_order_data(self, trade_inverted_df, ticker):
+        """Converts trades/orders booked in the inverted cross (eg. USDGBP) into the correct convention (eg. GBPUSD),
+        or None if there are none
+        """
+        if trade_inverted_df is None:
+            return None
 
-                    invert_price_columns = ['executed_price', 'price_limit', 'market_bid', 'market_mid', 'market_ask',
-                                            'arrival_price']
-                    invert_price_columns = [x for x in invert_price_columns if x in trade_inverted_df.columns]
+        if trade_inverted_df.empty:
+            return None
 
-                    # For trades (but not orders), there is an executed price field, which needs to be inverted
-                    if invert_price_columns != []:
-                        trade_inverted_df[invert_price_columns] = 1.0 / trade_inverted_df[invert_price_columns].values
+        invert_price_columns = ['executed_price', 'price_limit', 'market_bid', 'market_mid', 'market_ask',
+                                'arrival_price']
+        invert_price_columns = [x for x in invert_price_columns if x in trade_inverted_df.columns]
 
-                    trade_inverted_df['side'] = -trade_inverted_df['side']  # buys become sells, and vice versa!
-                    trade_inverted_df['ticker'] = trade_request.ticker
+        # For trades (but not orders), there is an executed price field, which needs to be inverted
+        if invert_price_columns != []:
+            trade_inverted_df[invert_price_columns] = 1.0 / trade_inverted_df[invert_price_columns].values
 
-                    if trade_df is not None:
-                        trade_df = trade_df.append(trade_inverted_df)
-                        trade_df = trade_df.sort_index()
-                    else:
-                        trade_df = trade_inverted_df
+        trade_inverted_df['side'] = -trade_inverted_df['side']  # buys become sells, and vice versa!
+        trade_inverted_df['ticker'] = ticker
+
+        return trade_inverted_df
+
+    def _convert_trade_order_data(self, trade_df, tca_request, trade_request, start_date, finish_date, trade_order_type):
+        """Converts notionals of trade/order data into the base currency and the reporting currency (for FX spot), or
+        None if there are no trades/orders
+        """
+        logger = LoggerManager().getLogger(__name__)
 
         # Check if trade data is not empty? if it is return None
         if self._check_is_empty_trade_order(trade_df, tca_request, start_date, finish_date, trade_order_type):
@@ -312,7 +456,7 @@ class TCATickerLoader(ABC):
                 if terms_notionals.any():
                     if inversion_spot is not None:
                         for n in notional_fields:
-                            if n in trade_inverted_df.columns:
+                            if n in trade_df.columns:
                                 # trade_df[n][terms_notionals] = trade_df[n][terms_notionals].values * inversion_spot[terms_notionals].values
                                 trade_df[n][terms_notionals] = pd.Series(index=trade_df.index[terms_notionals.values],
                                                                          data=trade_df[n][terms_notionals].values *
@@ -417,6 +561,21 @@ class TCATickerLoader(ABC):
         return self.get_market_data(tca_request), \
                self.get_trade_order_holder(tca_request)
 
+    def get_market_trade_order_holder_list(self, tca_request_list):
+        """Gets the market data and trade/order data for several TCARequests (eg. date chunks of the same TCARequest),
+        as a list of (DataFrame, DataFrameHolder) tuples
+
+        Parameters
+        ----------
+        tca_request_list : TCARequest (list)
+            Parameters for TCA calculations
+
+        Returns
+        -------
+        list of (DataFrame, DataFrameHolder)
+        """
+        return [self.get_market_trade_order_holder(tca_request) for tca_request in tca_request_list]
+
     def calculate_metrics_single_ticker(self, market_trade_order_combo, tca_request, dummy_market):
         """Calls auxillary methods to get market/trade data for a single ticker. If necessary splits up the request into
         smaller date chunks to collect market and trade data in parallel (using Celery)
@@ -533,13 +692,24 @@ class TCATickerLoader(ABC):
                     if 'notional' not in trade_order_df_dict['trade_df'].columns:
                         trade_order_df_dict['trade_df']['notional'] = trade_order_df_dict['trade_df']['executed_notional']
 
+                # Market data is converted/searched once for all the benchmarks and metrics on this ticker (eg. the
+                # arrival price and slippage look up the same trade times)
+                market_context = MarketContext(market_df)
+
+                # Work out which benchmarks/metrics are needed for each trade/order (all of them, unless lazy_calcs
+                # is set, in which case only those needed for the results_form etc.)
+                calc_plan = {}
+
+                for t in trade_order_list:
+                    calc_plan[t] = self._calc_planner.plan_calcs(tca_request, t)
+
                 logger.debug("Calculating benchmarks")
 
                 # Calculate user specified benchmarks for each trade order (which has been selected)
                 if benchmark_calcs is not None:
 
                     for i in range(0, len(trade_order_df_dict)):
-                        for b in benchmark_calcs:
+                        for b in calc_plan[trade_order_list[i]][0]:
                             # For benchmarks which need to be generated on a trade by trade basis (eg. VWAP, arrival etc)
                             if not (isinstance(b, BenchmarkMarket)):
                                 logger.debug("Calculating " + type(b).__name__ + " for " + trade_order_list[i])
@@ -549,21 +719,21 @@ class TCATickerLoader(ABC):
                                         trade_order_df_dict[trade_order_list[i]], _ = b.calculate_benchmark(
                                             trade_order_df=trade_order_df_dict[trade_order_list[i]],
                                             market_df=market_df,
-                                            trade_order_name=trade_order_list[i])
+                                            trade_order_name=trade_order_list[i], market_context=market_context)
 
                 logger.debug("Calculating metrics")
 
                 # Calculate user specified metrics for each trade order (which has been selected)
                 if metric_calcs is not None:
                     for i in range(0, len(trade_order_df_dict)):
-                        for m in metric_calcs:
+                        for m in calc_plan[trade_order_list[i]][1]:
                             logger.debug("Calculating " + type(m).__name__ + " for " + trade_order_list[i])
 
                             if trade_order_df_dict[trade_order_list[i]] is not None:
                                 if not (trade_order_df_dict[trade_order_list[i]].empty):
                                     trade_order_df_dict[trade_order_list[i]], _ = m.calculate_metric(
                                         trade_order_df=trade_order_df_dict[trade_order_list[i]], market_df=market_df,
-                                        trade_order_name=trade_order_list[i])
+                                        trade_order_name=trade_order_list[i], market_context=market_context)
 
                 logger.debug("Completed derived field _calculations for " + ticker)
 
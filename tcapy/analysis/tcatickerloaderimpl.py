@@ -7,6 +7,8 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 #
 # See the License for the specific language governing permissions and limitations under the License.
 #
+import hashlib
+
 import pandas as pd
 
 from tcapy.conf.constants import Constants
@@ -18,7 +20,7 @@ from tcapy.vis.displaylisteners import PlotRender
 
 from tcapy.analysis.dataframeholder import DataFrameHolder
 from tcapy.analysis.tcatickerloader import TCATickerLoader
-from tcapy.analysis.tcarequest import MarketRequest
+from tcapy.analysis.tcarequest import MarketRequest, TCARequest
 
 constants = Constants()
 
@@ -37,6 +39,9 @@ class TCATickerLoaderImpl(TCATickerLoader):
 
         # Gather market and trade/order data (which might be stored in a list)
         if isinstance(market_trade_order_tuple, list):
+            # Tasks which load several date chunks together, return a list for each of them
+            market_trade_order_tuple = self._util_func.flatten_list_of_lists(market_trade_order_tuple)
+
             market_df_list = []
             trade_order_holder = DataFrameHolder()
 
@@ -85,6 +90,85 @@ class TCATickerLoaderImpl(TCATickerLoader):
         return self.get_market_data(tca_request, return_cache_handles=return_cache_handles), \
                self.get_trade_order_holder(tca_request)
 
+    def get_market_trade_order_holder_list(self, tca_request_list, return_cache_handles=False):
+        """Gets the market data and trade/order data for consecutive date chunks of a TCARequest for a single ticker (eg.
+        from splitting it by date), as a list of (DataFrame, DataFrameHolder) tuples.
+
+        Rather than loading each chunk separately (each needing its own calls to the cache), the whole date range is
+        loaded at once. Hence, all its periods are fetched from the cache in a single call (and any missing ones from the
+        database, with one query per contiguous gap), before being split back into the chunks.
+
+        Parameters
+        ----------
+        tca_request_list : TCARequest (list)
+            Consecutive date chunks of a TCARequest for a single ticker
+
+        return_cache_handles : bool (default: False)
+            Return the market and trade/order data for each chunk as CacheHandles (if use_multithreading), which can be
+            easily passed across Celery
+
+        Returns
+        -------
+        list of (DataFrame, DataFrameHolder)
+        """
+        if len(tca_request_list) == 1:
+            return [self.get_market_trade_order_holder(tca_request_list[0], return_cache_handles=return_cache_handles)]
+
+        tca_request = TCARequest(tca_request=tca_request_list[0])
+        tca_request.finish_date = tca_request_list[-1].finish_date
+
+        logger = LoggerManager.getLogger(__name__)
+
+        logger.debug(
+            "Get market and trade/order data for " + str(tca_request.ticker) + " from " + str(tca_request.start_date)
+            + " - " + str(tca_request.finish_date) + " for " + str(len(tca_request_list)) + " chunks")
+
+        market_df = self.get_market_data(tca_request, return_cache_handles=False)
+
+        trade_order_df_dict = {}
+
+        if tca_request.trade_order_mapping is not None:
+            for trade_order_type in tca_request.trade_order_mapping:
+                trade_order_df_dict[trade_order_type] = self.get_trade_order_data(tca_request, trade_order_type,
+                                                                                  return_cache_handles=False)
+
+        market_trade_order_list = []
+
+        # Return as cache handles (which can be easily passed across Celery for example), only if use_multithreading
+        return_cache_handles = return_cache_handles and tca_request.use_multithreading
+
+        if return_cache_handles:
+            volatile_cache = Mediator.get_volatile_cache(volatile_cache_engine=self._volatile_cache_engine)
+
+        for tca_request_chunk in tca_request_list:
+            trade_order_holder = DataFrameHolder()
+
+            for trade_order_type in trade_order_df_dict.keys():
+                trade_order_df = self._strip_start_finish_dataframe(trade_order_df_dict[trade_order_type],
+                                                                    tca_request.start_date, tca_request.finish_date,
+                                                                    tca_request_chunk)
+
+                # Same as when loading chunks without any trades/orders
+                if trade_order_df is not None and trade_order_df.empty:
+                    trade_order_df = None
+
+                if return_cache_handles:
+                    trade_order_df = volatile_cache.put_dataframe_handle(
+                        trade_order_df, use_cache_handles=tca_request.multithreading_params['cache_period_trade_data'])
+
+                trade_order_holder.add_dataframe(trade_order_df, trade_order_type)
+
+            market_df_chunk = self._strip_start_finish_dataframe(market_df, tca_request.start_date,
+                                                                 tca_request.finish_date, tca_request_chunk)
+
+            if return_cache_handles:
+                market_df_chunk = volatile_cache.put_dataframe_handle(
+                    market_df_chunk, use_cache_handles=tca_request.multithreading_params['cache_period_market_data'])
+
+            market_trade_order_list.append((market_df_chunk, trade_order_holder))
+
+        return market_trade_order_list
+
     def get_market_data(self, market_request, return_cache_handles=False):
         # Handles returns a pointer
 
@@ -112,25 +196,22 @@ class TCATickerLoaderImpl(TCATickerLoader):
                 data_store = market_request.data_store
                 data_offset_ms = market_request.data_offset_ms
 
-            # See if we can fetch from the cache (typically Redis)
-            start_date, finish_date, market_key, market_df = \
-                volatile_cache.get_data_request_cache(market_request, data_store, 'market_df',
-                                                     data_offset_ms)
-
-            # If data is already cached, just return the existing CacheHandle (which is like a pointer to the reference
-            # in Redis)
-            if market_df is not None and start_date == old_start_date and finish_date == old_finish_date and return_cache_handles:
-                return CacheHandle(market_key, add_time_expiry=False)
-
-            if market_df is None:
-
+            def fetch_market_data(start_date, finish_date):
                 market_request_copy = MarketRequest(market_request=market_request)
                 market_request_copy.start_date = start_date
                 market_request_copy.finish_date = finish_date
 
-                market_df = super(TCATickerLoaderImpl, self).get_market_data(market_request_copy)
+                return super(TCATickerLoaderImpl, self).get_market_data(market_request_copy)
+
+            # See if we can fetch from the cache (typically Redis), only fetching the missing periods from the database
+            start_date, finish_date, market_key, market_df = \
+                volatile_cache.get_data_request_cache_stitched(market_request, data_store, 'market_df',
+                                                               data_offset_ms, fetch_market_data)
 
-                volatile_cache.put_data_request_cache(market_request_copy, market_key, market_df)
+            # If data is already cached, just return the existing CacheHandle (which is like a pointer to the reference
+            # in Redis)
+            if market_key is not None and start_date == old_start_date and finish_date == old_finish_date and return_cache_handles:
+                return CacheHandle(market_key, add_time_expiry=False)
 
             market_df = self._strip_start_finish_dataframe(market_df, old_start_date, old_finish_date, market_request)
         else:
@@ -169,26 +250,37 @@ class TCATickerLoaderImpl(TCATickerLoader):
         if tca_request.multithreading_params['cache_period_trade_data'] and cache:
             old_start_date = tca_request.start_date; old_finish_date = tca_request.finish_date
 
-            # See if we can fetch from the cache (usually Redis)
-            start_date, finish_date, trade_key, trade_df = \
-                volatile_cache.get_data_request_cache(
-                    tca_request, tca_request.trade_data_store, trade_order_type, tca_request.trade_data_offset_ms)
+            def fetch_trade_order_data(start_date, finish_date):
+                # Call the superclass (get back DataFrames not return_cache_handles)
+                return super(TCATickerLoaderImpl, self).get_trade_order_data(tca_request, trade_order_type,
+                                                                             start_date=start_date,
+                                                                             finish_date=finish_date)
 
-            # If data is already cached, just return the existing CacheHandle
-            if trade_df is not None and start_date == old_start_date and finish_date == old_finish_date:
-                return CacheHandle(trade_key, add_time_expiry=False)
+            fetch_trade_order_data_chunks = None
 
-            # If it wasn't in the cache then fetch it and push into the cache
-            if trade_df is None:
-                logger.debug('Key not found for ' + trade_key + ".. now need to load")
+            if constants.volatile_cache_stream_trade_order_data:
+                def fetch_trade_order_data_chunks(start_date, finish_date):
+                    return super(TCATickerLoaderImpl, self).get_trade_order_data_chunks(tca_request, trade_order_type,
+                                                                                        start_date=start_date,
+                                                                                        finish_date=finish_date)
 
-                # Call the superclass (get back DataFrames not return_cache_handles)
-                trade_df = super(TCATickerLoaderImpl, self).get_trade_order_data(tca_request, trade_order_type,
-                                                                                 start_date=start_date,
-                                                                                 finish_date=finish_date)
+            # Trade/orders where the columns/filters are pushed down into the database query are cached separately
+            fields, filters = self._get_trade_order_push_down(tca_request, trade_order_type)
+            trade_order_tag = trade_order_type
 
-                # Cache this periodic monthly/weekly data
-                volatile_cache.put_data_request_cache(tca_request, trade_key, trade_df)
+            if fields is not None or filters:
+                trade_order_tag = trade_order_tag + '_' + hashlib.md5(str((fields, filters)).encode('utf-8')).hexdigest()
+
+            # See if we can fetch from the cache (usually Redis), if not fetch the missing monthly/weekly periods and
+            # push them into the cache
+            start_date, finish_date, trade_key, trade_df = \
+                volatile_cache.get_data_request_cache_stitched(
+                    tca_request, tca_request.trade_data_store, trade_order_tag, tca_request.trade_data_offset_ms,
+                    fetch_trade_order_data, fetch_chunks_func=fetch_trade_order_data_chunks)
+
+            # If data is already cached, just return the existing CacheHandle
+            if trade_key is not None and start_date == old_start_date and finish_date == old_finish_date:
+                return CacheHandle(trade_key, add_time_expiry=False)
 
             # Strip off the start/finish dates (because when we load from cache, we get full months)
             trade_df = self._strip_start_finish_dataframe(trade_df, start_date, finish_date, tca_request)
@@ -239,14 +331,13 @@ class TCATickerLoaderImpl(TCATickerLoader):
         if market_request.multithreading_params['cache_period_market_data'] and cache:
             volatile_cache = Mediator.get_volatile_cache(volatile_cache_engine=self._volatile_cache_engine)
 
-            start_date, finish_date, market_key, market_df = \
-                volatile_cache.get_data_request_cache(market_request, market_request.data_store, 'market_df',
-                                                      market_request.data_offset_ms)
-
-            if market_df is None:
-                market_df = super(TCATickerLoaderImpl, self)._get_underlying_market_data(start_date, finish_date, market_request)
+            def fetch_market_data(start_date, finish_date):
+                return super(TCATickerLoaderImpl, self)._get_underlying_market_data(start_date, finish_date,
+                                                                                     market_request)
 
-                volatile_cache.put_data_request_cache(market_request, market_key, market_df)
+            start_date, finish_date, market_key, market_df = \
+                volatile_cache.get_data_request_cache_stitched(market_request, market_request.data_store, 'market_df',
+                                                               market_request.data_offset_ms, fetch_market_data)
 
             return self._strip_start_finish_dataframe(market_df, start_date, finish_date, market_request)
         else:
@@ -277,9 +368,7 @@ class TCATickerLoaderImpl(TCATickerLoader):
             market_downsampled_df = self._time_series_ops.downsample_time_series_usable(market_df)
 
             # Combine downsampled market data with trade data
-            fields = ['bid', 'ask', 'open', 'high', 'low', 'close', 'mid', 'vwap', 'twap',
-                      'arrival', 'buy_trade', 'sell_trade', 'notional', 'executed_notional', 'executed_price',
-                      'side']
+            fields = list(constants.sparse_market_trade_fields)
 
             for f in tca_request.extra_lines_to_plot:
                 fields.append(f)
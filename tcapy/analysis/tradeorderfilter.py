@@ -114,6 +114,16 @@ class TradeOrderFilterTag(TradeOrderFilter):
         if tag_value_combinations != {}:
             self._tag = self._util_func.dict_key_list(tag_value_combinations.keys())
 
+    def get_tag_value_combinations(self):
+        """Gets the field/value combinations we are filtering for (eg. so they can be pushed down into a database
+        query)
+
+        Returns
+        -------
+        dict
+        """
+        return self._tag_value_combinations
+
     def filter_trade_order(self, trade_order_df=None, tag_value_combinations={}):
         """Filters a trade/order DataFrame for user defined _tag/value combinations (field values).
 
@@ -23,6 +23,7 @@ from tcapy.analysis.tcaengine import TCAEngineImpl
 from tcapy.analysis.tcarequest import TCARequest
 from tcapy.util.fxconv import FXConv
 from tcapy.util.loggermanager import LoggerManager
+from tcapy.util.mediator import Mediator
 from tcapy.analysis.algos.metric import *
 
 from tcapy.analysis.algos.metric import *
@@ -33,6 +34,7 @@ from tcapy.data.databasesource import DatabaseSourceCSVBinary
 from collections import OrderedDict
 
 tca_engine = TCAEngineImpl()
+volatile_cache = Mediator.get_volatile_cache()
 
 application = Flask(__name__)
 api = Api(application,
@@ -119,7 +121,17 @@ class TCAComputation(Resource):
 
 
                 try:
-                    dict_of_df = tca_engine.calculate_tca(tca_request)
+                    key, dict_of_df = None, None
+
+                    if constants.volatile_cache_share_tca_results:
+                        key, dict_of_df = volatile_cache.get_tca_request_cache(tca_request)
+
+                    if dict_of_df is None:
+                        dict_of_df = tca_engine.calculate_tca(tca_request)
+
+                        if constants.volatile_cache_share_tca_results:
+                            volatile_cache.put_tca_request_cache(key, dict_of_df)
+
                     dict_of_df = UtilFunc().convert_dict_of_dataframe_to_json(dict_of_df)
 
                 except Exception as e:
@@ -65,6 +65,22 @@ def get_market_trade_holder_via_celery(tca_request):
     #return group(get_market_trade_holder_via_celery(_tca_request), get_trade_order_holder_via_celery(_tca_request))
     return tca_ticker_loader.get_market_trade_order_holder(tca_request)
 
+@app.task(name='get_market_trade_holder_list_via_celery')
+def get_market_trade_holder_list_via_celery(tca_request_list):
+    """Gets the both the market data and trade/order data for consecutive date chunks of a TCA calculation (loading them
+    together), as a list of (DataFrame, DataFrameHolder) tuples
+
+    Parameters
+    ----------
+    tca_request_list : TCARequest (list)
+        Consecutive date chunks of a TCA calculation for a single ticker
+
+    Returns
+    ------
+    list of (DataFrame, DataFrameHolder)
+    """
+    return tca_ticker_loader.get_market_trade_order_holder_list(tca_request_list, return_cache_handles=True)
+
 @app.task(name='get_market_data_via_celery')
 def get_market_data_via_celery(market_request):
     """Gets the market data associated with a TCA calculation as DataFrame
@@ -141,3 +157,25 @@ def get_market_trade_holder_and_calculate_metrics_single_ticker_via_celery(tca_r
     #return group(get_market_trade_holder_via_celery(_tca_request), get_trade_order_holder_via_celery(_tca_request))
     return tca_ticker_loader.calculate_metrics_single_ticker(tca_ticker_loader.get_market_trade_order_holder(tca_request),
         tca_request, dummy_market)
+
+@app.task(name='get_market_trade_holder_list_and_calculate_metrics_single_ticker_via_celery')
+def get_market_trade_holder_list_and_calculate_metrics_single_ticker_via_celery(tca_request_list, dummy_market):
+    """Gets the both the market data and trade/order data for consecutive date chunks of a TCA calculation (loading them
+    together), and then calculates the metrics for each chunk
+
+    Parameters
+    ----------
+    tca_request_list : TCARequest (list)
+        Consecutive date chunks of a TCA calculation for a single ticker
+
+    dummy_market : bool
+        Should we put a dummy variable instead of returning market data
+
+    Returns
+    ------
+    list of (DataFrame, DataFrameHolder, str)
+    """
+    market_trade_order_list = tca_ticker_loader.get_market_trade_order_holder_list(tca_request_list)
+
+    return [tca_ticker_loader.calculate_metrics_single_ticker(market_trade_order, tca_request, dummy_market)
+            for market_trade_order, tca_request in zip(market_trade_order_list, tca_request_list)]
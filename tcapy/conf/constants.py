@@ -88,6 +88,10 @@ class Constants(object):
     # 'parquet' (or 'hdf5', but that requires pytables tables Python package installed, which is not done by default)
     binary_default_dump_format = 'parquet'
 
+    # Sidecar manifest in each folder of dumped files (first/last timestamp, rows, tickers and schema of each file), so
+    # wildcard paths only need to open the files which overlap a request
+    file_manifest_name = '_tcapy_manifest.json'
+
     # 'snappy' or 'gzip'
     parquet_compression = 'gzip'
 
@@ -188,6 +192,19 @@ class Constants(object):
     transient_market_impact_gap = {'s': 60}
     permanent_market_impact_gap = {'h': 1}
 
+    ##### Number of ticks in each block of the range indices, used to compute min/max (eg. for BenchmarkBest/BenchmarkWorst)
+    ##### over many trade/order windows at once (smaller blocks use more memory, but mean fewer ticks to scan for short windows)
+    range_index_block_size = 64
+
+    ##### Only calculate the benchmarks/metrics which are needed for the results_form, metric_display and join_tables of a
+    ##### TCARequest (if False, every benchmark/metric is calculated, so they are all in the trade/order output)
+    lazy_calcs = False
+
+    ##### Market and trade/order fields (eg. benchmarks) which are joined together for plotting, for 'detailed' TCA or
+    ##### when summary_display is 'candlestick' (hence these benchmarks are always calculated in those cases)
+    sparse_market_trade_fields = ['bid', 'ask', 'open', 'high', 'low', 'close', 'mid', 'vwap', 'twap', 'arrival',
+                                  'buy_trade', 'sell_trade', 'notional', 'executed_notional', 'executed_price', 'side']
+
     ##### Defining FX conventions ######################################################################################
 
     g10 = ['EUR', 'GBP', 'AUD', 'NZD', 'USD', 'CAD', 'CHF', 'NOK', 'SEK', 'JPY']
@@ -329,6 +346,10 @@ class Constants(object):
                          'sqlite',
                          'arctic-dukascopy', 'arctic-ncfx', 'arctic-testharness',
                          'pystore-dukascopy', 'pystore-ncfx', 'pystore-testharness',
+                         'parquet-dukascopy', 'parquet-ncfx', 'parquet-testharness',
+                         'arrow-dukascopy', 'arrow-ncfx', 'arrow-testharness',
+                         'duckdb',
+                         'duckdb-dukascopy', 'duckdb-ncfx', 'duckdb-testharness',
                          'kdb-testharness',
                          'questdb-dukasacopy', 'questdb-ncfx', 'questdb-testharness'
                          'influxdb-dukasacopy', 'influxdb-ncfx', 'influxdb-testharness']
@@ -376,12 +397,56 @@ class Constants(object):
     # Line chunks to read csv when parsing into database
     csv_read_chunksize = 10 ** 6  # 10 ** 2 # very small chunk size
 
+    # 'pandas' or 'pyarrow' (multithreaded, and much quicker for large CSVs) to read CSVs when parsing into database
+    csv_read_engine = 'pandas'
+
+    # Bytes in each block read by the pyarrow CSV reader (blocks are combined into chunks of csv_read_chunksize lines)
+    csv_pyarrow_block_size = 2 ** 24
+
+    # Threads to tidy CSV chunks whilst earlier chunks are being written to the database (0 to do everything in turn)
+    # and the maximum number of tidied chunks waiting to be written (limits memory usage)
+    csv_pipeline_threads = 2
+    csv_pipeline_queue_size = 4
+
     ### SQL
 
     ## Generic SQL
 
     sql_dump_record_chunksize = 100000
 
+    # Write trade/order data with the native bulk loader of each SQL dialect, in batches of the dump record chunksize
+    # (COPY for Postgres, LOAD DATA LOCAL INFILE for MySQL if mysql_bulk_load_local_infile is set, fast_executemany for
+    # SQL Server and executemany in a single transaction for SQLite), rather than pandas to_sql
+    sql_bulk_load = True
+
+    # Rows fetched at a time (with a server side cursor) when reading from SQL databases, each chunk is converted to the
+    # right types before the next is read, so the whole raw result is never in memory at once (None to read in one go)
+    sql_fetch_chunksize = 100000
+
+    # SQLAlchemy engines are pooled per process and shared by every DatabaseSourceSQL with the same connection string
+    # (and recreated after a fork, eg. in Celery prefork workers, so connections aren't shared with the parent process)
+    sql_engine_pool_size = 20               # Connections kept open in each engine's pool
+    sql_engine_max_overflow = 0             # Extra connections allowed beyond the pool size, when it is exhausted
+    sql_engine_pool_pre_ping = True         # Checks connections are alive before using them (eg. after a DB restart)
+    sql_engine_pool_recycle_seconds = 3600  # Reopen connections older than this (-1 to never), before server timeouts
+
+    # Push the columns needed (when lazy_calcs is set) and the venue, event_type and TradeOrderFilterTag filters (eg.
+    # broker_id, algo_id) for trade/order data down into parameterized SQL queries, rather than selecting every column
+    # and filtering afterwards in pandas
+    sql_trade_order_push_down = True
+
+    # Columns which are always selected for trades/orders (used internally by tcapy), alongside those needed by the
+    # benchmarks, metrics, results forms and filters of a TCARequest - add any others your own calculations need
+    sql_trade_order_core_fields = ['date', 'id', 'ticker', 'side', 'notional', 'notional_currency', 'order_notional',
+                                   'executed_notional', 'executed_notional_currency', 'executed_price',
+                                   'ancestor_pointer_id', 'event_type', 'venue', 'broker_id', 'algo_id', 'price_limit',
+                                   'arrival_price', 'market_bid', 'market_mid', 'market_ask',
+                                   'benchmark_date_start', 'benchmark_date_end']
+
+    # Trade/order tables are indexed on date and on (ticker, date), which every trade/order query filters on, with
+    # additional (ticker, tag, date) indices for these commonly filtered tags (if they are columns of the table)
+    sql_trade_order_index_tags = ['venue', 'broker_id']
+
     ## SQL Server specific
     ms_sql_server_host = docker_var('$MS_SQL_SERVER_HOST', 'localhost', default_value='sqlserver')
     ms_sql_server_port = docker_var('$MS_SQL_SERVER_HOST', '1433')
@@ -429,6 +494,11 @@ class Constants(object):
 
     mysql_dump_record_chunksize = 10000    # Making the chunk size very big for MySQL can slow down inserts significantly
 
+    # Bulk load trade/order data into MySQL with LOAD DATA LOCAL INFILE (when sql_bulk_load is set), which needs
+    # local_infile=ON on the server (OFF by default from MySQL 8). Otherwise (or if the server rejects it), we use
+    # batched executemany
+    mysql_bulk_load_local_infile = False
+
     mysql_trade_order_mapping = \
         {'trade_df' : 'trade_database.trade',     # Name of the table which holds broker messages to clients
          'order_df' : 'trade_database.order'}     # Name of the table which has orders from client
@@ -446,6 +516,33 @@ class Constants(object):
     pystore_data_store = 'tcapy_store'
     pystore_market_data_database_table = 'market_data_table'
 
+    ### Parquet dataset settings (market data on disk, partitioned by ticker/year/month)
+    parquet_dataset_path = '/data/parquet_dataset'
+
+    parquet_dataset_market_data_database_table = 'market_data_table'
+
+    # Rows in each row group of the Parquet files, the min/max dates of each row group are used to skip those outside the
+    # dates of a query (so smaller row groups mean less is read for short queries, but larger files)
+    parquet_dataset_row_group_size = 100000
+
+    ### Arrow settings (market data on disk in memory mapped Arrow IPC/Feather v2 files, one for each ticker)
+    arrow_path = '/data/arrow'
+
+    arrow_market_data_database_table = 'market_data_table'
+
+    ### DuckDB settings (market and trade/order data in an embedded DuckDB database file, or querying Parquet files)
+    duckdb_database = '/data/duckdb/tcapy.duckdb'
+
+    duckdb_market_data_database_table = 'market_data_table'
+
+    # Only one process can open a DuckDB database file for writing, so set to True for processes which only read from it
+    # (eg. Celery workers)
+    duckdb_read_only = False
+
+    duckdb_trade_order_mapping = \
+        {'trade_df' : 'trade_table',    # Name of the table which holds broker messages to clients
+         'order_df' : 'order_table'}    # Name of the table which has orders from client
+
     ### Arctic/MongoDB
     arctic_host = docker_var("$MONGO_HOST", '127.0.0.1', default_value='mongo')
     arctic_port = docker_var("$MONGO_PORT", 27017, default_value=27017)
@@ -579,6 +676,10 @@ class Constants(object):
                              # Return market data internally as handles (usually necessary for Celery)
                              'return_cache_handles_market_data' : True,
 
+                             # Number of consecutive date chunks each Celery task loads together, fetching all their
+                             # cached periods in a single call (1 loads every chunk in its own task)
+                             'chunks_per_task': 8,
+
                              # Recommend using Celery, which allows us to reuse Python processes
                              # 'single' should only be used for debugging purposes
                              'parallel_library': 'celery'
@@ -587,7 +688,7 @@ class Constants(object):
     ##### Volatile cache settings ##########################################################################################
 
     # Note that if you change any of these settings, make sure to empty the in-memory cache
-    volatile_cache_engine = 'redis' # 'redis' (TODO 'plasma')
+    volatile_cache_engine = 'redis' # 'redis' or 'shared_memory' (only for processes on the same host, needs POSIX)
 
     # Redis settings (for internal usage - not Celery message broker - those settings need to be specified seperately)
     volatile_cache_host_redis = docker_var('$REDIS_HOST', 'localhost', default_value='redis')
@@ -601,17 +702,67 @@ class Constants(object):
     # Expiry time for user data (60 minutes)
     volatile_cache_expiry_seconds = 60 * 60
 
+    # Keep DataFrames fetched from the volatile cache in an in-process LRU cache too (expires after
+    # volatile_cache_expiry_seconds), which avoids fetching/deserializing them again. Note, this is only invalidated when
+    # keys are overwritten/deleted within the same process
+    volatile_cache_local = False
+    volatile_cache_local_max_size_mb = 1024
+
     # Note: msgpack is slightly faster, but is not supported in Pandas in later versions
-    # at current stage arrow is not fully tested
-    volatile_cache_redis_format = 'arrow' # 'msgpack' or 'arrow'
+    # 'arrow' stores each chunk as a Parquet file, whilst 'arrow_ipc' uses Arrow IPC streams, which are much quicker to
+    # deserialize (and are decompressed in parallel)
+    volatile_cache_redis_format = 'arrow_ipc' # 'msgpack', 'arrow' or 'arrow_ipc'
 
     volatile_cache_redis_compression = {'msgpack': 'blosc',
-                                        'arrow': 'gzip'} # 'lz4' or 'snappy'
+                                        'arrow': 'gzip', # 'lz4' or 'snappy'
+                                        'arrow_ipc': 'lz4'} # 'lz4' or 'zstd'
+
+    # Number of threads to use when deserializing chunks of DataFrames
+    volatile_cache_redis_decode_threads = 4
+
+    # For 'arrow_ipc', encode market tick data (timestamps as delta-of-delta and prices as integer offsets), which makes
+    # it much more compressible
+    volatile_cache_delta_encode_market_data = True
+
+    delta_encode_fields = ['bid', 'ask', 'mid']
+    delta_encode_max_decimals = 8 # Prices with more decimal places than this are not encoded
 
     # Above this size we need to break apart our keys into different chunks before pushing into Redis
     # Redis has a maximum size of what we can store in a single value (512 is maximum, can tweak lower)
     volatile_cache_redis_max_cache_chunk_size_mb = 500
 
+    # Shared memory settings (if volatile_cache_engine is 'shared_memory')
+    volatile_cache_shm_path = '/dev/shm' # Where shared memory segments are listed
+    volatile_cache_shm_prefix = 'tcapy_' # Prefix of the shared memory segments names
+    volatile_cache_shm_max_size_mb = 4096 # Total size of all the segments, before evicting least recently used
+
+    # If True, DataFrames read from shared memory point directly to it (rather than copying), but they are read only
+    volatile_cache_shm_zero_copy = False
+
+    # Number of keys to fetch/delete in each batch when scanning Redis for keys to clear (eg. for a session)
+    volatile_cache_redis_scan_count = 1000
+
+    # When several callers need the same market/trade data which isn't in the cache, only the first loads it from the
+    # database (holding a lease, in Redis if available), whilst the others wait for it to be published to the cache
+    volatile_cache_lease_expiry_seconds = 300 # In case the caller loading the data dies
+    volatile_cache_lease_wait_seconds = 300 # After this, callers will load the data themselves
+    volatile_cache_lease_poll_seconds = 0.1
+
+    # When filling gaps in the cache, gaps longer than this number of periods (eg. days) are fetched from the database in
+    # blocks of this many periods, with each period pushed into the cache as soon as it is complete
+    volatile_cache_fetch_block_periods = 31
+
+    # Stream trade/order data from SQL databases in chunks of sql_fetch_chunksize rows when filling gaps in the cache,
+    # pushing each period into the cache as soon as it is complete, rather than fetching (and concatenating) the whole
+    # gap in one go, which reduces the peak memory of large (eg. multi-year) requests
+    volatile_cache_stream_trade_order_data = False
+
+    # Share the output of TCAEngine between sessions/API calls (expiring after volatile_cache_expiry_seconds), for
+    # identical TCARequests, provided the underlying data stores haven't been written to since (by DataDumper,
+    # DatabasePopulator or the DatabaseSource writers). Only enable if all data is written via tcapy, otherwise data written
+    # by other processes (eg. an OMS writing trades into SQL) won't be seen until the shared output expires
+    volatile_cache_share_tca_results = False
+
     ##### celery settings ##################################################################################################
 
     # Make sure the broker/result backends are properly setup, ie. need Redis and memcached to be installed
@@ -738,7 +889,8 @@ class Constants(object):
             ### trade order mapping
             self.trade_order_mapping = {'mysql': self.mysql_trade_order_mapping,
                                         'ms_sql_server': self.ms_sql_server_trade_order_mapping,
-                                        'sqlite' : self.sqlite_trade_order_mapping
+                                        'sqlite' : self.sqlite_trade_order_mapping,
+                                        'duckdb' : self.duckdb_trade_order_mapping
                                         }
 
             ### these are the FX crosses which are available in each set of market data
@@ -749,6 +901,15 @@ class Constants(object):
                                         'pystore-ncfx': self.ncfx_tickers,
                                         'pystore-dukascopy': self.dukascopy_tickers,
                                         'pystore-testharness': self.test_harness_tickers,
+                                        'parquet-ncfx': self.ncfx_tickers,
+                                        'parquet-dukascopy': self.dukascopy_tickers,
+                                        'parquet-testharness': self.test_harness_tickers,
+                                        'arrow-ncfx': self.ncfx_tickers,
+                                        'arrow-dukascopy': self.dukascopy_tickers,
+                                        'arrow-testharness': self.test_harness_tickers,
+                                        'duckdb-ncfx': self.ncfx_tickers,
+                                        'duckdb-dukascopy': self.dukascopy_tickers,
+                                        'duckdb-testharness': self.test_harness_tickers,
                                         'influxdb-ncfx' : self.ncfx_tickers,
                                         'influxdb-dukascopy': self.dukascopy_tickers,
                                         'influxdb-testharness' : self.test_harness_tickers,
@@ -19,6 +19,7 @@ import glob
 
 from tcapy.conf.constants import Constants
 from tcapy.data.databasesource import AccessControl
+from tcapy.data.filemanifest import FileManifest
 from tcapy.util.timeseries import TimeSeriesOps
 from tcapy.util.loggermanager import LoggerManager
 
@@ -418,6 +419,9 @@ class DatabasePopulator(ABC):
                                 # Temporary cache for testing purposes (also if the process crashes, we can read this back in)
                                 UtilFunc().write_dataframe_to_binary(df, filename, format=binary_format)
 
+                                # So wildcard reads of the folder can skip files outside their dates
+                                FileManifest().update_file(filename, df, tickers=ticker)
+
             if df is not None:
                 # Assume UTC time (don't want to mix UTC and non-UTC in database!)
                 df = self._time_series_ops.localize_as_UTC(df)
@@ -430,9 +434,15 @@ class DatabasePopulator(ABC):
                               (str(df.index[0]) + str(df.index[-1])).replace(":", '_').replace(" ", '_')
 
                         if csv_compression is 'gzip':
-                            df.to_csv(os.path.join(csv_folder, ticker + key + ".csv.gz"), compression='gzip')
+                            filename = os.path.join(csv_folder, ticker + key + ".csv.gz")
+
+                            df.to_csv(filename, compression='gzip')
                         else:
-                            df.to_csv(os.path.join(csv_folder, ticker +  key + ".csv"))
+                            filename = os.path.join(csv_folder, ticker +  key + ".csv")
+
+                            df.to_csv(filename)
+
+                        FileManifest().update_file(filename, df, tickers=ticker)
 
             if return_df:
                 df_dict[ticker] = df
@@ -470,6 +480,9 @@ class DatabasePopulator(ABC):
                 msg_list.append("No downloaded data for " + str(start_date) + " - " + str(finish_date)
                                 + ". Is this a holiday?")
 
+        if write_to_disk_db:
+            self._invalidate_tca_request_cache()
+
         # Returns a status containing any failed downloads, which can be read by a user
         return msg_list, df_dict
 
@@ -660,6 +673,14 @@ class DatabasePopulator(ABC):
             for i in range(0, len(tickers)):
                 self._write_df_to_db_single_thread(tickers[i], remove_duplicates, if_exists_table, if_exists_ticker)
 
+        self._invalidate_tca_request_cache()
+
+    def _invalidate_tca_request_cache(self):
+        """Makes sure any cached TCA output which used this market data isn't shared anymore, now it has changed
+        """
+        if self._data_store is not None:
+            Mediator.get_volatile_cache().invalidate_tca_request_cache(self._data_store)
+
     def _write_df_to_db_single_thread(self, ticker, remove_duplicates=True, if_exists_table='append',
                                       if_exists_ticker='replace'):
 
@@ -12,19 +12,28 @@ import abc
 import pandas as pd
 import numpy as np
 import glob
+import io
 import os
+import queue
+import shutil
+import threading
+import uuid
 
 import datetime
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import sqlalchemy
 
-from sqlalchemy import MetaData, Column, Table
+from sqlalchemy import MetaData, Column, Table, Index
 from sqlalchemy import String, DateTime, event, create_engine
 
 # CSVBinary
 import base64, io
 
 # SQL
+from sqlalchemy.pool import NullPool
 from sqlalchemy.sql import text
 
 # Arctic
@@ -73,6 +82,7 @@ from tcapy.analysis.tcarequest import MarketRequest, TradeRequest
 from tcapy.conf.constants import Constants
 
 from tcapy.data.accesscontrol import AccessControl
+from tcapy.data.filemanifest import FileManifest
 
 from tcapy.util.mediator import Mediator
 from tcapy.util.loggermanager import LoggerManager
@@ -187,6 +197,17 @@ class DatabaseSource(ABC):
     def append_trade_data(self, trade_df):
         raise Exception("Not implemented")
 
+    def _invalidate_tca_request_cache(self, data_store):
+        """Makes sure any cached TCA output which used this type of data store (eg. 'parquet', which covers
+        'parquet-ncfx' etc.) isn't shared anymore, now its data has changed
+
+        Parameters
+        ----------
+        data_store : str
+            Type of data store (eg. 'parquet' or 'mysql')
+        """
+        Mediator.get_volatile_cache().invalidate_tca_request_cache(data_store)
+
     def append_market_data(self, market_df, ticker):
         """Appends market data to the database for a particular ticker.
 
@@ -613,8 +634,14 @@ class DatabaseSourcePicker(object):
                                                     password=access_control.clickhouse_password)
             elif data_store == 'pystore':
                 database_source = DatabaseSourcePyStore(postfix=postfix)
+            elif data_store == 'parquet':
+                database_source = DatabaseSourceParquet(postfix=postfix)
+            elif data_store == 'arrow':
+                database_source = DatabaseSourceArrow(postfix=postfix)
+            elif data_store == 'duckdb':
+                database_source = DatabaseSourceDuckDB(postfix=postfix)
             elif 'csv' in data_store or '.h5' in data_store or '.gzip' in data_store or '.parquet' in data_store:
-                if os.path.isfile(data_store):
+                if os.path.isfile(data_store) or '*' in data_store:
                     if isinstance(data_request, MarketRequest):
                         database_source = DatabaseSourceCSVBinary(market_data_database_csv=data_store)
                     elif isinstance(data_request, TradeRequest):
@@ -636,7 +663,9 @@ class DatabaseSourcePicker(object):
 ########################################################################################################################
 
 class DatabaseSourceCSV(DatabaseSource):
-    """Implements DatabaseSource for CSV datasets, both for market and trade/order data.
+    """Implements DatabaseSource for CSV datasets, both for market and trade/order data. Paths can have wildcards
+    (eg. /data/csv_dump/EURUSD_*.csv), in which case only the files which overlap the request are read (in time order),
+    using the FileManifest of their folder.
 
     """
 
@@ -647,13 +676,19 @@ class DatabaseSourceCSV(DatabaseSource):
         self._market_data_database_csv = market_data_database_csv
         self._trade_data_database_csv = trade_data_database_csv
 
+        self._file_manifest = FileManifest()
+
     def fetch_market_data(self, start_date=None, finish_date=None, ticker=None, table_name=None, date_format=None):
         start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
 
         if table_name is None:
             table_name = self._market_data_database_csv
 
-        df = self._fetch_table(table_name, date_format=date_format)
+        df = self._fetch_table_files(table_name, start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                     date_format=date_format)
+
+        if df is None:
+            return None
 
         if start_date != None:
             try:
@@ -692,7 +727,11 @@ class DatabaseSourceCSV(DatabaseSource):
         if table_name is None:
             table_name = self._trade_data_database_csv
 
-        df = self._fetch_table(table_name, date_format=date_format)
+        df = self._fetch_table_files(table_name, start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                     date_format=date_format)
+
+        if df is None:
+            return None
 
         if start_date != None:
             try:
@@ -714,6 +753,59 @@ class DatabaseSourceCSV(DatabaseSource):
 
         return self._downsample_localize_utc(df)
 
+    def _fetch_table_files(self, csv_file_path, start_date=None, finish_date=None, ticker=None, date_format=None):
+        """Reads a file, or if the path has wildcards, only those files which overlap with the dates/ticker (according
+        to the manifest of their folder, which is rebuilt for any new or modified files), in time order
+
+        Parameters
+        ----------
+        csv_file_path : str
+            Path of the file(s)
+
+        start_date : pd.Timestamp
+            Start date
+
+        finish_date : pd.Timestamp
+            Finish date
+
+        ticker : str
+            Ticker
+
+        date_format : str
+            Format of the dates
+
+        Returns
+        -------
+        DataFrame
+        """
+        if '*' not in csv_file_path:
+            return self._fetch_table(csv_file_path, date_format=date_format)
+
+        # Don't read any files twice, if we need to read them when rebuilding the manifest
+        df_dict = {}
+
+        def read_func(path):
+            df_dict[path] = self._fetch_table(path, date_format=date_format)
+
+            return df_dict[path]
+
+        file_list = self._file_manifest.get_files(csv_file_path, read_func, start_date=start_date,
+                                                  finish_date=finish_date, ticker=ticker)
+
+        LoggerManager.getLogger(__name__).debug("Reading " + str(len(file_list)) + " files for " + csv_file_path)
+
+        if file_list == []:
+            return None
+
+        df = pd.concat([df_dict[f] if f in df_dict else self._fetch_table(f, date_format=date_format)
+                        for f in file_list])
+
+        # In case files overlap in time
+        if not(df.index.is_monotonic_increasing):
+            df = df.sort_index(kind='mergesort')
+
+        return df
+
     def _fetch_table(self, csv_file_path, date_format=None):
 
         # with a CSV path from disk
@@ -843,8 +935,19 @@ class DatabaseSourceSQL(DatabaseSource):
     """Abstract class for fetching market/trade data from an SQL style database. This needs to be implemented for the
     SQL database type which you use (eg. MySQL, SQL Server etc.)
 
+    SQLAlchemy engines (and their connection pools) are shared across the process, keyed by connection string, rather
+    than being created and disposed for every query.
+
     """
 
+    # Process wide registry of connection string -> (pid, Engine), and databases we've already checked exist
+    _engine_pool = {}
+    _engine_pool_databases = set()
+    _engine_pool_lock = threading.Lock()
+
+    # Columns of each (connection string, table), used when projecting/filtering trade/order queries
+    _table_columns = {}
+
     def __init__(self, server_host=None, server_port=None, username=None, password=None, trade_data_database_name=None):
         """Initialises SQL object.
 
@@ -895,9 +998,67 @@ class DatabaseSourceSQL(DatabaseSource):
         """
         pass
 
+    def _get_pooled_engine(self, con_exp):
+        """Gets the SQLAlchemy engine for a connection string from the process wide registry, creating it if it doesn't
+        exist yet. If the process has been forked since the engine was created (eg. Celery prefork workers), a new engine
+        is created, so the child doesn't share pooled connections with its parent.
+
+        Parameters
+        ----------
+        con_exp : str
+            Connection string
+
+        Returns
+        -------
+        Engine
+        """
+        pid = os.getpid()
+
+        with DatabaseSourceSQL._engine_pool_lock:
+            if con_exp in DatabaseSourceSQL._engine_pool:
+                engine_pid, engine = DatabaseSourceSQL._engine_pool[con_exp]
+
+                if engine_pid == pid:
+                    return engine
+
+                # Inherited from the parent process, so drop the pool without closing the parent's connections
+                try:
+                    engine.dispose(close=False)
+                except TypeError:
+                    pass
+
+                DatabaseSourceSQL._engine_pool_databases.clear()
+
+            engine = self._create_engine(con_exp)
+
+            DatabaseSourceSQL._engine_pool[con_exp] = (pid, engine)
+
+        return engine
+
+    def _create_engine(self, con_exp, **kwargs):
+        """Creates a pooled SQLAlchemy engine for a connection string, with the pool parameters from constants.
+
+        Parameters
+        ----------
+        con_exp : str
+            Connection string
+
+        kwargs : dict
+            Any other arguments for create_engine (eg. connect_args)
+
+        Returns
+        -------
+        Engine
+        """
+        return create_engine(con_exp, pool_size=constants.sql_engine_pool_size,
+                             max_overflow=constants.sql_engine_max_overflow,
+                             pool_pre_ping=constants.sql_engine_pool_pre_ping,
+                             pool_recycle=constants.sql_engine_pool_recycle_seconds, **kwargs)
+
     def fetch_trade_order_data(self, start_date=None, finish_date=None, ticker=None, table_name=None,
-                               database_name=None):
-        """Fetches trade/order data from an SQL database and returns as a DataFrame
+                               database_name=None, fields=None, filters=None):
+        """Fetches trade/order data from an SQL database and returns as a DataFrame. The dates, ticker and any filters
+        are passed as parameters to the SQL query.
 
         Parameters
         ----------
@@ -916,46 +1077,184 @@ class DatabaseSourceSQL(DatabaseSource):
         database_name : str
             Database containing trade/order data
 
+        fields : str (list)
+            Columns to select (default: None - all columns), any which aren't in the table are ignored
+
+        filters : list of (str, str (list))
+            Columns and the values to keep for each of them, eg. [('venue', ['venue1', 'venue2'])] - any columns which
+            aren't in the table are ignored
+
         Returns
         -------
         DataFrame
         """
+        logger = LoggerManager.getLogger(__name__)
+
+        # If the query fails part way through, return nothing, rather than a truncated set of trades/orders
+        try:
+            df_list = list(self.fetch_trade_order_data_chunks(start_date=start_date, finish_date=finish_date,
+                                                              ticker=ticker, table_name=table_name,
+                                                              database_name=database_name, fields=fields,
+                                                              filters=filters))
+        except Exception as e:
+            logger.error("Error fetching trade/order data for " + str(ticker) + ": " + str(e))
+
+            return None
+
+        if df_list == []:
+            return None
+
+        if len(df_list) == 1:
+            return df_list[0]
+
+        return pd.concat(df_list)
+
+    def fetch_trade_order_data_chunks(self, start_date=None, finish_date=None, ticker=None, table_name=None,
+                                      database_name=None, fields=None, filters=None, chunksize=None):
+        """Fetches trade/order data from an SQL database as a generator of DataFrames, ordered by date, each of which
+        has at most chunksize rows and has already been converted to the right types. Hence, large queries (eg.
+        multi-year compliance pulls) don't need to have the whole result in memory at once. When
+        constants.volatile_cache_stream_trade_order_data is set, TCATickerLoaderImpl writes these chunks straight into
+        the volatile cache, period by period (see DataFactory.fetch_table_chunks).
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be collected
+
+        table_name : str
+            Table containing this particular trade/order data
+
+        database_name : str
+            Database containing trade/order data
+
+        fields : str (list)
+            Columns to select (default: None - all columns), any which aren't in the table are ignored
+
+        filters : list of (str, str (list))
+            Columns and the values to keep for each of them, eg. [('venue', ['venue1', 'venue2'])] - any columns which
+            aren't in the table are ignored
+
+        chunksize : int
+            Maximum number of rows in each chunk (default: constants.sql_fetch_chunksize)
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        if database_name is None:
+            database_name = self._trade_data_database_name
+
+        sql_query, params = self._create_trade_order_query(start_date=start_date, finish_date=finish_date,
+                                                           ticker=ticker, table_name=table_name,
+                                                           database_name=database_name, fields=fields, filters=filters)
+
+        for df in self._fetch_table_chunks(database_name, table_name, sql_query, params=params, chunksize=chunksize):
+            df = self._downsample_localize_utc(df)
+
+            yield self._convert_type_columns(df)
+
+    def _create_trade_order_query(self, start_date=None, finish_date=None, ticker=None, table_name=None,
+                                  database_name=None, fields=None, filters=None):
+        """Creates a parameterized SQL query for trade/order data (ordered by date)
+
+        Returns
+        -------
+        str, dict
+        """
         start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
 
-        sql_query = 'select * '
+        # Only need to look up the columns of the table if we are projecting or filtering
+        table_columns = None
+
+        if fields is not None or filters is not None:
+            table_columns = self._get_table_columns(database_name, table_name)
+
+        select_clause = '*'
+
+        if fields is not None and table_columns is not None:
+            select_clause = ', '.join([self._reserved_keywords(c) for c in table_columns if c in fields])
 
         where_clause = ''
+        params = {}
 
         # Create start date condition as part of WHERE clause
         # Note different dialects of SQL have different way to deal with reserved keywords
         # - [date] for SQL Server
         # - MySQL
         if start_date is not None:
-            where_clause = self._combine_where_clause(where_clause, "(" + self._reserved_keywords('date') + " >= '"
-                                                      + self._format_date_time_milliseconds(start_date) + "')")
+            where_clause = self._combine_where_clause(where_clause, "(" + self._reserved_keywords('date') + " >= :start_date)")
+            params['start_date'] = self._format_date_time_milliseconds(start_date)
 
         # Create start date condition as part of WHERE clause
         if finish_date is not None:
-            where_clause = self._combine_where_clause(where_clause, "(" + self._reserved_keywords('date') + " <= '"
-                                                      + self._format_date_time_milliseconds(finish_date) + "')")
+            where_clause = self._combine_where_clause(where_clause, "(" + self._reserved_keywords('date') + " <= :finish_date)")
+            params['finish_date'] = self._format_date_time_milliseconds(finish_date)
 
         # Ensure ticker is also selected
         if ticker is not None:
-            where_clause = self._combine_where_clause(where_clause, "(ticker = '" + ticker + "')")
+            where_clause = self._combine_where_clause(where_clause, "(ticker = :ticker)")
+            params['ticker'] = ticker
+
+        # Filter for columns which are in any of the specified values (eg. venue)
+        if filters is not None and table_columns is not None:
+            for j, (column, values) in enumerate(filters):
+                if column in table_columns:
+                    if not(isinstance(values, list)):
+                        values = [values]
+
+                    param_names = ['filter_' + str(j) + '_' + str(i) for i in range(0, len(values))]
+
+                    where_clause = self._combine_where_clause(where_clause, "(" + self._reserved_keywords(column)
+                                                              + " in (" + ', '.join([':' + p for p in param_names]) + "))")
+                    params.update(zip(param_names, values))
 
         if where_clause != '':
             where_clause = 'where ' + where_clause
 
-        if database_name is None:
-            database_name = self._trade_data_database_name
+        sql_query = 'select ' + select_clause + ' from ' + self._wrap_table_name_sql_query(table_name) + ' ' \
+                    + where_clause + ' order by ' + self._reserved_keywords('date')
 
-        sql_query = sql_query + ' from ' + self._wrap_table_name_sql_query(table_name) + ' ' + where_clause
+        return sql_query, params
 
-        df = self._fetch_table(database_name, table_name, sql_query)
-        df = self._downsample_localize_utc(df)
-        df = self._convert_type_columns(df)
+    def _get_table_columns(self, database_name, table_name):
+        """Gets the columns of an SQL table (which are cached, until we write to the database)
 
-        return df
+        Parameters
+        ----------
+        database_name : str
+            Database name
+
+        table_name : str
+            Table name
+
+        Returns
+        -------
+        str (list)
+        """
+        engine, con_str = self._get_database_engine(database_name=database_name, table_name=table_name)
+
+        key = (con_str, table_name)
+
+        if key not in DatabaseSourceSQL._table_columns:
+            schema, sqlalchemy_table_name = self._split_schema_table_name(table_name)
+
+            try:
+                DatabaseSourceSQL._table_columns[key] = [c['name'] for c in
+                    sqlalchemy.inspect(engine).get_columns(sqlalchemy_table_name, schema=schema)]
+            except Exception as e:
+                LoggerManager.getLogger(__name__).warning("Couldn't get columns of " + str(table_name)
+                                                          + ", so selecting all columns: " + str(e))
+
+                return None
+
+        return DatabaseSourceSQL._table_columns[key]
 
     def _combine_where_clause(self, where_clause, new_where):
         """Appends conditions to an existing SQL WHERE clause
@@ -990,7 +1289,7 @@ class DatabaseSourceSQL(DatabaseSource):
     def _wrap_table_name_sql_query(self, table_name):
         return table_name
 
-    def _fetch_table(self, database_name, table, sql_query):
+    def _fetch_table(self, database_name, table, sql_query, params=None):
         """Fetches data from SQL database as a pd DataFrame
 
         Parameters
@@ -1004,34 +1303,88 @@ class DatabaseSourceSQL(DatabaseSource):
         sql_query : str
             SQL string used for fetching data
 
+        params : dict
+            Parameters which are bound to the SQL query (eg. :start_date)
+
         Returns
         -------
         DataFrame
         """
         logger = LoggerManager.getLogger(__name__)
 
+        try:
+            df_list = list(self._fetch_table_chunks(database_name, table, sql_query, params=params))
+        except Exception as e:
+            logger.error("Error fetching " + self._sql_dialect + " query: " + str(e))
+
+            return None
+
+        if df_list == []:
+            return None
+
+        if len(df_list) == 1:
+            return df_list[0]
+
+        return pd.concat(df_list)
+
+    def _fetch_table_chunks(self, database_name, table, sql_query, params=None, chunksize=None):
+        """Fetches data from SQL database as a generator of DataFrames, using a server side cursor (where the database
+        driver supports it), so the whole result isn't held in memory at once
+
+        Parameters
+        ----------
+        database_name : str
+            Database name
+
+        table : str
+            Table stored data
+
+        sql_query : str
+            SQL string used for fetching data
+
+        params : dict
+            Parameters which are bound to the SQL query (eg. :start_date)
+
+        chunksize : int
+            Maximum number of rows in each chunk (default: constants.sql_fetch_chunksize, if None the whole result is
+            fetched as one chunk)
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        if chunksize is None:
+            chunksize = constants.sql_fetch_chunksize
+
         # Connect to database
         engine, con_str = self._get_database_engine(database_name=database_name, table_name=table)
 
-        df = None
+        records = 0
 
-        try:
-            df = pd.read_sql(sql_query, engine)  # , coerce_float=False)
+        # Any errors (including part way through the result) are raised to the caller, so it can't mistake a truncated
+        # result for the whole one (eg. caching the remaining periods as empty)
+        with engine.connect() as con:
+            con = con.execution_options(stream_results=True)
 
-            engine.dispose()
+            if params is None:
+                df_chunks = pd.read_sql(sql_query, con, chunksize=chunksize)  # , coerce_float=False)
+            else:
+                df_chunks = pd.read_sql(text(sql_query), con, params=params, chunksize=chunksize)
 
-            records = 0
+            if chunksize is None:
+                df_chunks = [df_chunks]
 
-            if df is not None:
-                records = len(df.index)
+            for df in df_chunks:
+                records = records + len(df.index)
 
-            logger.debug('Excecuted ' + self._sql_dialect + ' query: ' + sql_query + ", " + str(records) + " returned")
+                yield df
 
-        except Exception as e:
-            logger.error("Error fetching " + self._sql_dialect + " query: " + str(e))
+        logger.debug('Excecuted ' + self._sql_dialect + ' query: ' + sql_query + " " + str(params) + ", "
+                     + str(records) + " returned")
 
         # Careful: don't ask for too many dates at once, otherwise could make the database roll over
-        return df
 
     def convert_csv_to_table(self, csv_file, ticker, table_name, database_name=None,
                              if_exists_table='replace',
@@ -1141,31 +1494,26 @@ class DatabaseSourceSQL(DatabaseSource):
             # print(df.dtypes)
             self._write_to_db(df, engine, table_name_tick, if_exists_table, market_trade_data)
 
+        # Any cached TCA output which used these trades/orders is now out of date
+        self._invalidate_tca_request_cache(self._sql_dialect)
+
     def append_trade_data(self, trade_df, table_name, database_name, if_exists_table='replace',
                           if_exists_ticker='replace', market_trade_data='trade'):
 
         # Get database connection
         engine, con_str = self._get_database_engine(database_name=database_name)
 
-        self._write_to_db(trade_df, engine, table_name, database_name, if_exists_table=if_exists_table,
-                          if_exists_ticker=if_exists_ticker, market_trade_data=market_trade_data)
+        report = self._write_to_db(trade_df, engine, table_name, if_exists_table, market_trade_data)
 
-        engine.close()
+        # Any cached TCA output which used these trades/orders is now out of date
+        self._invalidate_tca_request_cache(self._sql_dialect)
+
+        return report
 
     def _write_to_db(self, df, engine, table_name_tick, if_exists_table, market_trade_data):
         logger = LoggerManager.getLogger(__name__)
 
-        schema = None
-
-        # SQLAlchemy may put double [] around a table name (which causes SQL syntax error), so remove that from
-        # the initial table name supplied
-        # eg. CREATE TABLE [[dbo].[trade]] ... WRONG
-        # but we need to extract the schema from this to add as an additional parameter to give later to SQLAlchemy
-        if '.' in table_name_tick:
-            schema = self._replace_table_name_chars(table_name_tick.split(".")[0])
-            sqlalchemy_table_name_tick = self._replace_table_name_chars(table_name_tick.split(".")[1])
-        else:
-            sqlalchemy_table_name_tick = table_name_tick
+        schema, sqlalchemy_table_name_tick = self._split_schema_table_name(table_name_tick)
 
         logger.debug("About to write to " + self._sql_dialect + " database...")
 
@@ -1267,14 +1615,11 @@ class DatabaseSourceSQL(DatabaseSource):
             print(str(e))
             logger.warning("Primary key already exists...")
 
-        try:
-            result = con.execute(
-                text('CREATE INDEX ' + table_name_tick + '_idx_date ON ' + table_name_tick + '('+ self._reserved_keywords('date') + ' ASC)'))
-        except:
-            logger.warning("Index already exists...")
-
         con.close()
 
+        # Create any indices on date, (ticker, date) etc. which aren't already there
+        self._create_indices(engine, table_name_tick)
+
         # Just before dumping to database check data columns
         self._check_data_integrity(df, market_trade_data=market_trade_data)
 
@@ -1283,69 +1628,342 @@ class DatabaseSourceSQL(DatabaseSource):
         # df.to_sql(sqlalchemy_table_name_tick, engine, if_exists='append', index=True,
         #          schema=schema, method=self._default_multi, chunksize=constants.sql_dump_record_chunksize)
         # This will fail if we try to insert the *SAME* trades/orders, which have the same dates/id/_tickers
-        df.to_sql(sqlalchemy_table_name_tick, engine, if_exists='append', index=True,
-                  schema=schema, chunksize=self._sql_dump_record_chunksize)
+        if constants.sql_bulk_load:
+            report = self._bulk_insert(df, engine, table_name_tick)
+        else:
+            df.to_sql(sqlalchemy_table_name_tick, engine, if_exists='append', index=True,
+                      schema=schema, chunksize=self._sql_dump_record_chunksize)
 
-        engine.dispose()
+            report = None
 
-    # def _write_df_to_sql(self, df, sqlalchemy_table_name_tick, engine, schema):
-    #
-    #     # This will fail if we try to insert the *SAME* trades/orders, which have the same dates/id/_tickers
-    #     df.to_sql(sqlalchemy_table_name_tick, engine, if_exists='append', index=True,
-    #               schema=schema, method=self._default_multi, chunksize=constants.sql_dump_record_chunksize)
+        # Columns of tables may have changed
+        DatabaseSourceSQL._table_columns.clear()
 
-    def _replace_table_name_chars(self, table_name):
+        return report
 
-        for i in ['[', ']', '.']:
-            table_name = table_name.replace(i, "")
+    def _get_index_list(self, table_name, columns):
+        """Gets the indices for a trade/order table: on date, on (ticker, date) and on (ticker, tag, date) for each of
+        the tags in constants.sql_trade_order_index_tags, which are columns of the table
 
-        return table_name
+        Parameters
+        ----------
+        table_name : str
+            Table name
 
-    def _reserved_keywords(self, keyword):
-        return '`' + keyword + '`'
+        columns : str (list)
+            Columns of the table
 
-    def _create_database_not_exists(self, database_name=None):
-        # Create database if it doesn't exist
-        if database_name is not None:
-            conn_str = self._create_connection_string(database_name=None, table_name=None)
-            engine = create_engine(conn_str)
+        Returns
+        -------
+        Index (list)
+        """
+        schema, sqlalchemy_table_name = self._split_schema_table_name(table_name)
 
-            try:
-                engine.execute("CREATE DATABASE IF NOT EXISTS {0} ".format(database_name))
-            except:
-                logger = LoggerManager.getLogger(__name__)
-                logger.warning("Could not create database " + database_name)
+        index_columns = ['date', 'ticker'] + constants.sql_trade_order_index_tags
+        index_columns = [c for c in index_columns if c in columns]
 
-    @abc.abstractmethod
-    def _create_connection_string(self):
-        pass
+        if 'date' not in index_columns:
+            return []
 
-    def _sql_col_maker(self, df):
-        """For a DataFrame creates columns which map pd data types to SQL data types
+        # Only need the indexed columns (and their types don't matter) to create the indices
+        table = Table(sqlalchemy_table_name, MetaData(),
+                      *[Column(c, self._datetime() if c == 'date' else String(100)) for c in index_columns],
+                      schema=schema)
+
+        index_name = self._replace_table_name_chars(table_name)
+
+        index_list = [Index(index_name + '_idx_date', table.c['date'])]
+
+        if 'ticker' in index_columns:
+            index_list.append(Index(index_name + '_idx_ticker_date', table.c['ticker'], table.c['date']))
+
+            for tag in constants.sql_trade_order_index_tags:
+                if tag in index_columns:
+                    index_list.append(Index(index_name + '_idx_ticker_' + tag + '_date',
+                                            table.c['ticker'], table.c[tag], table.c['date']))
+
+        return index_list
+
+    def _create_indices(self, engine, table_name):
+        """Creates any indices for a trade/order table (see _get_index_list), which don't already exist
 
         Parameters
         ----------
-        df : DataFrame
-            Data to be stored in the SQL database
+        engine : Engine
+            SQLAlchemy engine for the database
+
+        table_name : str
+            Table name
 
         Returns
         -------
-        Column (list)
+        dict
+            Status of each index ('exists', 'created' or 'failed')
         """
-        cols = []
+        logger = LoggerManager.getLogger(__name__)
 
-        if df.index is not None:
-            cols.append(self._create_sql_column(df.index.name, df.index.dtype))
+        schema, sqlalchemy_table_name = self._split_schema_table_name(table_name)
 
-        for i, j in zip(df.columns, df.dtypes):
-            cols.append(self._create_sql_column(i, j))
+        inspector = sqlalchemy.inspect(engine)
 
-        return cols
+        columns = [c['name'] for c in inspector.get_columns(sqlalchemy_table_name, schema=schema)]
+        existing_indices = [i['name'].lower() for i in inspector.get_indexes(sqlalchemy_table_name, schema=schema)
+                            if i['name'] is not None]
 
-    def _datetime(self):
-        return DateTime(6)
+        index_status = OrderedDict()
 
-    def _create_sql_column(self, field, fieldtype):
+        for index in self._get_index_list(table_name, columns):
+            if index.name.lower() in existing_indices:
+                index_status[index.name] = 'exists'
+
+                continue
+
+            try:
+                index.create(engine)
+
+                index_status[index.name] = 'created'
+
+                logger.info("Created index " + index.name + " on " + table_name)
+            except Exception as e:
+                index_status[index.name] = 'failed'
+
+                logger.warning("Couldn't create index " + index.name + " on " + table_name + ": " + str(e))
+
+        return index_status
+
+    def analyze_indices(self, table_name=None, database_name=None):
+        """Maintenance for trade/order tables: verifies that they have all their indices on date, (ticker, date) etc.,
+        creating any which are missing (eg. for tables created with earlier versions of tcapy), and then updates the
+        statistics of the tables, so the query planner makes good use of the indices.
+
+        Parameters
+        ----------
+        table_name : str (list)
+            Table name(s) - default is every table in the database with date and ticker columns
+
+        database_name : str
+            Database name
+
+        Returns
+        -------
+        dict
+            For each table, the status of each index ('exists', 'created' or 'failed')
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        if database_name is None:
+            database_name = self._trade_data_database_name
+
+        engine, con_str = self._get_database_engine(database_name=database_name)
+
+        if table_name is None:
+            inspector = sqlalchemy.inspect(engine)
+
+            table_name = [t for t in inspector.get_table_names()
+                          if {'date', 'ticker'}.issubset([c['name'] for c in inspector.get_columns(t)])]
+
+        if not(isinstance(table_name, list)):
+            table_name = [table_name]
+
+        index_status = OrderedDict()
+
+        for t in table_name:
+            index_status[t] = self._create_indices(engine, t)
+
+            try:
+                with engine.begin() as con:
+                    con.execute(text(self._analyze_table_sql(t)))
+            except Exception as e:
+                logger.warning("Couldn't update statistics of " + t + ": " + str(e))
+
+        return index_status
+
+    def _analyze_table_sql(self, table_name):
+        return 'ANALYZE ' + table_name
+
+    def _bulk_insert(self, df, engine, table_name, batch_size=None):
+        """Inserts a DataFrame into an existing SQL table in batches, with the native bulk loading path for the SQL
+        dialect (by default, executemany in a single transaction), logging the progress and throughput of each batch.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Data to be inserted (the index is inserted as the date column)
+
+        engine : Engine
+            SQLAlchemy engine for the database
+
+        table_name : str
+            Table name (which must already exist)
+
+        batch_size : int
+            Number of rows in each batch (default: the dump record chunksize of the dialect)
+
+        Returns
+        -------
+        dict
+            Number of rows written, seconds taken and rows per second
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        if batch_size is None:
+            batch_size = self._sql_dump_record_chunksize
+
+        df = df.reset_index()
+
+        columns = list(df.columns)
+        rows = len(df.index)
+
+        start = time.time()
+
+        con = self._get_bulk_insert_connection(engine)
+
+        try:
+            cursor = con.cursor()
+
+            for i in range(0, rows, batch_size):
+                self._bulk_insert_batch(cursor, df.iloc[i:i + batch_size], table_name, columns, engine.dialect.paramstyle)
+
+                written = min(i + batch_size, rows)
+                elapsed = time.time() - start
+
+                logger.info("Written " + str(written) + " of " + str(rows) + " rows to " + table_name + " ("
+                            + str(int(written / max(elapsed, 1e-6))) + " rows/s)")
+
+            con.commit()
+        except:
+            con.rollback()
+
+            raise
+        finally:
+            con.close()
+
+        elapsed = time.time() - start
+
+        return {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / max(elapsed, 1e-6)}
+
+    def _get_bulk_insert_connection(self, engine):
+        """Gets the DBAPI connection used for bulk inserts (by default, from the pool of the engine)
+        """
+        return engine.raw_connection()
+
+    def _bulk_insert_batch(self, cursor, df, table_name, columns, paramstyle):
+        """Inserts a batch of rows with executemany on a DBAPI cursor
+        """
+        if paramstyle == 'qmark':
+            placeholders = ['?'] * len(columns)
+        elif paramstyle in ['format', 'pyformat']:
+            placeholders = ['%s'] * len(columns)
+        else:
+            placeholders = [':' + str(i + 1) for i in range(0, len(columns))]
+
+        sql_query = 'INSERT INTO ' + table_name + ' (' + ', '.join([self._reserved_keywords(c) for c in columns]) \
+                    + ') VALUES (' + ', '.join(placeholders) + ')'
+
+        cursor.executemany(sql_query, self._bulk_insert_values(df))
+
+    def _bulk_insert_values(self, df):
+        """Converts a DataFrame into a list of tuples of Python objects (with None for missing values), which can be
+        passed to a DBAPI cursor
+        """
+        df = df.astype(object)
+
+        return list(df.where(pd.notnull(df), None).itertuples(index=False, name=None))
+
+    def _bulk_insert_csv(self, df, na_rep=''):
+        """Writes a batch of rows as CSV (without the header), for dialects which load CSVs natively
+        """
+        return df.to_csv(index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f', na_rep=na_rep)
+
+    # def _write_df_to_sql(self, df, sqlalchemy_table_name_tick, engine, schema):
+    #
+    #     # This will fail if we try to insert the *SAME* trades/orders, which have the same dates/id/_tickers
+    #     df.to_sql(sqlalchemy_table_name_tick, engine, if_exists='append', index=True,
+    #               schema=schema, method=self._default_multi, chunksize=constants.sql_dump_record_chunksize)
+
+    def _split_schema_table_name(self, table_name):
+        """Splits a table name into the schema (if any) and the table name, as SQLAlchemy expects them
+
+        Parameters
+        ----------
+        table_name : str
+            Table name (eg. [dbo].[trade])
+
+        Returns
+        -------
+        str, str
+        """
+        schema = None
+
+        # SQLAlchemy may put double [] around a table name (which causes SQL syntax error), so remove that from
+        # the initial table name supplied
+        # eg. CREATE TABLE [[dbo].[trade]] ... WRONG
+        # but we need to extract the schema from this to add as an additional parameter to give later to SQLAlchemy
+        if '.' in table_name:
+            schema = self._replace_table_name_chars(table_name.split(".")[0])
+            table_name = self._replace_table_name_chars(table_name.split(".")[1])
+
+        return schema, table_name
+
+    def _replace_table_name_chars(self, table_name):
+
+        for i in ['[', ']', '.']:
+            table_name = table_name.replace(i, "")
+
+        return table_name
+
+    def _reserved_keywords(self, keyword):
+        return '`' + keyword + '`'
+
+    def _create_database_not_exists(self, database_name=None):
+        # Create database if it doesn't exist
+        if database_name is not None:
+            conn_str = self._create_connection_string(database_name=None, table_name=None)
+
+            # Only need to check once per process for each server/database
+            if (conn_str, database_name) in DatabaseSourceSQL._engine_pool_databases:
+                return
+
+            engine = self._get_pooled_engine(conn_str)
+
+            try:
+                engine.execute("CREATE DATABASE IF NOT EXISTS {0} ".format(database_name))
+
+                DatabaseSourceSQL._engine_pool_databases.add((conn_str, database_name))
+            except:
+                logger = LoggerManager.getLogger(__name__)
+                logger.warning("Could not create database " + database_name)
+
+    @abc.abstractmethod
+    def _create_connection_string(self):
+        pass
+
+    def _sql_col_maker(self, df):
+        """For a DataFrame creates columns which map pd data types to SQL data types
+
+        Parameters
+        ----------
+        df : DataFrame
+            Data to be stored in the SQL database
+
+        Returns
+        -------
+        Column (list)
+        """
+        cols = []
+
+        if df.index is not None:
+            cols.append(self._create_sql_column(df.index.name, df.index.dtype))
+
+        for i, j in zip(df.columns, df.dtypes):
+            cols.append(self._create_sql_column(i, j))
+
+        return cols
+
+    def _datetime(self):
+        return DateTime(6)
+
+    def _create_sql_column(self, field, fieldtype):
         """For a particular field name and its associated data type, creates the corresponding column/SQL data type
         associated with it.
 
@@ -1424,7 +2042,11 @@ class DatabaseSourceMSSQLServer(DatabaseSourceSQL):
 
         self._create_database_not_exists(database_name=database_name)
         con_exp = self._create_connection_string(database_name=database_name, table_name=table_name)
-        engine = create_engine(con_exp, pool_size=20, max_overflow=0)
+
+        return self._get_pooled_engine(con_exp), con_exp
+
+    def _create_engine(self, con_exp, **kwargs):
+        engine = super(DatabaseSourceMSSQLServer, self)._create_engine(con_exp, **kwargs)
 
         # Uses a special flag from pyodbc fast_executemany which speeds up SQL inserts 100x including when doing df.to_sql
         # https://gitlab.com/timelord/timelord/blob/master/timelord/utils/connector.py
@@ -1439,7 +2061,7 @@ class DatabaseSourceMSSQLServer(DatabaseSourceSQL):
                 except:
                     pass
 
-        return engine, con_exp
+        return engine
 
     def _create_connection_string(self, database_name=None, table_name=None):
 
@@ -1506,6 +2128,18 @@ class DatabaseSourceMSSQLServer(DatabaseSourceSQL):
         return con_exp
 
 
+    def _analyze_table_sql(self, table_name):
+        return 'UPDATE STATISTICS ' + table_name
+
+    def _bulk_insert_batch(self, cursor, df, table_name, columns, paramstyle):
+        # pyodbc sends the whole batch to SQL Server in one go (similar to BCP), rather than a round trip per row
+        try:
+            cursor.fast_executemany = True
+        except:
+            pass
+
+        super(DatabaseSourceMSSQLServer, self)._bulk_insert_batch(cursor, df, table_name, columns, paramstyle)
+
     def _datetime(self):
         return sqlalchemy.dialects.mssql.DATETIME2(precision=6)
 
@@ -1535,7 +2169,7 @@ class DatabaseSourcePostgres(DatabaseSourceSQL):
         self._create_database_not_exists(database_name=database_name)
         con_exp = self._create_connection_string(database_name=database_name, table_name=table_name)
 
-        return create_engine(con_exp), con_exp
+        return self._get_pooled_engine(con_exp), con_exp
 
     def _create_connection_string(self, database_name=None, table_name=None):
         con_exp = "postgresql://" + self._username + ":" + self._password \
@@ -1549,6 +2183,14 @@ class DatabaseSourcePostgres(DatabaseSourceSQL):
 
         return con_exp
 
+    def _reserved_keywords(self, keyword):
+        return '"' + keyword + '"'
+
+    def _bulk_insert_batch(self, cursor, df, table_name, columns, paramstyle):
+        # COPY is by far the fastest way to load into Postgres (in CSV format, unquoted empty fields are NULL)
+        cursor.copy_expert('COPY ' + table_name + ' (' + ', '.join([self._reserved_keywords(c) for c in columns])
+                           + ') FROM STDIN WITH (FORMAT CSV)', io.StringIO(self._bulk_insert_csv(df)))
+
 class DatabaseSourceSQLite(DatabaseSourceSQL):
     """Implements the DatabaseSourceSQL class for SQLite instances.
 
@@ -1568,7 +2210,11 @@ class DatabaseSourceSQLite(DatabaseSourceSQL):
         # SQLite automatically create a new database if it doesn't exist
         con_exp = self._create_connection_string(database_name=database_name, table_name=table_name)
 
-        return create_engine(con_exp), con_exp
+        return self._get_pooled_engine(con_exp), con_exp
+
+    def _create_engine(self, con_exp, **kwargs):
+        # SQLite is file based, so leave SQLAlchemy to pick its default pool (pool sizes aren't supported by all of them)
+        return create_engine(con_exp, pool_pre_ping=constants.sql_engine_pool_pre_ping, **kwargs)
 
     def _create_connection_string(self, database_name=None, table_name=None):
         # Careful use three slashes for SQLite!
@@ -1585,6 +2231,16 @@ class DatabaseSourceSQLite(DatabaseSourceSQL):
     def _wrap_table_name_sql_query(self, table_name):
         return "'" + table_name + "'"
 
+    def _bulk_insert_values(self, df):
+        # SQLite has no date type, so store dates as strings in the same format as SQLAlchemy does (so they sort)
+        df = df.copy()
+
+        for c in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[c]):
+                df[c] = df[c].dt.strftime('%Y-%m-%d %H:%M:%S.%f').where(df[c].notnull(), None)
+
+        return super(DatabaseSourceSQLite, self)._bulk_insert_values(df)
+
 
 class DatabaseSourceMySQL(DatabaseSourceSQL):
     """Implements the DatabaseSourceSQL class for MySQL instances.
@@ -1623,7 +2279,7 @@ class DatabaseSourceMySQL(DatabaseSourceSQL):
         self._create_database_not_exists(database_name=database_name)
         con_exp = self._create_connection_string(database_name=database_name, table_name=table_name)
 
-        return create_engine(con_exp), con_exp
+        return self._get_pooled_engine(con_exp), con_exp
 
     def _create_connection_string(self, database_name=None, table_name=None):
         con_exp = "mysql+mysqlconnector://" + self._username + ":" + self._password \
@@ -1637,6 +2293,45 @@ class DatabaseSourceMySQL(DatabaseSourceSQL):
 
         return con_exp
 
+    def _analyze_table_sql(self, table_name):
+        return 'ANALYZE TABLE ' + table_name
+
+    def _get_bulk_insert_connection(self, engine):
+        self._local_infile = constants.mysql_bulk_load_local_infile
+
+        if not(self._local_infile):
+            return super(DatabaseSourceMySQL, self)._get_bulk_insert_connection(engine)
+
+        # Only allow LOAD DATA LOCAL INFILE on a separate (unpooled) connection for this load, rather than on every
+        # pooled connection (which are also used for reads)
+        return create_engine(engine.url, poolclass=NullPool,
+                             connect_args={'allow_local_infile': True}).raw_connection()
+
+    def _bulk_insert_batch(self, cursor, df, table_name, columns, paramstyle):
+        import tempfile
+
+        if not(getattr(self, '_local_infile', False)):
+            return super(DatabaseSourceMySQL, self)._bulk_insert_batch(cursor, df, table_name, columns, paramstyle)
+
+        # LOAD DATA LOCAL INFILE is much faster than INSERTs for MySQL, but needs a file, so write the batch as a CSV
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+            f.write(self._bulk_insert_csv(df, na_rep='NULL'))
+
+        try:
+            cursor.execute("LOAD DATA LOCAL INFILE '" + f.name.replace('\\', '/') + "' INTO TABLE " + table_name
+                           + " FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY ''"
+                           + " LINES TERMINATED BY '\\n' (" + ', '.join([self._reserved_keywords(c) for c in columns]) + ")")
+        except Exception as e:
+            # eg. if local_infile is OFF on the server, use executemany for this batch and the rest of the load
+            LoggerManager.getLogger(__name__).warning(
+                "MySQL rejected LOAD DATA LOCAL INFILE, falling back to executemany: " + str(e))
+
+            self._local_infile = False
+
+            super(DatabaseSourceMySQL, self)._bulk_insert_batch(cursor, df, table_name, columns, paramstyle)
+        finally:
+            os.remove(f.name)
+
     def _datetime(self):
         return sqlalchemy.dialects.mysql.DATETIME(fsp=6)
 
@@ -1729,8 +2424,9 @@ class DatabaseSourceTickData(DatabaseSource):
     def _stream_chunks(self, engine, store, csv_file, ticker, table_name,
                        if_exists_ticker='replace', market_trade_data='market', date_format=None,
                        read_in_reverse=False,
-                       csv_read_chunksize=constants.csv_read_chunksize, remove_duplicates=True):
-        """Reads in CSV (or a series of CSV files in a path) in chunks and then dumps each chunk to the database
+                       csv_read_chunksize=constants.csv_read_chunksize, remove_duplicates=True, csv_read_engine=None):
+        """Reads in CSV (or a series of CSV files in a path) in chunks and then dumps each chunk to the database. Reading
+        and tidying chunks is pipelined in threads, with the database writes (which are done in order).
 
         Parameters
         ----------
@@ -1780,6 +2476,9 @@ class DatabaseSourceTickData(DatabaseSource):
             - whilst in many TCA cases, we can ignore duplicated
             points, we cannot do this for situations where we might wish to use for example volume, to calculate VWAP
 
+        csv_read_engine : str (default: in constants file)
+            'pandas' or 'pyarrow' to read the CSVs
+
         Returns
         -------
 
@@ -1798,12 +2497,14 @@ class DatabaseSourceTickData(DatabaseSource):
 
             if '*' in csv_file[i]:
                 # assume alphabetically
-                mini_csv_file = glob.glob(csv_file[i])
+                mini_csv_file = [f for f in glob.glob(csv_file[i]) if os.path.basename(f) != constants.file_manifest_name]
             else:
                 mini_csv_file = [csv_file[i]]
 
-            # Assume files are alphabetically sorted in chronological order (eg. AUDUSD1.csv is BEFORE AUDUSD2.csv in time)
-            mini_csv_file.sort()
+            # Sort files by their first timestamps in the manifest of their folder (if it has up to date entries for them)
+            # otherwise assume files are alphabetically sorted in chronological order (eg. AUDUSD1.csv is BEFORE
+            # AUDUSD2.csv in time)
+            mini_csv_file = FileManifest().sort_files(mini_csv_file)
 
             # Reset for each "CSV file"/ticker
             later_chunk = False
@@ -1811,159 +2512,329 @@ class DatabaseSourceTickData(DatabaseSource):
             if len(mini_csv_file) == 0:
                 logger.warning('No files to read in ' + csv_file[i])
 
-            # If the "CSV file" has a wildcard this could be a big loop
-            for m in range(0, len(mini_csv_file)):
-
-                logger.info("Parsing " + str(
-                    mini_csv_file[m]) + " before tick database dump for ticker " + ticker_postfix)
-
-                # Can't process HDF5 fixed file or Parquet in chunks
-                if ".h5" in mini_csv_file[m] or ".parquet" in mini_csv_file[m]:
-                    if ".h5" in mini_csv_file[m]: format = 'hdf5'
-                    elif ".parquet" in mini_csv_file[m]: format = 'parquet'
+            def tidy_chunk(df, file, ticker=ticker[i]):
+                return self._tidy_market_data(df, ticker, file, market_trade_data, date_format=date_format,
+                                              remove_duplicates=remove_duplicates)
 
-                    df = UtilFunc().read_dataframe_from_binary(mini_csv_file[m], format=format)
+            # Whilst we write each chunk, the next ones are being read and tidied in other threads
+            chunks = self._pipeline_chunks(self._read_chunks(mini_csv_file, ticker[i], ticker_postfix,
+                                                             date_format=date_format, read_in_reverse=read_in_reverse,
+                                                             csv_read_chunksize=csv_read_chunksize,
+                                                             csv_read_engine=csv_read_engine), tidy_chunk)
 
-                    self._process_chunk(df, ticker[i], mini_csv_file[m], table_name, ticker_postfix,
-                                        if_exists_ticker, market_trade_data, engine, store,
-                                        later_chunk=later_chunk, date_format=date_format,
-                                        remove_duplicates=remove_duplicates)
+            rows = 0
+            start = time.time()
 
-                    later_chunk = True
-                else:
-                    chunk_no = 0
+            try:
+                for chunk_no, df in enumerate(chunks):
+                    logger.debug("Writing chunk " + str(chunk_no) + " into tick database...")
 
-                    # Load up CSV and then dump to Arctic
+                    if df is not None:
+                        if not (df.empty):
+                            # If we have later chunks in the CSV/HDF5 file DON'T overwrite the previous section we just wrote
+                            self._write_to_db(df, engine, store, table_name, ticker_postfix,
+                                              'append' if later_chunk else if_exists_ticker)
 
-                    # If the CSV is sorted in reverse (ie. latest dates at top, and earlier at bottom)
-                    if read_in_reverse:
+                            rows = rows + len(df.index)
 
-                        for df_chunk in pd.read_csv(mini_csv_file[m], index_col=0, chunksize=csv_read_chunksize):
+                    later_chunk = True
+            finally:
+                chunks.close()
 
-                            logger.debug("Writing chunk " + str(chunk_no) + " dumping to disk...")
+            elapsed = time.time() - start
 
-                            path = os.path.join(constants.temp_data_folder, ticker[i] + '_' + str(chunk_no) + ".h5")
+            logger.info("Written " + str(rows) + " rows for " + ticker_postfix + " in " + str(round(elapsed, 3)) + "s ("
+                        + str(int(rows / max(elapsed, 1e-6))) + " rows/s)")
 
-                            if os.path.exists(path):
-                                os.remove(path)
+    def _read_chunks(self, mini_csv_file, ticker, ticker_postfix, date_format=None, read_in_reverse=False,
+                     csv_read_chunksize=constants.csv_read_chunksize, csv_read_engine=None):
+        """Reads a list of CSV (or HDF5/Parquet) files, which are sorted in time, returning chunks in chronological order.
+        HDF5 and Parquet files are read as a single chunk.
 
-                            self._util_func.write_dataframe_to_binary(df_chunk, path)
+        Parameters
+        ----------
+        mini_csv_file : str (list)
+            Paths of the files
 
-                            chunk_no = chunk_no + 1
+        ticker : str
+            Ticker for the dataset (eg. EURUSD)
 
-                        for ch in range(chunk_no - 1, -1, -1):
-                            logger.debug("Reading back chunk " + str(ch) + " from disk and then parsing...")
+        ticker_postfix : str
+            Ticker with the postfix (eg. EURUSD-ncfx)
 
-                            path = os.path.join(constants.temp_data_folder, ticker[i] + '_' + str(ch) + ".h5")
+        date_format : str (default: None)
+            Format of the dates stored in CSV
 
-                            df_chunk = self._util_func.read_dataframe_from_binary(path)
+        read_in_reverse : bool (default: False)
+            Are the CSVs sorted in reverse (ie. latest dates at top, and earlier at bottom)?
 
-                            self._process_chunk(df_chunk, ticker[i], mini_csv_file[m], table_name, ticker_postfix,
-                                                if_exists_ticker, market_trade_data, engine, store,
-                                                later_chunk=later_chunk, remove_duplicates=remove_duplicates)
+        csv_read_chunksize : int (default: in constants file)
+            Lines in each chunk of the CSVs
 
-                            # Delete temporary file
-                            os.remove(path)
+        csv_read_engine : str (default: in constants file)
+            'pandas' or 'pyarrow' to read the CSVs
 
-                            later_chunk = True
+        Returns
+        -------
+        (str, DataFrame) (generator)
+        """
+        logger = LoggerManager.getLogger(__name__)
 
-                    # If CSV is correctly sorted (ie. earliest dates first and latest dates at the end)
-                    else:
-                        for df_chunk in pd.read_csv(mini_csv_file[m], index_col=0, chunksize=csv_read_chunksize):
-                            logger.debug("Processing chunk " + str(chunk_no) + " into tick database...")
+        for m in range(0, len(mini_csv_file)):
 
-                            self._process_chunk(df_chunk, ticker[i], mini_csv_file[m], table_name, ticker_postfix,
-                                                if_exists_ticker, market_trade_data, engine, store,
-                                                later_chunk=later_chunk, remove_duplicates=remove_duplicates,
-                                                date_format=date_format)
+            logger.info("Parsing " + str(mini_csv_file[m]) + " before tick database dump for ticker " + ticker_postfix)
 
-                            if chunk_no > 2:
-                                break
+            # Can't process HDF5 fixed file or Parquet in chunks
+            if ".h5" in mini_csv_file[m] or ".parquet" in mini_csv_file[m]:
+                if ".h5" in mini_csv_file[m]: format = 'hdf5'
+                elif ".parquet" in mini_csv_file[m]: format = 'parquet'
 
-                            chunk_no = chunk_no + 1
+                yield mini_csv_file[m], UtilFunc().read_dataframe_from_binary(mini_csv_file[m], format=format)
 
-                            later_chunk = True
+            # If the CSV is sorted in reverse (ie. latest dates at top, and earlier at bottom)
+            elif read_in_reverse:
+                chunk_no = 0
 
-    def _process_chunk(self, df, ticker, csv_file, table_name, ticker_postfix, if_exists_ticker, market_trade_data,
-                       engine, store, later_chunk=False, date_format=None, remove_duplicates=True):
+                for df_chunk in self._read_csv_chunks(mini_csv_file[m], date_format=date_format,
+                                                      csv_read_chunksize=csv_read_chunksize,
+                                                      csv_read_engine=csv_read_engine):
 
-        df = self._tidy_market_data(df, ticker, csv_file, market_trade_data, date_format=date_format,
-                                    remove_duplicates=remove_duplicates)
+                    logger.debug("Writing chunk " + str(chunk_no) + " dumping to disk...")
 
-        # If we have later chunks in the CSV/HDF5 file DON'T overwrite the previous section we just wrote
-        if later_chunk:
-            if_exists_ticker = 'append'
+                    path = os.path.join(constants.temp_data_folder, ticker + '_' + str(chunk_no) + ".h5")
 
-        if df is not None:
-            if not (df.empty):
-                self._write_to_db(df, engine, store, table_name, ticker_postfix, if_exists_ticker)
+                    if os.path.exists(path):
+                        os.remove(path)
 
+                    self._util_func.write_dataframe_to_binary(df_chunk, path)
 
-########################################################################################################################
+                    chunk_no = chunk_no + 1
 
-class DatabaseSourceArctic(DatabaseSourceTickData):
-    """Implements DatabaseSource for Arctic/MongoDB database for market data only. It is
-    recommended to use Arctic/MongoDB to store market data. It also allows us to store market data from multiple sources,
-    by using the postfix notation (eg 'ncfx' or 'dukascopy').
+                for ch in range(chunk_no - 1, -1, -1):
+                    logger.debug("Reading back chunk " + str(ch) + " from disk and then parsing...")
 
-    """
+                    path = os.path.join(constants.temp_data_folder, ticker + '_' + str(ch) + ".h5")
 
-    # static variables
-    # _engine = {}
-    # _store = None
-    # _username = None
-    # _password = None
-    # _host = None
-    # _port = None
+                    df_chunk = self._util_func.read_dataframe_from_binary(path)
 
-    # _arctic_lib_type = None
+                    # Delete temporary file
+                    os.remove(path)
 
-    # _arctic_lock = threading.Lock()
+                    yield mini_csv_file[m], df_chunk
 
-    socketTimeoutMS = constants.arctic_timeout_ms
+            # If CSV is correctly sorted (ie. earliest dates first and latest dates at the end)
+            else:
+                for df_chunk in self._read_csv_chunks(mini_csv_file[m], date_format=date_format,
+                                                      csv_read_chunksize=csv_read_chunksize,
+                                                      csv_read_engine=csv_read_engine):
+                    yield mini_csv_file[m], df_chunk
 
-    def __init__(self, postfix=None, connection_string=constants.arctic_connection_string,
-                 server_host=constants.arctic_host, server_port=constants.arctic_port,
-                 username=constants.arctic_username, password=constants.arctic_password,
-                 arctic_lib_type=constants.arctic_lib_type):
-        """Initialise the Arctic object with our selected market data type (Arctic library type)
+    def _read_csv_chunks(self, csv_file, date_format=None, csv_read_chunksize=constants.csv_read_chunksize,
+                         csv_read_engine=None):
+        """Reads a CSV in chunks, with the first column as the index, either with pandas or with the (multithreaded)
+        pyarrow CSV reader, which is typically much quicker and also parses the dates.
 
         Parameters
         ----------
-        postfix : str
-            Postfix can be used to identify different market data sources (eg. 'ncfx' or 'dukascopy'), if we only use
-            one market data source, this is not necessary
+        csv_file : str
+            Path of the CSV
 
-        connection_string : str
-            Connection string for MongoDB, you can use this instead of specifiying the server_host directly eg. if you are
-            accessing MongoDB Atlas, it will be of the form below. If a connection string is provided, tcapy will ignore
-            all the various other paramaters like server_host, username, password etc.
+        date_format : str (default: None)
+            Format of the dates stored in CSV
 
-            mongodb+srv://<username>:<password>@cluster0.blah-blah.mongodb.net/?retryWrites=true&w=majority
+        csv_read_chunksize : int (default: in constants file)
+            Lines in each chunk of the CSV (for pyarrow, at least this many, as it reads blocks of bytes)
 
-        server_host : str
-            MongoDB server hostname/IP
+        csv_read_engine : str (default: in constants file)
+            'pandas' or 'pyarrow'
 
-        server_port : str
-            Port of MongoDB server
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        if csv_read_engine is None:
+            csv_read_engine = constants.csv_read_engine
 
-        arctic_lib_type : str
-            'TICK_STORE' : append only style database store specifically for tick data
-            'VERSION_STORE' : more flexible data store
-            'CHUNK_STORE' : to store in chunks, can be useful if we typically get date by eg. days/months etc.
+        if csv_read_engine == 'pyarrow':
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
 
-        """
-        super(DatabaseSourceArctic, self).__init__(postfix=postfix)
+            convert_options = None
 
-        # # only want to instantiate this once (or if any parameters have changed!)
-        # with DatabaseSourceArctic._arctic_lock:
-        #     if self._engine is None or self._store is None or arctic_lib_type != self._arctic_lib_type or \
-        #         self._server_host != server_host or self._server_port != server_port or self._username != username or self._password != password:
+            if date_format is not None:
+                convert_options = pa_csv.ConvertOptions(timestamp_parsers=[date_format])
 
-        if connection_string is not None:
-            # Assume short connection strings are invalid
-            if len(connection_string) < 10:
-                connection_string = None
+            reader = pa_csv.open_csv(csv_file, read_options=pa_csv.ReadOptions(block_size=constants.csv_pyarrow_block_size),
+                                     convert_options=convert_options)
+
+            batches = []
+            rows = 0
+
+            def to_pandas(batches):
+                df = pa.Table.from_batches(batches).to_pandas()
+
+                return df.set_index(df.columns[0])
+
+            for batch in reader:
+                batches.append(batch)
+                rows = rows + batch.num_rows
+
+                if rows >= csv_read_chunksize:
+                    yield to_pandas(batches)
+
+                    batches = []
+                    rows = 0
+
+            if batches != []:
+                yield to_pandas(batches)
+        else:
+            for df_chunk in pd.read_csv(csv_file, index_col=0, chunksize=csv_read_chunksize):
+                yield df_chunk
+
+    def _pipeline_chunks(self, chunks, tidy_func, threads=constants.csv_pipeline_threads,
+                         queue_size=constants.csv_pipeline_queue_size):
+        """Pipelines the reading and tidying of chunks, so that whilst the caller is writing one chunk to the database,
+        the next ones are being read (in a reader thread) and tidied (in a pool of threads). Chunks are returned in
+        their original order, and the queue is bounded, so at most queue_size tidied chunks are held in memory, waiting
+        to be written.
+
+        Parameters
+        ----------
+        chunks : (str, DataFrame) (generator)
+            Files and the raw chunks read from them (in order)
+
+        tidy_func : function
+            Tidies a chunk, taking the DataFrame and the file it came from
+
+        threads : int (default: in constants file)
+            Number of threads to tidy chunks (if 0, chunks are read and tidied in the caller, one after another)
+
+        queue_size : int (default: in constants file)
+            Maximum number of chunks read ahead of the chunk being written
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        if threads <= 0:
+            for file, df in chunks:
+                yield tidy_func(df, file)
+
+            return
+
+        chunk_queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        end_of_chunks = object()
+
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def put(item):
+            # Don't block forever if the caller has stopped reading (eg. if writing to the database failed)
+            while not(stop_event.is_set()):
+                try:
+                    chunk_queue.put(item, timeout=1)
+
+                    return True
+                except queue.Full:
+                    pass
+
+            return False
+
+        def read_chunks():
+            try:
+                for file, df in chunks:
+                    if not(put(executor.submit(tidy_func, df, file))):
+                        return
+
+                put(end_of_chunks)
+            except Exception as e:
+                put(e)
+
+        reader = threading.Thread(target=read_chunks)
+        reader.daemon = True
+        reader.start()
+
+        try:
+            while True:
+                item = chunk_queue.get()
+
+                if item is end_of_chunks:
+                    break
+
+                if isinstance(item, Exception):
+                    raise item
+
+                yield item.result()
+        finally:
+            stop_event.set()
+            reader.join()
+            executor.shutdown(wait=True)
+
+########################################################################################################################
+
+class DatabaseSourceArctic(DatabaseSourceTickData):
+    """Implements DatabaseSource for Arctic/MongoDB database for market data only. It is
+    recommended to use Arctic/MongoDB to store market data. It also allows us to store market data from multiple sources,
+    by using the postfix notation (eg 'ncfx' or 'dukascopy').
+
+    """
+
+    # static variables
+    # _engine = {}
+    # _store = None
+    # _username = None
+    # _password = None
+    # _host = None
+    # _port = None
+
+    # _arctic_lib_type = None
+
+    # _arctic_lock = threading.Lock()
+
+    socketTimeoutMS = constants.arctic_timeout_ms
+
+    def __init__(self, postfix=None, connection_string=constants.arctic_connection_string,
+                 server_host=constants.arctic_host, server_port=constants.arctic_port,
+                 username=constants.arctic_username, password=constants.arctic_password,
+                 arctic_lib_type=constants.arctic_lib_type):
+        """Initialise the Arctic object with our selected market data type (Arctic library type)
+
+        Parameters
+        ----------
+        postfix : str
+            Postfix can be used to identify different market data sources (eg. 'ncfx' or 'dukascopy'), if we only use
+            one market data source, this is not necessary
+
+        connection_string : str
+            Connection string for MongoDB, you can use this instead of specifiying the server_host directly eg. if you are
+            accessing MongoDB Atlas, it will be of the form below. If a connection string is provided, tcapy will ignore
+            all the various other paramaters like server_host, username, password etc.
+
+            mongodb+srv://<username>:<password>@cluster0.blah-blah.mongodb.net/?retryWrites=true&w=majority
+
+        server_host : str
+            MongoDB server hostname/IP
+
+        server_port : str
+            Port of MongoDB server
+
+        arctic_lib_type : str
+            'TICK_STORE' : append only style database store specifically for tick data
+            'VERSION_STORE' : more flexible data store
+            'CHUNK_STORE' : to store in chunks, can be useful if we typically get date by eg. days/months etc.
+
+        """
+        super(DatabaseSourceArctic, self).__init__(postfix=postfix)
+
+        # # only want to instantiate this once (or if any parameters have changed!)
+        # with DatabaseSourceArctic._arctic_lock:
+        #     if self._engine is None or self._store is None or arctic_lib_type != self._arctic_lib_type or \
+        #         self._server_host != server_host or self._server_port != server_port or self._username != username or self._password != password:
+
+        if connection_string is not None:
+            # Assume short connection strings are invalid
+            if len(connection_string) < 10:
+                connection_string = None
 
         if connection_string is None:
             ssl = constants.arctic_ssl
@@ -2849,6 +3720,1511 @@ class DatabaseSourcePyStore(DatabaseSourceTickData):
 
 ########################################################################################################################
 
+class DatabaseSourceParquet(DatabaseSourceTickData):
+    """Implements DatabaseSource for market data stored in a Hive partitioned Parquet dataset on disk, partitioned by
+    ticker/year/month (eg. market_data_table/ticker=EURUSD-ncfx/year=2017/month=5/part-....parquet), which doesn't
+    need a database server. When fetching, the ticker/date filters and column selection are pushed down into pyarrow,
+    so only the partitions and row groups (using their min/max statistics) which overlap the requested dates are read
+    from disk. It also allows us to store market data from multiple sources, by using the postfix notation
+    (eg 'ncfx' or 'dukascopy').
+
+    """
+
+    def __init__(self, postfix=None, parquet_dataset_path=constants.parquet_dataset_path,
+                 row_group_size=constants.parquet_dataset_row_group_size):
+        """Initialise the Parquet dataset object
+
+        Parameters
+        ----------
+        postfix : str
+            Postfix can be used to identify different market data sources (eg. 'ncfx' or 'dukascopy'), if we only use
+            one market data source, this is not necessary
+
+        parquet_dataset_path : str
+            Folder of the Parquet datasets on disk (each table is a subfolder)
+
+        row_group_size : int
+            Number of rows in each Parquet row group
+        """
+        super(DatabaseSourceParquet, self).__init__(postfix=postfix)
+
+        self._parquet_dataset_path = parquet_dataset_path
+        self._row_group_size = row_group_size
+
+    def _get_database_engine(self, table_name=None):
+        """Gets the folder of a table in the Parquet dataset
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+
+        Returns
+        -------
+        str, None
+        """
+        return os.path.join(self._parquet_dataset_path, table_name), None
+
+    def _get_dataset(self, table_name):
+        """Gets a pyarrow dataset for a table, partitioned by ticker/year/month (or None if it doesn't exist yet)
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+
+        Returns
+        -------
+        pyarrow.dataset.Dataset
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        if not(os.path.isdir(engine)):
+            return None
+
+        partitioning = ds.partitioning(
+            pa.schema([('ticker', pa.string()), ('year', pa.int32()), ('month', pa.int32())]), flavor='hive')
+
+        return ds.dataset(engine, format='parquet', partitioning=partitioning)
+
+    def _create_filter(self, ticker, start_date=None, finish_date=None):
+        """Creates a pyarrow filter expression for a ticker between dates, which pyarrow uses to skip the year/month
+        partitions (and row groups) outside the dates
+
+        Parameters
+        ----------
+        ticker : str
+            Ticker (including any postfix)
+
+        start_date : Timestamp
+            Start date (UTC, without timezone)
+
+        finish_date : Timestamp
+            Finish date (UTC, without timezone)
+
+        Returns
+        -------
+        pyarrow.dataset.Expression
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        year = ds.field('year'); month = ds.field('month')
+
+        filter = ds.field('ticker') == ticker
+
+        if start_date is not None:
+            filter = filter & ((year > start_date.year) | ((year == start_date.year) & (month >= start_date.month))) \
+                     & (ds.field('date') >= pa.scalar(start_date.to_pydatetime(), type=pa.timestamp('us')))
+
+        if finish_date is not None:
+            filter = filter & ((year < finish_date.year) | ((year == finish_date.year) & (month <= finish_date.month))) \
+                     & (ds.field('date') <= pa.scalar(finish_date.to_pydatetime(), type=pa.timestamp('us')))
+
+        return filter
+
+    def fetch_market_data(self, start_date=None, finish_date=None, ticker=None, table_name=None, fields=None):
+        """Fetches market data for a particular ticker
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be downloaded
+
+        table_name : str
+            Table name
+
+        fields : str (list)
+            Columns to read (default: all of them)
+
+        Returns
+        -------
+        DataFrame
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        ticker = ticker + self.postfix
+
+        if table_name is None:
+            table_name = constants.parquet_dataset_market_data_database_table
+
+        # Convert dates into UTC stripped of timezone (the same as the dates on disk)
+        start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
+
+        dataset = self._get_dataset(table_name)
+
+        if dataset is None:
+            logger.warning("Parquet dataset table " + table_name + " doesn't exist")
+
+            return None
+
+        # Partitioning fields aren't needed in the output
+        columns = [c for c in dataset.schema.names if c not in ['ticker', 'year', 'month']]
+
+        if fields is not None:
+            columns = [c for c in columns if c == 'date' or c in fields]
+
+        df = dataset.to_table(columns=columns, filter=self._create_filter(ticker, start_date, finish_date)).to_pandas()
+
+        logger.debug("Extracted Parquet dataset table: " + str(table_name) + " for ticker " + str(ticker) +
+                     " between " + str(start_date) + " - " + str(finish_date))
+
+        # Each append writes new files, which aren't necessarily read in order
+        df = df.set_index('date').sort_index(kind='mergesort')
+        df.index.name = 'Date'
+
+        # Downsample floats to reduce memory footprint
+        return self._downsample_localize_utc(df, convert=True)
+
+    def fetch_trade_order_data(self, start_date=None, finish_date=None, ticker=None, table_name=None):
+        """Fetches trade/order data, which isn't supported for Parquet datasets
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker
+
+        table_name : str
+            Table name which contains trade/order data
+
+        Returns
+        -------
+        DataFrame
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        logger.error("Parquet datasets are not tested for storing trade data")
+
+        return
+
+    def convert_csv_to_table(self, csv_file, ticker, table_name, database_name=None, if_exists_table='replace',
+                             if_exists_ticker='replace', market_trade_data='market', date_format=None,
+                             read_in_reverse=False,
+                             csv_read_chunksize=constants.csv_read_chunksize, remove_duplicates=True):
+        """Reads CSV from disk (or potentionally a list of CSVs for a list of different _tickers) into a pandas DataFrame
+        which is then dumped in the Parquet dataset.
+
+        Parameters
+        ----------
+        csv_file : str (list)
+            Path of CSV file - can also include wildcard characters (assume that files are ordered in time, eg. if
+            we specify EURUSD*.csv, then EURUSD1.csv would be before EURUSD2.csv etc.
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        database_name : str
+            Database name
+
+        if_exists_table : str (default: 'replace')
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str (default: 'replace')
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        market_trade_date : str (default: 'market')
+            'market' for market data
+            'trade' for trade data
+
+        date_format : str (default: None)
+            Specify the format of the dates stored in CSV, specifying this speeds up CSV parsing considerably and
+            is recommended
+
+        csv_read_chunksize : int (default: in constants file)
+            Specifies the chunksize to read CSVs. If we are reading very large CSVs this helps us to reduce risk of running
+            out of memory
+
+        remove_duplicates : bool (default: True)
+            Should we remove consecutive duplicated market values (eg. if EURUSD is at 1.1652 and 20ms later it is also
+            recorded at 1.1652, should we ignore the second point), which will make our _calculations a lot faster
+            - whilst in many TCA cases, we can ignore duplicated
+            points, we cannot do this for situations where we might wish to use for example volume, to calculate VWAP
+
+        Returns
+        -------
+
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        if market_trade_data == 'trade':
+            logger.error("Parquet datasets are not tested for storing trade data")
+
+            return
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        # Delete the table (folder) if it needs to be replaced
+        if if_exists_table == 'replace':
+            shutil.rmtree(engine, ignore_errors=True)
+
+        # Read CSV files (possibly in chunks) and then dump to Parquet dataset
+        self._stream_chunks(engine, _, csv_file, ticker, table_name,
+                            if_exists_ticker=if_exists_ticker, market_trade_data=market_trade_data,
+                            date_format=date_format,
+                            read_in_reverse=read_in_reverse,
+                            csv_read_chunksize=csv_read_chunksize, remove_duplicates=remove_duplicates)
+
+        # Any cached TCA output which used this market data is now out of date
+        self._invalidate_tca_request_cache('parquet')
+
+    def _write_to_db(self, df, engine, _, table_name, ticker, if_exists_ticker, existing_datacheck='ignore'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        logger = LoggerManager.getLogger(__name__)
+
+        if df is None:
+            return
+
+        if df.empty:
+            return
+
+        ticker_path = os.path.join(engine, 'ticker=' + ticker)
+
+        # Store in UTC without the timezone
+        df = self._time_series_ops.localize_as_UTC(df, convert=True).tz_localize(None)
+
+        if if_exists_ticker == 'replace':
+            shutil.rmtree(ticker_path, ignore_errors=True)
+
+        elif if_exists_ticker == 'append':
+            # Only allow people to append to the end (unless they set the existing_datacheck parameter to 'ignore')
+            if existing_datacheck != 'ignore':
+                dataset = self._get_dataset(table_name)
+
+                if dataset is not None:
+                    existing_rows = dataset.count_rows(filter=self._create_filter(ticker, start_date=df.index[0]))
+
+                    if existing_rows > 0:
+                        err_msg = "Parquet dataset can't append overlapping data for " + ticker + \
+                                  " in " + table_name + ". Has data between " + str(
+                            df.index[0]) + ' - ' + str(df.index[-1])
+
+                        logger.error(err_msg)
+
+                        raise ErrorWritingOverlapDataException(err_msg)
+        else:
+            logger.info('Nothing written in Parquet dataset')
+
+            return
+
+        # Ticker is a partition (so isn't stored in the files themselves)
+        df = df.drop(columns=['ticker'], errors='ignore').sort_index()
+        df.index.name = 'date'
+
+        file_name = 'part-' + str(uuid.uuid4()) + '.parquet'
+
+        # Write a file for each year/month, with row groups (sorted by date) so their statistics can be used to skip
+        # any which are outside the dates in queries
+        for (year, month), df_month in df.groupby([df.index.year, df.index.month]):
+            month_path = os.path.join(ticker_path, 'year=' + str(year), 'month=' + str(month))
+
+            if not(os.path.isdir(month_path)):
+                os.makedirs(month_path)
+
+            pq.write_table(pa.Table.from_pandas(df_month.reset_index(), preserve_index=False),
+                           os.path.join(month_path, file_name), row_group_size=self._row_group_size,
+                           coerce_timestamps='us', allow_truncated_timestamps=True)
+
+        logger.debug("Written " + str(len(df.index)) + " rows for " + ticker + " to Parquet dataset " + engine)
+
+    def append_market_data(self, market_df, ticker, table_name=constants.parquet_dataset_market_data_database_table,
+                           if_exists_table='append', if_exists_ticker='append', remove_duplicates=True,
+                           existing_datacheck='yes'):
+        """Append market data to the Parquet dataset. It is expected that market data has an index of DateTimeIndex,
+        and fields such as "mid", "bid", "ask" etc.
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            Market data to dumped
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        if_exists_table : str
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        remove_duplicates : bool
+            Should we remove consecutive duplicates in market data, mainly to reduce file size on disk
+            * True (default) - removes duplicates (ie. every bit of market data other than time the same)
+            * False - leave data as it is
+
+        existing_datacheck : str (default: 'yes')
+            If set to 'ignore', we won't check whether there's data already on the disk after this period
+
+        Returns
+        -------
+
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        old_ticker = ticker
+        ticker = ticker + self.postfix
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        if if_exists_table == 'replace':
+            shutil.rmtree(engine, ignore_errors=True)
+
+        try:
+            # Assume market data is stored in UTC (as with ALL data for tcapy)
+            market_df.index = market_df.index.tz_localize(pytz.utc)
+        except:
+            pass
+
+        logger.info("Now doing Parquet dataset dump for ticker " + ticker + " in table " + table_name)
+
+        market_df = self._tidy_market_data(market_df, old_ticker, 'dataframe', 'market',
+                                           remove_duplicates=remove_duplicates)
+
+        self._write_to_db(market_df, engine, _, table_name, ticker, if_exists_ticker,
+                          existing_datacheck=existing_datacheck)
+
+        # Any cached TCA output which used this market data is now out of date
+        self._invalidate_tca_request_cache('parquet')
+
+    def delete_market_data(self, ticker, start_date=None, finish_date=None, table_name=None):
+        """Deletes market data for a ticker between dates, only rewriting the year/month partitions which
+        overlap the dates
+
+        Parameters
+        ----------
+        ticker : str
+            Ticker
+
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        table_name : str
+            Table name
+
+        Returns
+        -------
+
+        """
+        if table_name is None:
+            table_name = constants.parquet_dataset_market_data_database_table
+
+        start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        # Load the months which overlap the dates to be deleted
+        month_start = start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0, nanosecond=0)
+        month_finish = (finish_date + pd.offsets.MonthEnd(0)).replace(
+            hour=23, minute=59, second=59, microsecond=999999)
+
+        market_df = self.fetch_market_data(start_date=month_start, finish_date=month_finish, ticker=ticker,
+                                           table_name=table_name)
+
+        if market_df is None:
+            return
+
+        market_df = self._time_series_ops.remove_between_dates(
+            market_df, start_date.tz_localize(pytz.utc), finish_date.tz_localize(pytz.utc))
+
+        # Remove those months from disk and write back what's left
+        for period in pd.period_range(month_start, month_finish, freq='M'):
+            shutil.rmtree(os.path.join(engine, 'ticker=' + ticker + self.postfix, 'year=' + str(period.year),
+                                       'month=' + str(period.month)), ignore_errors=True)
+
+        self._write_to_db(market_df, engine, _, table_name, ticker + self.postfix, 'append')
+
+        self._invalidate_tca_request_cache('parquet')
+
+########################################################################################################################
+
+class DatabaseSourceArrow(DatabaseSourceTickData):
+    """Implements DatabaseSource for market data stored in Arrow IPC (Feather v2) files on disk, one for each ticker
+    (eg. market_data_table/EURUSD-ncfx.arrow), which are sorted by date and uncompressed. Files are memory mapped, so
+    many processes (eg. Celery workers) reading the same file share the OS page cache, rather than each having a
+    private copy of the market data. When fetching, the dates are binary searched in each record batch, and the
+    slice is returned without copying, if it's in a single record batch (eg. one for each file which was converted).
+    It also allows us to store market data from multiple sources, by using the postfix notation (eg 'ncfx' or
+    'dukascopy').
+
+    """
+
+    # Process wide registry of path -> (modified time, memory mapped file reader, first dates, last dates of record batches)
+    _memory_map_cache = {}
+    _memory_map_cache_lock = threading.Lock()
+
+    def __init__(self, postfix=None, arrow_path=constants.arrow_path):
+        """Initialise the Arrow object
+
+        Parameters
+        ----------
+        postfix : str
+            Postfix can be used to identify different market data sources (eg. 'ncfx' or 'dukascopy'), if we only use
+            one market data source, this is not necessary
+
+        arrow_path : str
+            Folder of the Arrow files on disk (each table is a subfolder)
+        """
+        super(DatabaseSourceArrow, self).__init__(postfix=postfix)
+
+        self._arrow_path = arrow_path
+
+    def _get_database_engine(self, table_name=None):
+        """Gets the folder of a table of Arrow files
+
+        Parameters
+        ----------
+        table_name : str
+            Table name
+
+        Returns
+        -------
+        str, None
+        """
+        return os.path.join(self._arrow_path, table_name), None
+
+    def _get_memory_mapped_file(self, path):
+        """Gets a reader for a memory mapped Arrow file, alongside the first/last dates of each record batch, which
+        is shared by the process (until the file is modified)
+
+        Parameters
+        ----------
+        path : str
+            Path of the Arrow file
+
+        Returns
+        -------
+        pyarrow.ipc.RecordBatchFileReader, np.ndarray, np.ndarray
+        """
+        import pyarrow as pa
+
+        modified_time = os.path.getmtime(path)
+
+        with DatabaseSourceArrow._memory_map_cache_lock:
+            if path in DatabaseSourceArrow._memory_map_cache:
+                cached_time, reader, batch_start, batch_finish = DatabaseSourceArrow._memory_map_cache[path]
+
+                if cached_time == modified_time:
+                    return reader, batch_start, batch_finish
+
+            reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+
+            date_index = reader.schema.get_field_index('date')
+
+            batch_start = []; batch_finish = []
+
+            for i in range(0, reader.num_record_batches):
+                dates = reader.get_batch(i).column(date_index).to_numpy()
+
+                batch_start.append(dates[0]); batch_finish.append(dates[-1])
+
+            batch_start = np.array(batch_start, dtype='datetime64[ns]')
+            batch_finish = np.array(batch_finish, dtype='datetime64[ns]')
+
+            DatabaseSourceArrow._memory_map_cache[path] = (modified_time, reader, batch_start, batch_finish)
+
+        return reader, batch_start, batch_finish
+
+    def fetch_market_data(self, start_date=None, finish_date=None, ticker=None, table_name=None, fields=None):
+        """Fetches market data for a particular ticker
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be downloaded
+
+        table_name : str
+            Table name
+
+        fields : str (list)
+            Columns to read (default: all of them)
+
+        Returns
+        -------
+        DataFrame
+        """
+        import pyarrow as pa
+
+        logger = LoggerManager.getLogger(__name__)
+
+        ticker = ticker + self.postfix
+
+        if table_name is None:
+            table_name = constants.arrow_market_data_database_table
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        path = os.path.join(engine, ticker + '.arrow')
+
+        if not(os.path.exists(path)):
+            logger.warning("Arrow file " + path + " doesn't exist")
+
+            return None
+
+        reader, batch_start, batch_finish = self._get_memory_mapped_file(path)
+
+        # Convert dates into UTC stripped of timezone (the same as the dates on disk)
+        start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
+
+        start_date = batch_start.min() if start_date is None else np.datetime64(start_date.to_datetime64(), 'ns')
+        finish_date = batch_finish.max() if finish_date is None else np.datetime64(finish_date.to_datetime64(), 'ns')
+
+        date_index = reader.schema.get_field_index('date')
+
+        columns = [c for c in reader.schema.names if c != 'date' and (fields is None or c in fields)]
+        column_index = [reader.schema.get_field_index(c) for c in columns]
+
+        date_list = []; batch_list = []
+
+        # Only look in the record batches which overlap our dates, and binary search the dates within them
+        for i in np.nonzero((batch_finish >= start_date) & (batch_start <= finish_date))[0]:
+            batch = reader.get_batch(int(i))
+
+            dates = batch.column(date_index).to_numpy()
+
+            lo = np.searchsorted(dates, start_date, side='left')
+            hi = np.searchsorted(dates, finish_date, side='right')
+
+            if hi > lo:
+                date_list.append(dates[lo:hi])
+                batch_list.append(pa.RecordBatch.from_arrays(
+                    [batch.column(c).slice(lo, hi - lo) for c in column_index], columns))
+
+        logger.debug("Extracted Arrow file: " + path + " between " + str(start_date) + " - " + str(finish_date))
+
+        if batch_list == []:
+            table = pa.Table.from_batches([], schema=pa.schema([reader.schema.field(c) for c in columns]))
+            dates = np.array([], dtype='datetime64[ns]')
+        else:
+            # A single record batch is converted without copying (split_blocks stops pandas consolidating the columns)
+            table = pa.Table.from_batches(batch_list)
+            dates = date_list[0] if len(date_list) == 1 else np.concatenate(date_list)
+
+        df = table.to_pandas(split_blocks=True)
+
+        # Avoid _downsample_localize_utc, given localizing the whole DataFrame copies it, whereas we only need to
+        # localize the index (floats have already been downsampled on disk, if necessary)
+        df.index = pd.DatetimeIndex(dates).tz_localize(pytz.utc)
+        df.index.name = 'Date'
+
+        return self._time_series_ops.downsample_time_series_floats(df, constants.downsample_floats)
+
+    def fetch_trade_order_data(self, start_date=None, finish_date=None, ticker=None, table_name=None):
+        """Fetches trade/order data, which isn't supported for Arrow files
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker
+
+        table_name : str
+            Table name which contains trade/order data
+
+        Returns
+        -------
+        DataFrame
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        logger.error("Arrow files are not tested for storing trade data")
+
+        return
+
+    def convert_csv_to_table(self, csv_file, ticker, table_name, database_name=None, if_exists_table='replace',
+                             if_exists_ticker='replace', market_trade_data='market', date_format=None,
+                             read_in_reverse=False,
+                             csv_read_chunksize=constants.csv_read_chunksize, remove_duplicates=True):
+        """Reads CSV/Parquet/HDF5 files from disk (or potentionally a list of them for a list of different _tickers)
+        into a pandas DataFrame which is then written into an Arrow file for each ticker (with a record batch for each
+        file/chunk).
+
+        Parameters
+        ----------
+        csv_file : str (list)
+            Path of CSV file - can also include wildcard characters (assume that files are ordered in time, eg. if
+            we specify EURUSD*.csv, then EURUSD1.csv would be before EURUSD2.csv etc.
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        database_name : str
+            Database name
+
+        if_exists_table : str (default: 'replace')
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str (default: 'replace')
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        market_trade_date : str (default: 'market')
+            'market' for market data
+            'trade' for trade data
+
+        date_format : str (default: None)
+            Specify the format of the dates stored in CSV, specifying this speeds up CSV parsing considerably and
+            is recommended
+
+        csv_read_chunksize : int (default: in constants file)
+            Specifies the chunksize to read CSVs. If we are reading very large CSVs this helps us to reduce risk of running
+            out of memory
+
+        remove_duplicates : bool (default: True)
+            Should we remove consecutive duplicated market values (eg. if EURUSD is at 1.1652 and 20ms later it is also
+            recorded at 1.1652, should we ignore the second point), which will make our _calculations a lot faster
+            - whilst in many TCA cases, we can ignore duplicated
+            points, we cannot do this for situations where we might wish to use for example volume, to calculate VWAP
+
+        Returns
+        -------
+
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        if market_trade_data == 'trade':
+            logger.error("Arrow files are not tested for storing trade data")
+
+            return
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        # Delete the table (folder) if it needs to be replaced
+        if if_exists_table == 'replace':
+            shutil.rmtree(engine, ignore_errors=True)
+
+        # Writers for each ticker (with the path, last date written and schema) are kept open across the chunks
+        store = {}
+
+        try:
+            # Read CSV files (possibly in chunks) and then dump to Arrow files
+            self._stream_chunks(engine, store, csv_file, ticker, table_name,
+                                if_exists_ticker=if_exists_ticker, market_trade_data=market_trade_data,
+                                date_format=date_format,
+                                read_in_reverse=read_in_reverse,
+                                csv_read_chunksize=csv_read_chunksize, remove_duplicates=remove_duplicates)
+        except:
+            self._close_writers(store, discard=True)
+
+            raise
+
+        self._close_writers(store)
+
+        # Any cached TCA output which used this market data is now out of date
+        self._invalidate_tca_request_cache('arrow')
+
+    def _write_to_db(self, df, engine, store, table_name, ticker, if_exists_ticker, existing_datacheck='ignore'):
+        import pyarrow as pa
+
+        if df is None:
+            return
+
+        if df.empty:
+            return
+
+        # Store in UTC without the timezone, and with any downsampling done already, so reading doesn't need to copy
+        df = self._time_series_ops.localize_as_UTC(df, convert=True).tz_localize(None)
+        df = df.drop(columns=['ticker'], errors='ignore')
+        df = self._time_series_ops.downsample_time_series_floats(df, constants.downsample_floats)
+        df.index.name = 'date'
+
+        if ticker not in store:
+            if not(os.path.isdir(engine)):
+                os.makedirs(engine)
+
+            path = os.path.join(engine, ticker + '.arrow')
+
+            table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+
+            # Write to a temporary file, so readers see the old file until we've finished
+            writer = pa.ipc.new_file(path + '.tmp', table.schema)
+
+            last_date = None
+
+            # Arrow files can't be appended to, so copy over the existing record batches first
+            if if_exists_ticker == 'append' and os.path.exists(path):
+                reader, _, batch_finish = self._get_memory_mapped_file(path)
+
+                for i in range(0, reader.num_record_batches):
+                    writer.write_batch(reader.get_batch(i))
+
+                if len(batch_finish) > 0:
+                    last_date = batch_finish.max()
+
+            store[ticker] = [writer, path, last_date, table.schema]
+
+        writer, path, last_date, schema = store[ticker]
+
+        # Dates need to be sorted across the record batches, so we can binary search them later
+        if last_date is not None and df.index[0] <= last_date:
+            err_msg = "Arrow file can't append overlapping data for " + ticker + " in " + table_name + \
+                      ". Has data between " + str(df.index[0]) + ' - ' + str(df.index[-1])
+
+            LoggerManager.getLogger(__name__).error(err_msg)
+
+            raise ErrorWritingOverlapDataException(err_msg)
+
+        writer.write_table(pa.Table.from_pandas(df.reset_index(), schema=schema, preserve_index=False))
+
+        store[ticker][2] = df.index[-1].to_datetime64()
+
+    def _close_writers(self, store, discard=False):
+        """Finishes writing Arrow files, replacing any existing files
+
+        Parameters
+        ----------
+        store : dict
+            Writers for each ticker
+
+        discard : bool
+            Discard what has been written, leaving any existing files as they were (eg. if there was an error)
+
+        Returns
+        -------
+
+        """
+        for ticker in store.keys():
+            writer, path = store[ticker][0:2]
+
+            writer.close()
+
+            if discard:
+                os.remove(path + '.tmp')
+            else:
+                os.replace(path + '.tmp', path)
+
+    def append_market_data(self, market_df, ticker, table_name=constants.arrow_market_data_database_table,
+                           if_exists_table='append', if_exists_ticker='append', remove_duplicates=True,
+                           existing_datacheck='yes'):
+        """Append market data to the Arrow file for a ticker. It is expected that market data has an index of
+        DateTimeIndex, and fields such as "mid", "bid", "ask" etc. Only data after the existing data can be appended.
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            Market data to dumped
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        if_exists_table : str
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        remove_duplicates : bool
+            Should we remove consecutive duplicates in market data, mainly to reduce file size on disk
+            * True (default) - removes duplicates (ie. every bit of market data other than time the same)
+            * False - leave data as it is
+
+        existing_datacheck : str (default: 'yes')
+            Not used (data can only be appended after existing data in Arrow files)
+
+        Returns
+        -------
+
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        old_ticker = ticker
+        ticker = ticker + self.postfix
+
+        engine, _ = self._get_database_engine(table_name=table_name)
+
+        if if_exists_table == 'replace':
+            shutil.rmtree(engine, ignore_errors=True)
+
+        try:
+            # Assume market data is stored in UTC (as with ALL data for tcapy)
+            market_df.index = market_df.index.tz_localize(pytz.utc)
+        except:
+            pass
+
+        logger.info("Now doing Arrow file dump for ticker " + ticker + " in table " + table_name)
+
+        market_df = self._tidy_market_data(market_df, old_ticker, 'dataframe', 'market',
+                                           remove_duplicates=remove_duplicates)
+
+        store = {}
+
+        try:
+            self._write_to_db(market_df, engine, store, table_name, ticker, if_exists_ticker)
+        except:
+            self._close_writers(store, discard=True)
+
+            raise
+
+        self._close_writers(store)
+
+        # Any cached TCA output which used this market data is now out of date
+        self._invalidate_tca_request_cache('arrow')
+
+########################################################################################################################
+
+class DatabaseSourceDuckDB(DatabaseSourceTickData):
+    """Implements DatabaseSource for DuckDB, an embedded columnar database (so there's no server to run), for both market
+    and trade/order data. Tables can either be stored in a DuckDB database file, or we can query Parquet files directly,
+    by giving a path/glob of Parquet files as the table name (eg. a partitioned Parquet dataset written by
+    DatabaseSourceParquet, '/data/parquet_dataset/market_data_table/**/*.parquet').
+
+    The dates, ticker and any filters and columns are pushed down into the DuckDB query, and results are returned as
+    Arrow tables (fetch_market_data_arrow/fetch_trade_order_data_arrow), before being converted into DataFrames. Market
+    data for all tickers is stored in the same table, with the postfix added to the ticker (eg. EURUSD-ncfx), like
+    DatabaseSourceParquet. Note, only one process can open a DuckDB database file for writing, so processes which only
+    read (eg. Celery workers) should use read_only.
+
+    """
+
+    # Process wide registry of (database, read_only) -> (pid, DuckDB connection)
+    _connection_pool = {}
+    _connection_pool_lock = threading.Lock()
+
+    # Whether the installed DuckDB can read Hive partitions of Parquet files (None - not checked yet)
+    _hive_partitioning = None
+
+    def __init__(self, postfix=None, duckdb_database=constants.duckdb_database, read_only=constants.duckdb_read_only):
+        """Initialise the DuckDB object
+
+        Parameters
+        ----------
+        postfix : str
+            Postfix can be used to identify different market data sources (eg. 'ncfx' or 'dukascopy'), if we only use
+            one market data source, this is not necessary
+
+        duckdb_database : str
+            Path of the DuckDB database file (':memory:' if we are only querying Parquet files)
+
+        read_only : bool
+            Open the DuckDB database file as read only, so it can be shared by several processes
+        """
+        super(DatabaseSourceDuckDB, self).__init__(postfix=postfix)
+
+        self._duckdb_database = duckdb_database
+        self._read_only = read_only
+
+    def _get_database_engine(self, database_name=None, table_name=None):
+        """Gets a cursor for a DuckDB database, from a connection which is shared by the process (cursors can be used in
+        different threads)
+
+        Parameters
+        ----------
+        database_name : str
+            Path of the DuckDB database file (default: the one this object was created with)
+
+        table_name : str
+            Table name
+
+        Returns
+        -------
+        DuckDBPyConnection, str
+        """
+        import duckdb
+
+        if database_name is None:
+            database_name = self._duckdb_database
+
+        key = (database_name, self._read_only)
+
+        with DatabaseSourceDuckDB._connection_pool_lock:
+            pid = os.getpid()
+
+            # Connections can't be shared with forked processes
+            if key not in DatabaseSourceDuckDB._connection_pool or DatabaseSourceDuckDB._connection_pool[key][0] != pid:
+                if database_name != ':memory:':
+                    folder = os.path.dirname(database_name)
+
+                    if folder != '' and not(os.path.isdir(folder)) and not(self._read_only):
+                        os.makedirs(folder)
+
+                DatabaseSourceDuckDB._connection_pool[key] = \
+                    (pid, duckdb.connect(database=database_name, read_only=self._read_only))
+
+            return DatabaseSourceDuckDB._connection_pool[key][1].cursor(), database_name
+
+    def _quote(self, keyword):
+        return '"' + keyword.replace('"', '""') + '"'
+
+    def _supports_hive_partitioning(self):
+        """Checks whether the installed version of DuckDB supports the hive_partitioning option of read_parquet (older
+        versions only accept binary_as_string), by binding it against a Parquet file which doesn't exist
+
+        Returns
+        -------
+        bool
+        """
+        if DatabaseSourceDuckDB._hive_partitioning is None:
+            import duckdb
+
+            probe = os.path.join(constants.temp_data_folder, 'duckdb_probe_' + str(uuid.uuid4()) + '.parquet')
+
+            try:
+                duckdb.connect(database=':memory:').execute(
+                    "SELECT * FROM read_parquet('" + probe.replace("'", "''") + "', hive_partitioning=true)")
+
+                supported = True
+            except Exception as e:
+                # An invalid named parameter fails when binding, before DuckDB looks for any files
+                supported = 'named parameter' not in str(e)
+
+            if not(supported):
+                LoggerManager.getLogger(__name__).warning(
+                    "DuckDB " + str(duckdb.__version__) + " doesn't support hive_partitioning, so Hive partitions of "
+                    "Parquet files (eg. ticker/year/month) won't be available as columns")
+
+            DatabaseSourceDuckDB._hive_partitioning = supported
+
+        return DatabaseSourceDuckDB._hive_partitioning
+
+    def _from_clause(self, table_name):
+        """Gets the FROM clause for a table, which can either be a table in the DuckDB database or a path/glob of
+        Parquet files (with any Hive partitions as columns, if the installed DuckDB supports it)
+
+        Parameters
+        ----------
+        table_name : str
+            Table name or path/glob of Parquet files
+
+        Returns
+        -------
+        str
+        """
+        if '.parquet' in table_name:
+            if self._supports_hive_partitioning():
+                return "read_parquet('" + table_name.replace("'", "''") + "', hive_partitioning=true)"
+
+            return "read_parquet('" + table_name.replace("'", "''") + "')"
+
+        return self._quote(table_name)
+
+    def _get_table_columns(self, cursor, table_name):
+        """Gets the columns of a table (or Parquet files), or None if it doesn't exist
+
+        Parameters
+        ----------
+        cursor : DuckDBPyConnection
+            DuckDB cursor
+
+        table_name : str
+            Table name or path/glob of Parquet files
+
+        Returns
+        -------
+        str (list)
+        """
+        try:
+            cursor.execute('SELECT * FROM ' + self._from_clause(table_name) + ' LIMIT 0')
+
+            return [d[0] for d in cursor.description]
+        except Exception as e:
+            LoggerManager.getLogger(__name__).warning("Couldn't get columns of " + table_name + ": " + str(e))
+
+            return None
+
+    def _create_query(self, table_columns, table_name, start_date=None, finish_date=None, ticker=None, fields=None,
+                      filters=None, exclude_columns=[]):
+        """Creates a parameterized DuckDB query, with the dates, ticker, filters and columns pushed down (ordered by date)
+
+        Returns
+        -------
+        str, list
+        """
+        start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
+
+        columns = [c for c in table_columns if c not in exclude_columns and (fields is None or c == 'date' or c in fields)]
+
+        where_clause = []
+        params = []
+
+        if start_date is not None:
+            where_clause.append('"date" >= ?'); params.append(start_date.to_pydatetime())
+
+        if finish_date is not None:
+            where_clause.append('"date" <= ?'); params.append(finish_date.to_pydatetime())
+
+        # Skip whole year partitions of Parquet datasets outside our dates (row groups are skipped by their statistics)
+        if 'year' in table_columns and 'year' in exclude_columns and start_date is not None:
+            where_clause.append('"year" BETWEEN ? AND ?'); params.extend([start_date.year, finish_date.year])
+
+        if ticker is not None:
+            where_clause.append('"ticker" = ?'); params.append(ticker)
+
+        # Filter for columns which are in any of the specified values (eg. venue)
+        if filters is not None:
+            for column, values in filters:
+                if column in table_columns:
+                    if not(isinstance(values, list)):
+                        values = [values]
+
+                    where_clause.append(self._quote(column) + ' IN (' + ', '.join(['?'] * len(values)) + ')')
+                    params.extend(values)
+
+        sql_query = 'SELECT ' + ', '.join([self._quote(c) for c in columns]) + ' FROM ' + self._from_clause(table_name)
+
+        if where_clause != []:
+            sql_query = sql_query + ' WHERE ' + ' AND '.join(where_clause)
+
+        return sql_query + ' ORDER BY "date"', params
+
+    def _arrow_to_pandas(self, table):
+        """Converts an Arrow table from DuckDB into a DataFrame indexed by date
+
+        Parameters
+        ----------
+        table : pyarrow.Table
+            Arrow table with a date column
+
+        Returns
+        -------
+        DataFrame
+        """
+        if table is None:
+            return None
+
+        if table.num_rows == 0:
+            return None
+
+        df = table.to_pandas()
+
+        df = df.set_index('date')
+        df.index.name = 'Date'
+
+        # We store dates in UTC without timezones
+        return df.tz_localize(None)
+
+    def fetch_market_data_arrow(self, start_date=None, finish_date=None, ticker=None, table_name=None, fields=None):
+        """Fetches market data for a particular ticker as an Arrow table
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be downloaded
+
+        table_name : str
+            Table name or path/glob of Parquet files
+
+        fields : str (list)
+            Columns to read (default: all of them)
+
+        Returns
+        -------
+        pyarrow.Table
+        """
+        if table_name is None:
+            table_name = constants.duckdb_market_data_database_table
+
+        cursor, _ = self._get_database_engine(table_name=table_name)
+
+        table_columns = self._get_table_columns(cursor, table_name)
+
+        if table_columns is None:
+            return None
+
+        # Don't need the ticker (or year/month partitions of Parquet datasets) in the output
+        sql_query, params = self._create_query(table_columns, table_name, start_date=start_date,
+                                               finish_date=finish_date, ticker=ticker + self.postfix, fields=fields,
+                                               exclude_columns=['ticker', 'year', 'month'])
+
+        return cursor.execute(sql_query, params).fetch_arrow_table()
+
+    def fetch_market_data(self, start_date=None, finish_date=None, ticker=None, table_name=None, fields=None):
+        """Fetches market data for a particular ticker
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be downloaded
+
+        table_name : str
+            Table name or path/glob of Parquet files
+
+        fields : str (list)
+            Columns to read (default: all of them)
+
+        Returns
+        -------
+        DataFrame
+        """
+        df = self._arrow_to_pandas(self.fetch_market_data_arrow(start_date=start_date, finish_date=finish_date,
+                                                                ticker=ticker, table_name=table_name, fields=fields))
+
+        # Downsample floats to reduce memory footprint
+        return self._downsample_localize_utc(df, convert=True)
+
+    def fetch_trade_order_data_arrow(self, start_date=None, finish_date=None, ticker=None, table_name=None,
+                                     database_name=None, fields=None, filters=None):
+        """Fetches trade/order data as an Arrow table, with the dates, ticker, filters and columns pushed down into the
+        query.
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be collected
+
+        table_name : str
+            Table name or path/glob of Parquet files containing this particular trade/order data
+
+        database_name : str
+            Path of the DuckDB database file (default: the one this object was created with)
+
+        fields : str (list)
+            Columns to select (default: None - all columns), any which aren't in the table are ignored
+
+        filters : list of (str, str (list))
+            Columns and the values to keep for each of them, eg. [('venue', ['venue1', 'venue2'])] - any columns which
+            aren't in the table are ignored
+
+        Returns
+        -------
+        pyarrow.Table
+        """
+        cursor, _ = self._get_database_engine(database_name=database_name, table_name=table_name)
+
+        table_columns = self._get_table_columns(cursor, table_name)
+
+        if table_columns is None:
+            return None
+
+        sql_query, params = self._create_query(table_columns, table_name, start_date=start_date,
+                                               finish_date=finish_date, ticker=ticker, fields=fields, filters=filters,
+                                               exclude_columns=['year', 'month'] if '.parquet' in table_name else [])
+
+        return cursor.execute(sql_query, params).fetch_arrow_table()
+
+    def fetch_trade_order_data(self, start_date=None, finish_date=None, ticker=None, table_name=None,
+                               database_name=None, fields=None, filters=None):
+        """Fetches trade/order data, with the dates, ticker, filters and columns pushed down into the query.
+
+        Parameters
+        ----------
+        start_date : str
+            Start date
+
+        finish_date : str
+            Finish date
+
+        ticker : str
+            Ticker to be collected
+
+        table_name : str
+            Table name or path/glob of Parquet files containing this particular trade/order data
+
+        database_name : str
+            Path of the DuckDB database file (default: the one this object was created with)
+
+        fields : str (list)
+            Columns to select (default: None - all columns), any which aren't in the table are ignored
+
+        filters : list of (str, str (list))
+            Columns and the values to keep for each of them, eg. [('venue', ['venue1', 'venue2'])] - any columns which
+            aren't in the table are ignored
+
+        Returns
+        -------
+        DataFrame
+        """
+        df = self._arrow_to_pandas(self.fetch_trade_order_data_arrow(
+            start_date=start_date, finish_date=finish_date, ticker=ticker, table_name=table_name,
+            database_name=database_name, fields=fields, filters=filters))
+
+        return self._downsample_localize_utc(df)
+
+    def convert_csv_to_table(self, csv_file, ticker, table_name, database_name=None, if_exists_table='replace',
+                             if_exists_ticker='replace', market_trade_data='market', date_format=None,
+                             read_in_reverse=False,
+                             csv_read_chunksize=constants.csv_read_chunksize, remove_duplicates=True):
+        """Reads CSV from disk (or potentionally a list of CSVs for a list of different _tickers) into a pandas DataFrame
+        which is then dumped in DuckDB.
+
+        Parameters
+        ----------
+        csv_file : str (list)
+            Path of CSV file - can also include wildcard characters (assume that files are ordered in time, eg. if
+            we specify EURUSD*.csv, then EURUSD1.csv would be before EURUSD2.csv etc.
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        database_name : str
+            Path of the DuckDB database file (default: the one this object was created with)
+
+        if_exists_table : str (default: 'replace')
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str (default: 'replace')
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        market_trade_date : str (default: 'market')
+            'market' for market data
+            'trade' for trade data
+
+        date_format : str (default: None)
+            Specify the format of the dates stored in CSV, specifying this speeds up CSV parsing considerably and
+            is recommended
+
+        csv_read_chunksize : int (default: in constants file)
+            Specifies the chunksize to read CSVs. If we are reading very large CSVs this helps us to reduce risk of running
+            out of memory
+
+        remove_duplicates : bool (default: True)
+            Should we remove consecutive duplicated market values (eg. if EURUSD is at 1.1652 and 20ms later it is also
+            recorded at 1.1652, should we ignore the second point), which will make our _calculations a lot faster
+            - whilst in many TCA cases, we can ignore duplicated
+            points, we cannot do this for situations where we might wish to use for example volume, to calculate VWAP
+
+        Returns
+        -------
+
+        """
+        cursor, _ = self._get_database_engine(database_name=database_name, table_name=table_name)
+
+        if if_exists_table == 'replace':
+            cursor.execute('DROP TABLE IF EXISTS ' + self._quote(table_name))
+
+        if market_trade_data == 'trade':
+            # Trades/orders for every ticker are stored in the same table, and are small enough to read in one go
+            if isinstance(csv_file, str):
+                csv_file = [csv_file]
+
+            for i in range(0, len(csv_file)):
+                df = pd.read_csv(csv_file[i], index_col=0)
+
+                df.index = pd.to_datetime(df.index, format=date_format)
+
+                df = self._convert_type_columns(df.tz_localize(None), date_format=date_format)
+
+                self._write_to_db(df, cursor, None, table_name, None, 'append')
+        else:
+            # Read CSV files (possibly in chunks) and then dump to DuckDB
+            self._stream_chunks(cursor, None, csv_file, ticker, table_name,
+                                if_exists_ticker=if_exists_ticker, market_trade_data=market_trade_data,
+                                date_format=date_format,
+                                read_in_reverse=read_in_reverse,
+                                csv_read_chunksize=csv_read_chunksize, remove_duplicates=remove_duplicates)
+
+        # Any cached TCA output which used this market or trade/order data is now out of date
+        self._invalidate_tca_request_cache('duckdb')
+
+    def _write_to_db(self, df, engine, store, table_name, ticker, if_exists_ticker, existing_datacheck='ignore'):
+        logger = LoggerManager.getLogger(__name__)
+
+        if df is None:
+            return
+
+        if df.empty:
+            return
+
+        # Store in UTC without the timezone (as with the other date columns)
+        df = self._time_series_ops.localize_as_UTC(df, convert=True).tz_localize(None)
+
+        for c in constants.date_columns:
+            if c in df.columns:
+                try:
+                    df[c] = df[c].dt.tz_convert(None)
+                except:
+                    pass
+
+        df.index.name = 'date'
+        df = df.reset_index()
+
+        # Market data for every ticker is stored in the same table (trades/orders already have a ticker column)
+        if ticker is not None:
+            df['ticker'] = ticker
+
+        table = self._quote(table_name)
+        columns = ', '.join([self._quote(c) for c in df.columns])
+
+        engine.register('tcapy_df', df)
+
+        try:
+            engine.execute('CREATE TABLE IF NOT EXISTS ' + table + ' AS SELECT ' + columns + ' FROM tcapy_df LIMIT 0')
+
+            if ticker is not None:
+                if if_exists_ticker == 'replace':
+                    engine.execute('DELETE FROM ' + table + ' WHERE "ticker" = ?', [ticker])
+
+                elif if_exists_ticker == 'append' and existing_datacheck != 'ignore':
+                    # Only allow people to append to the end (unless they set the existing_datacheck parameter)
+                    existing_rows = engine.execute('SELECT COUNT(*) FROM ' + table + ' WHERE "ticker" = ? AND "date" >= ?',
+                                                   [ticker, df['date'].iloc[0].to_pydatetime()]).fetchone()[0]
+
+                    if existing_rows > 0:
+                        err_msg = "DuckDB can't append overlapping data for " + ticker + \
+                                  " in " + table_name + ". Has data between " + str(df['date'].iloc[0]) + ' - ' \
+                                  + str(df['date'].iloc[-1])
+
+                        logger.error(err_msg)
+
+                        raise ErrorWritingOverlapDataException(err_msg)
+
+            engine.execute('INSERT INTO ' + table + ' (' + columns + ') SELECT ' + columns + ' FROM tcapy_df')
+        finally:
+            engine.unregister('tcapy_df')
+
+        logger.debug("Written " + str(len(df.index)) + " rows to DuckDB table " + table_name)
+
+    def append_market_data(self, market_df, ticker, table_name=constants.duckdb_market_data_database_table,
+                           if_exists_table='append', if_exists_ticker='append', remove_duplicates=True,
+                           existing_datacheck='yes'):
+        """Append market data to DuckDB. It is expected that market data has an index of DateTimeIndex, and fields
+        such as "mid", "bid", "ask" etc.
+
+        Parameters
+        ----------
+        market_df : DataFrame
+            Market data to dumped
+
+        ticker : str
+            Ticker for the dataset (for market data eg. EURUSD, for trade data eg. trade_df
+
+        table_name : str
+            Table to store data in
+
+        if_exists_table : str
+            What to do if the database table already exists
+            * 'replace' - replaces the database table (default)
+            * 'append' - appends to the database table
+
+        if_exists_ticker : str
+            What to do if the ticker already exists in a table
+            * 'replace' - replaces the ticker data already there (default)
+            * 'append' - appends to the existing ticker data
+
+        remove_duplicates : bool
+            Should we remove consecutive duplicates in market data, mainly to reduce file size on disk
+            * True (default) - removes duplicates (ie. every bit of market data other than time the same)
+            * False - leave data as it is
+
+        existing_datacheck : str (default: 'yes')
+            If set to 'ignore', we won't check whether there's data already in the table after this period
+
+        Returns
+        -------
+
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        old_ticker = ticker
+        ticker = ticker + self.postfix
+
+        cursor, _ = self._get_database_engine(table_name=table_name)
+
+        if if_exists_table == 'replace':
+            cursor.execute('DROP TABLE IF EXISTS ' + self._quote(table_name))
+
+        try:
+            # Assume market data is stored in UTC (as with ALL data for tcapy)
+            market_df.index = market_df.index.tz_localize(pytz.utc)
+        except:
+            pass
+
+        logger.info("Now doing DuckDB dump for ticker " + ticker + " in table " + table_name)
+
+        market_df = self._tidy_market_data(market_df, old_ticker, 'dataframe', 'market',
+                                           remove_duplicates=remove_duplicates)
+
+        self._write_to_db(market_df, cursor, None, table_name, ticker, if_exists_ticker,
+                          existing_datacheck=existing_datacheck)
+
+        # Any cached TCA output which used this market data is now out of date
+        self._invalidate_tca_request_cache('duckdb')
+
+    def delete_market_data(self, ticker, start_date=None, finish_date=None, table_name=None):
+        if table_name is None:
+            table_name = constants.duckdb_market_data_database_table
+
+        start_date, finish_date = self._parse_start_finish_dates(start_date, finish_date)
+
+        cursor, _ = self._get_database_engine(table_name=table_name)
+
+        cursor.execute('DELETE FROM ' + self._quote(table_name) + ' WHERE "ticker" = ? AND "date" >= ? AND "date" <= ?',
+                       [ticker + self.postfix, start_date.to_pydatetime(), finish_date.to_pydatetime()])
+
+        self._invalidate_tca_request_cache('duckdb')
+
+########################################################################################################################
+
 class DatabaseSourceInfluxDB(DatabaseSourceTickData):
     """Wrapper for InfluxDB to access market data for tcapy
 
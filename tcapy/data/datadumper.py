@@ -11,8 +11,9 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 import os
 
 from tcapy.util.loggermanager import LoggerManager
+from tcapy.util.mediator import Mediator
 from tcapy.data.databasesource import AccessControl, DatabaseSourceArctic, DatabaseSourcePyStore, DatabaseSourceInfluxDB, \
-    DatabaseSourceKDB
+    DatabaseSourceKDB, DatabaseSourceParquet
 
 from tcapy.conf.constants import Constants
 
@@ -70,6 +71,12 @@ class DataDumper(object):
             if market_data_database_table is None:
                 market_data_database_table = constants.pystore_market_data_database_table
 
+        if market_data_store == 'parquet':
+            database_source = DatabaseSourceParquet(postfix=data_vendor)
+
+            if market_data_database_table is None:
+                market_data_database_table = constants.parquet_dataset_market_data_database_table
+
         if market_data_store == 'influxdb':
             if server_host is None:
                 server_host = constants.influxdb_host
@@ -152,6 +159,9 @@ class DataDumper(object):
 
                 print(df)
 
+        # Any cached TCA output which used this market data is now out of date
+        Mediator.get_volatile_cache().invalidate_tca_request_cache(market_data_store + '-' + data_vendor)
+
         logger.info("Finished uploading data to " + market_data_store)
 
     def upload_trade_data_flat_file(self, sql_database_type=None, trade_data_database_name=None,
@@ -193,3 +203,6 @@ class DataDumper(object):
             database_source.convert_csv_to_table(
                 csv_sql_table_trade_order_mapping[key], None, key, database_name=trade_data_database_name,
                 if_exists_table=if_exists_trade_table)
+
+        # Any cached TCA output which used these trades/orders is now out of date
+        Mediator.get_volatile_cache().invalidate_tca_request_cache(sql_database_type)
@@ -82,7 +82,8 @@ class DataFactory(object):
                 df = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date,
                                                             ticker=ticker,
                                                             table_name=trade_order_mapping[trade_order_type],
-                                                            database_name=trade_data_database_name)
+                                                            database_name=trade_data_database_name,
+                                                            **self._get_push_down(data_request))
             else:
                 # Otherwise we have a CSV file without any sort of mapping, which we assume only contains trade_df data
                 df = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date,
@@ -98,6 +99,60 @@ class DataFactory(object):
 
         return df
 
+    def fetch_table_chunks(self, data_request):
+        """Fetches trade/order data from the underlying DatabaseSource as a generator of DataFrames ordered by date, which
+        have each been normalized. For SQL databases, the query is streamed in chunks of constants.sql_fetch_chunksize rows,
+        so large requests (eg. multi-year) don't need to be held in memory at once. For any other DatabaseSource, the whole
+        table is fetched as a single chunk (see fetch_table).
+
+        Parameters
+        ----------
+        data_request : DataRequest
+            Request for data with start/finish date etc.
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        database_source = Mediator.get_database_source_picker().get_database_source(data_request)
+
+        if not(isinstance(data_request, TradeRequest)) or not(isinstance(database_source, DatabaseSourceSQL)) \
+                or data_request.trade_order_mapping is None:
+
+            df = self.fetch_table(data_request)
+
+            if df is not None and not(df.empty):
+                yield df
+
+            return
+
+        data_norm = data_request.data_norm
+
+        if data_norm is None:
+            data_norm = Mediator.get_data_norm(version=self._version)
+
+        for df in database_source.fetch_trade_order_data_chunks(
+                start_date=data_request.start_date, finish_date=data_request.finish_date, ticker=data_request.ticker,
+                table_name=data_request.trade_order_mapping[data_request.trade_order_type],
+                database_name=data_request.trade_data_database_name, **self._get_push_down(data_request)):
+
+            df = data_norm.normalize_trade_data(df, None, data_request)
+
+            if df is not None and not(df.empty):
+                yield df
+
+    def _get_push_down(self, data_request):
+        # Columns and filters which can be pushed down into the query (only supported for SQL and DuckDB)
+        push_down = {}
+
+        if getattr(data_request, 'trade_order_fields', None) is not None:
+            push_down['fields'] = data_request.trade_order_fields
+
+        if getattr(data_request, 'trade_order_filters', None) is not None:
+            push_down['filters'] = data_request.trade_order_filters
+
+        return push_down
+
 class DataNorm(object):
     """This class can be used to normalise the data, eg. change _tag names, adjust timing etc.
 
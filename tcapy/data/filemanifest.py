@@ -0,0 +1,330 @@
+from __future__ import print_function, division
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+from tcapy.conf.constants import Constants
+from tcapy.util.loggermanager import LoggerManager
+
+constants = Constants()
+
+class FileManifest(object):
+    """Maintains a sidecar manifest (a JSON file) for each folder of market/trade data files (eg. daily CSV/Parquet
+    dumps), with the first/last timestamp, number of rows, tickers and a hash of the schema of each file. For wildcard
+    paths (eg. /data/csv_dump/EURUSD_*.parquet) we can then open only the files which overlap the dates/ticker of a
+    request, in true time order, rather than every file in alphabetical order.
+
+    Entries are added when files are written (update_file). Any entries which are missing, or stale (ie. the file has
+    been modified since), are rebuilt on demand by reading the file.
+
+    """
+
+    # Only one thread in the process should be rewriting a manifest at a time
+    _manifest_lock = threading.Lock()
+
+    def __init__(self, manifest_name=constants.file_manifest_name):
+        """Initialise the manifest
+
+        Parameters
+        ----------
+        manifest_name : str
+            File name of the manifest in each folder
+        """
+        self._manifest_name = manifest_name
+
+    def get_manifest_path(self, folder):
+        return os.path.join(folder, self._manifest_name)
+
+    def read_manifest(self, folder):
+        """Reads the manifest of a folder, with an entry for each file name (empty if there isn't a manifest)
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the files
+
+        Returns
+        -------
+        dict
+        """
+        path = self.get_manifest_path(folder)
+
+        if not(os.path.isfile(path)):
+            return {}
+
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            LoggerManager.getLogger(__name__).warning("Couldn't read manifest " + path + ", will rebuild it: " + str(e))
+
+            return {}
+
+    def write_manifest(self, folder, manifest):
+        """Writes the manifest of a folder (to a temporary file first, so readers never see a partially written manifest)
+
+        Parameters
+        ----------
+        folder : str
+            Folder of the files
+
+        manifest : dict
+            Entries for each file name
+        """
+        path = self.get_manifest_path(folder)
+        temp_path = path + '.' + str(uuid.uuid4()) + '.tmp'
+
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+
+            os.replace(temp_path, path)
+        except Exception as e:
+            LoggerManager.getLogger(__name__).warning("Couldn't write manifest " + path + ": " + str(e))
+
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def create_entry(self, path, df, tickers=None):
+        """Creates the manifest entry for a file, from its contents
+
+        Parameters
+        ----------
+        path : str
+            Path of the file (which has already been written)
+
+        df : DataFrame
+            Contents of the file, with a DatetimeIndex
+
+        tickers : str (list)
+            Tickers in the file, if it doesn't have a ticker column (default: None - unknown)
+
+        Returns
+        -------
+        dict
+        """
+        stat = os.stat(path)
+
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'rows': 0, 'start_date': None, 'finish_date': None,
+                 'tickers': tickers, 'schema_hash': None}
+
+        if df is None:
+            return entry
+
+        schema = [[str(df.index.name), str(df.index.dtype)]] + [[str(c), str(df[c].dtype)] for c in df.columns]
+
+        entry['schema_hash'] = hashlib.md5(json.dumps(schema).encode('utf-8')).hexdigest()
+        entry['rows'] = len(df.index)
+
+        if 'ticker' in df.columns:
+            entry['tickers'] = sorted([str(t) for t in df['ticker'].dropna().unique()])
+
+        if len(df.index) > 0:
+            index = pd.DatetimeIndex(df.index)
+
+            # Store dates as UTC without the timezone
+            if index.tz is not None:
+                index = index.tz_convert('utc').tz_localize(None)
+
+            entry['start_date'] = index.min().isoformat()
+            entry['finish_date'] = index.max().isoformat()
+
+        return entry
+
+    def update_file(self, path, df, tickers=None):
+        """Adds (or replaces) the manifest entry for a file, which has just been written
+
+        Parameters
+        ----------
+        path : str
+            Path of the file
+
+        df : DataFrame
+            Contents of the file, with a DatetimeIndex
+
+        tickers : str (list)
+            Tickers in the file, if it doesn't have a ticker column (default: None - unknown)
+        """
+        folder, file_name = os.path.split(os.path.abspath(path))
+
+        if isinstance(tickers, str):
+            tickers = [tickers]
+
+        with FileManifest._manifest_lock:
+            manifest = self.read_manifest(folder)
+            manifest[file_name] = self.create_entry(path, df, tickers=tickers)
+
+            self.write_manifest(folder, manifest)
+
+    def _is_fresh(self, path, entry):
+        stat = os.stat(path)
+
+        return entry is not None and entry.get('mtime') == stat.st_mtime_ns and entry.get('size') == stat.st_size
+
+    def _glob_files(self, file_glob):
+        return [os.path.abspath(f) for f in glob.glob(file_glob)
+                if os.path.isfile(f) and os.path.basename(f) != self._manifest_name and not(f.endswith('.tmp'))]
+
+    def rebuild_manifest(self, file_glob, read_func, force=False):
+        """Gets the manifest entries of every file matching a path (with wildcards), reading any files which don't have
+        an entry (or have been modified since), and saving the manifest of each folder, if it has changed. Entries for
+        files in the folder which no longer exist are removed.
+
+        Parameters
+        ----------
+        file_glob : str
+            Path of the files, with wildcards (eg. /data/csv_dump/EURUSD_*.parquet)
+
+        read_func : function
+            Reads a file into a DataFrame with a DatetimeIndex
+
+        force : bool (default: False)
+            Read every file, even if its entry is up to date
+
+        Returns
+        -------
+        dict
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        file_list = self._glob_files(file_glob)
+
+        folder_dict = {}
+
+        for f in file_list:
+            folder_dict.setdefault(os.path.dirname(f), []).append(f)
+
+        entries = {}
+
+        for folder in folder_dict.keys():
+            manifest = self.read_manifest(folder)
+            updated = {}
+
+            for f in folder_dict[folder]:
+                file_name = os.path.basename(f)
+
+                if force or not(self._is_fresh(f, manifest.get(file_name))):
+                    logger.debug("Adding " + f + " to manifest")
+
+                    tickers = None
+
+                    # Keep any tickers we were given when the file was written (eg. if it has no ticker column)
+                    if file_name in manifest:
+                        tickers = manifest[file_name].get('tickers')
+
+                    updated[file_name] = self.create_entry(f, read_func(f), tickers=tickers)
+
+                entries[f] = updated.get(file_name, manifest.get(file_name))
+
+            deleted = [x for x in manifest.keys() if not(os.path.isfile(os.path.join(folder, x)))]
+
+            if updated != {} or deleted != []:
+                # Reread, in case other files have been written in the meantime
+                with FileManifest._manifest_lock:
+                    manifest = self.read_manifest(folder)
+                    manifest.update(updated)
+
+                    for file_name in deleted:
+                        manifest.pop(file_name, None)
+
+                    self.write_manifest(folder, manifest)
+
+        return entries
+
+    def get_files(self, file_glob, read_func, start_date=None, finish_date=None, ticker=None):
+        """Gets the files matching a path (with wildcards) which overlap with the dates and ticker, sorted by their
+        first timestamp. Any files without up to date manifest entries are read first (with read_func).
+
+        Parameters
+        ----------
+        file_glob : str
+            Path of the files, with wildcards (eg. /data/csv_dump/EURUSD_*.parquet)
+
+        read_func : function
+            Reads a file into a DataFrame with a DatetimeIndex
+
+        start_date : pd.Timestamp
+            Start date (UTC without timezone)
+
+        finish_date : pd.Timestamp
+            Finish date (UTC without timezone)
+
+        ticker : str
+            Ticker, only used to skip files where we know which tickers they contain
+
+        Returns
+        -------
+        str (list)
+        """
+        entries = self.rebuild_manifest(file_glob, read_func)
+
+        file_list = []
+
+        for f in entries.keys():
+            entry = entries[f]
+
+            if entry['rows'] == 0:
+                continue
+
+            if start_date is not None and pd.Timestamp(entry['finish_date']) < start_date:
+                continue
+
+            if finish_date is not None and pd.Timestamp(entry['start_date']) > finish_date:
+                continue
+
+            if ticker is not None and entry['tickers'] is not None and ticker not in entry['tickers']:
+                continue
+
+            file_list.append(f)
+
+        file_list.sort(key=lambda f: (entries[f]['start_date'], entries[f]['finish_date'], f))
+
+        if len(set([entries[f]['schema_hash'] for f in file_list])) > 1:
+            LoggerManager.getLogger(__name__).warning("Files in " + file_glob + " have different columns/types")
+
+        return file_list
+
+    def sort_files(self, file_list):
+        """Sorts files by their first timestamp, if every one of them has an up to date manifest entry, otherwise
+        alphabetically (without reading any files)
+
+        Parameters
+        ----------
+        file_list : str (list)
+            Paths of the files
+
+        Returns
+        -------
+        str (list)
+        """
+        manifest_dict = {}
+        start_dates = {}
+
+        for f in file_list:
+            folder, file_name = os.path.split(os.path.abspath(f))
+
+            if folder not in manifest_dict:
+                manifest_dict[folder] = self.read_manifest(folder)
+
+            entry = manifest_dict[folder].get(file_name)
+
+            if entry is None or entry.get('start_date') is None or not(self._is_fresh(f, entry)):
+                return sorted(file_list)
+
+            start_dates[f] = entry['start_date']
+
+        return sorted(file_list, key=lambda f: (start_dates[f], f))
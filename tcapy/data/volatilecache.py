@@ -133,6 +133,7 @@ from tcapy.util.loggermanager import LoggerManager
 constants = Constants()
 
 import datetime
+import hashlib
 import random
 
 import io
@@ -165,11 +166,173 @@ class CacheHandle(dict):
 
 ########################################################################################################################
 
+import collections
+import fnmatch
+import time
+
+class LocalCache(object):
+    """In-process LRU cache for DataFrames, which sits in front of the (shared) volatile cache, so that objects fetched
+    repeatedly in the same process (eg. by chart callbacks), don't need to be fetched from Redis and deserialized again.
+
+    It is bounded by the total memory usage of the DataFrames (in bytes) and objects expire after a TTL. Note, that it is
+    only invalidated by put/delete/clear_key_match calls in the same process, hence objects can be stale for up to the TTL
+    if they are overwritten by another process.
+    """
+
+    def __init__(self, max_size_bytes=None, expiry_seconds=None):
+        if max_size_bytes is None: max_size_bytes = constants.volatile_cache_local_max_size_mb * 1024 * 1024
+        if expiry_seconds is None: expiry_seconds = constants.volatile_cache_expiry_seconds
+
+        self._max_size_bytes = max_size_bytes
+        self._expiry_seconds = expiry_seconds
+
+        self._local_cache_lock = threading.Lock()
+
+        # key -> (DataFrame, size in bytes, expiry time), with least recently used first
+        self._db = collections.OrderedDict()
+        self._size_bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _get_size_bytes(self, df):
+        return int(df.memory_usage(index=True, deep=False).sum())
+
+    def _pop(self, key):
+        _, size_bytes, _ = self._db.pop(key)
+
+        self._size_bytes = self._size_bytes - size_bytes
+
+    def get(self, key):
+        """Gets copies of the DataFrames associated with the keys (or None if they are not in the cache or have expired)
+
+        Parameters
+        ----------
+        key : str (list)
+            Keys to fetch
+
+        Returns
+        -------
+        DataFrame (list)
+        """
+        obj = []
+
+        now = time.time()
+
+        with self._local_cache_lock:
+            for k in key:
+                if k in self._db and self._db[k][2] < now:
+                    self._pop(k)
+
+                if k in self._db:
+                    self._db.move_to_end(k)
+
+                    self._hits = self._hits + 1
+
+                    # Return a copy, so callers can't alter the cached DataFrame
+                    obj.append(self._db[k][0].copy())
+                else:
+                    self._misses = self._misses + 1
+
+                    obj.append(None)
+
+        return obj
+
+    def put(self, key, obj):
+        """Puts copies of DataFrames in the cache, evicting the least recently used ones if it exceeds its maximum size.
+        Any other objects are ignored.
+
+        Parameters
+        ----------
+        key : str (list)
+            Keys to store
+
+        obj : DataFrame (list)
+            DataFrames to store
+        """
+        with self._local_cache_lock:
+            for k, o in zip(key, obj):
+                if k in self._db:
+                    self._pop(k)
+
+                if not(isinstance(o, pd.DataFrame)):
+                    continue
+
+                size_bytes = self._get_size_bytes(o)
+
+                if size_bytes > self._max_size_bytes:
+                    continue
+
+                self._db[k] = (o.copy(), size_bytes, time.time() + self._expiry_seconds)
+                self._size_bytes = self._size_bytes + size_bytes
+
+            while self._size_bytes > self._max_size_bytes:
+                self._pop(next(iter(self._db)))
+
+                self._evictions = self._evictions + 1
+
+    def delete(self, key):
+        with self._local_cache_lock:
+            for k in key:
+                if k in self._db:
+                    self._pop(k)
+
+    def clear_key_match(self, key_match):
+        """Removes keys matching a Redis style glob pattern (eg. "*session_id*")
+        """
+        with self._local_cache_lock:
+            for k in [k for k in self._db.keys() if fnmatch.fnmatchcase(k, key_match)]:
+                self._pop(k)
+
+    def clear_cache(self):
+        with self._local_cache_lock:
+            self._db.clear()
+            self._size_bytes = 0
+
+    def get_stats(self):
+        """Gets the number of hits, misses, evictions, alongside the number of keys and total size of the cache
+
+        Returns
+        -------
+        dict
+        """
+        with self._local_cache_lock:
+            return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions,
+                    'keys': len(self._db), 'size_bytes': self._size_bytes}
+
+########################################################################################################################
+
 class VolatileAdvCache(VolatileCache):
-    """Adds additional features for the cache to pass DataFrame by their return_cache_handles and to catch DataRequests
+    """Adds additional features for the cache to pass DataFrame by their return_cache_handles and to catch DataRequests.
+    Optionally, DataFrames which are fetched can also be kept in an in-process LocalCache (if volatile_cache_local is set).
 
     """
 
+    _volatile_adv_cache_lock = threading.Lock()
+    _local_cache = None
+    _leases = {}
+    _held_leases = threading.local()
+
+    def __init__(self):
+        super(VolatileAdvCache, self).__init__()
+
+        with VolatileAdvCache._volatile_adv_cache_lock:
+            if constants.volatile_cache_local and VolatileAdvCache._local_cache is None:
+                VolatileAdvCache._local_cache = LocalCache()
+
+    def get_local_cache_stats(self):
+        """Gets the hits/misses etc. of the in-process LocalCache
+
+        Returns
+        -------
+        dict (or None if there is no LocalCache)
+        """
+        if VolatileAdvCache._local_cache is None:
+            return None
+
+        return VolatileAdvCache._local_cache.get_stats()
+
     def _create_data_request_cache_key(self, data_store, ticker, start_date, finish_date, tag, offset_ms, unique=False):
         """Creates a key for a particular dataset, which can be used as the key in the cache, when storing the associated
         dataset.
@@ -305,6 +468,563 @@ class VolatileAdvCache(VolatileCache):
                 self.put(key, df)
 
 
+    _tca_results_prefix = 'tca_results_'
+    _tca_data_version_prefix = 'tca_data_version_'
+
+    def get_tca_request_cache(self, tca_request):
+        """Fetches the output of TCAEngine for a TCARequest from the cache, if the same TCARequest has already been
+        calculated (eg. by another user or via the API) and the data stores it uses haven't been changed since (see
+        invalidate_tca_request_cache). If it doesn't exist then None is returned.
+
+        The key returned should be used with put_tca_request_cache, after calculating the TCARequest (which might alter
+        it).
+
+        Parameters
+        ----------
+        tca_request : TCARequest
+            Parameters for the TCA calculation
+
+        Returns
+        -------
+        str, dict
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        # Tokens for the data stores, which are changed every time data is written to them, alongside tokens for their
+        # types (eg. 'parquet' for 'parquet-ncfx'), which are changed when a DatabaseSource writes to them
+        data_store = [d for d in [tca_request.market_data_store, tca_request.trade_data_store] if isinstance(d, str)]
+        data_store = data_store + [d.split('-')[0] for d in data_store if '-' in d]
+        data_version = [None] * len(data_store)
+
+        if data_store != []:
+            data_version = self.get([self._tca_data_version_prefix + d for d in data_store])
+
+            # Can't check whether the data has changed, so don't share the output
+            if data_version is None:
+                return None, None
+
+            # Tokens which don't exist yet (or have been evicted) are created, rather than matching output which was
+            # cached before the data store was last written to
+            data_store_missing = [d for d, v in zip(data_store, data_version) if v is None]
+
+            if data_store_missing != []:
+                token = self._create_tca_data_version_token()
+
+                self.put([self._tca_data_version_prefix + d for d in data_store_missing],
+                         [token] * len(data_store_missing))
+
+                data_version = [token if v is None else v for v in data_version]
+
+        data_version = [self._decode_str(v) for v in data_version]
+
+        key = self._tca_results_prefix + tca_request.get_fingerprint() + '_' \
+              + hashlib.md5('_'.join(data_version).encode('utf-8')).hexdigest() + '_expiry_'
+
+        # Only try cache if reload hasn't been requested
+        if tca_request.reload:
+            return key, None
+
+        dict_key_list = self.get(key)
+
+        if dict_key_list is None or isinstance(dict_key_list, pd.DataFrame):
+            return key, None
+
+        dict_key_list = self._decode_str(dict_key_list).split(',')
+
+        obj = self.get([key + '_' + k for k in dict_key_list])
+
+        # Some of the output might have been evicted/expired
+        if obj is None or any([o is None for o in obj]):
+            return key, None
+
+        logger.debug("Fetched TCA output for " + key + " from cache")
+
+        return key, collections.OrderedDict(zip(dict_key_list, obj))
+
+    def _decode_str(self, obj):
+        # Strings come back from the cache as a list of bytes
+        if isinstance(obj, list):
+            obj = obj[0] if len(obj) > 0 else None
+
+        if isinstance(obj, bytes):
+            return obj.decode('utf-8')
+
+        return str(obj)
+
+    def put_tca_request_cache(self, key, dict_of_df):
+        """Stores the output of TCAEngine for a TCARequest in the cache (expiring after volatile_cache_expiry_seconds), so
+        it can be shared with anyone who later calculates the same TCARequest.
+
+        Parameters
+        ----------
+        key : str
+            Key returned by get_tca_request_cache
+
+        dict_of_df : dict
+            Output of TCAEngine
+        """
+        if key is None or dict_of_df is None:
+            return
+
+        dict_key_list = list(dict_of_df.keys())
+
+        # Keys are listed last, so the output is only found once it has all been stored
+        self.put([key + '_' + k for k in dict_key_list] + [key],
+                 [dict_of_df[k] for k in dict_key_list] + [','.join(dict_key_list)])
+
+    def invalidate_tca_request_cache(self, data_store):
+        """Marks the data in a data store as having changed (eg. after new market data has been appended), so any cached
+        output of TCAEngine which used that data store is no longer shared.
+
+        Parameters
+        ----------
+        data_store : str (list)
+            Data store(s) which have changed (eg. 'arctic-ncfx' or 'ms_sql_server')
+        """
+        if not(isinstance(data_store, list)):
+            data_store = [data_store]
+
+        token = self._create_tca_data_version_token()
+
+        self.put([self._tca_data_version_prefix + d for d in data_store], [token] * len(data_store))
+
+    def _create_tca_data_version_token(self):
+        return str(datetime.datetime.utcnow()) + str(random.randint(1, 1000000))
+
+    def _get_data_request_periods(self, start_date, finish_date, period):
+        """Gets the whole periods (eg. months) which cover a date range, as a list of (start, finish) tuples
+        """
+        if period not in ['month', 'week', 'day']:
+            raise Exception("Invalid period chunk specified!")
+
+        periods = []
+
+        date = start_date
+
+        while date <= finish_date:
+            period_start, period_finish = self._util_func.period_bounds(date, period=period)
+
+            periods.append((period_start, period_finish))
+
+            date = period_finish + datetime.timedelta(microseconds=1)
+
+        return periods
+
+    def get_data_request_cache_stitched(self, data_request, data_store, market_trade_order, data_offset_ms, fetch_func,
+                                        fetch_chunks_func=None):
+        """Fetches the DataFrame associated with DataRequest, by splitting it into the whole periods (eg. months) which
+        cover it. Periods which are already in the cache are fetched from it (in a single call), and the gaps between
+        them are fetched from the database with fetch_func (merging consecutive missing periods into one call), which
+        are then split into periods and written back to the cache. Hence, requests which overlap with previous ones, only
+        need to fetch the missing periods from the database.
+
+        Note, the DataFrame will cover the whole periods, so will usually need to be stripped down afterwards.
+
+        Parameters
+        ----------
+        data_request : DataRequest
+            Request for market or trade/order data
+
+        data_store : str
+            Data store (eg. arctic-ncfx)
+
+        market_trade_order : str
+            Is it market data or trade data (eg. market_df or trade_df)
+
+        data_offset_ms : int
+            How much should we offset DataRequest by
+
+        fetch_func : function
+            Fetches data from the database for a start and finish date, eg. fetch_func(start_date, finish_date)
+
+        fetch_chunks_func : function (default: None)
+            If set, fetches data from the database for a start and finish date as a generator of DataFrames ordered by
+            date, eg. fetch_chunks_func(start_date, finish_date), which is used instead of fetch_func, so each period
+            is pushed into the cache as soon as it is complete
+
+        Returns
+        -------
+        datetime, datetime, str, DataFrame
+            Start and finish of the periods, key (only if the DataFrame is a single period which was already in the cache)
+            and the DataFrame
+        """
+        if fetch_chunks_func is not None:
+            bulk_fetch_chunks_func = \
+                lambda data_request, start_date, finish_date: fetch_chunks_func(start_date, finish_date)
+        else:
+            bulk_fetch_chunks_func = None
+
+        return self.get_data_request_cache_bulk(
+            [data_request], data_store, market_trade_order, data_offset_ms,
+            lambda data_request, start_date, finish_date: fetch_func(start_date, finish_date),
+            fetch_chunks_func=bulk_fetch_chunks_func)[0]
+
+    def get_data_request_cache_bulk(self, data_request_list, data_store, market_trade_order, data_offset_ms, fetch_func,
+                                    fetch_chunks_func=None):
+        """Fetches the DataFrames associated with several DataRequests (eg. for different tickers), in the same way as
+        get_data_request_cache_stitched. However, the periods for all of them are fetched from the cache in a single call
+        (rather than one call per DataRequest). Any missing periods are fetched from the database (with one call for each
+        contiguous gap in a DataRequest), and are all written back to the cache in a single call.
+
+        Parameters
+        ----------
+        data_request_list : DataRequest (list)
+            Requests for market or trade/order data
+
+        data_store : str
+            Data store (eg. arctic-ncfx)
+
+        market_trade_order : str
+            Is it market data or trade data (eg. market_df or trade_df)
+
+        data_offset_ms : int
+            How much should we offset DataRequest by
+
+        fetch_func : function
+            Fetches data from the database for a DataRequest between a start and finish date, eg.
+            fetch_func(data_request, start_date, finish_date)
+
+        fetch_chunks_func : function (default: None)
+            If set, fetches data from the database for a DataRequest between a start and finish date as a generator of
+            DataFrames ordered by date, eg. fetch_chunks_func(data_request, start_date, finish_date), which is used
+            instead of fetch_func, so each period is pushed into the cache as soon as it is complete
+
+        Returns
+        -------
+        list of (datetime, datetime, str, DataFrame)
+            For each DataRequest, the start and finish of the periods, key (only if the DataFrame is a single period which
+            was already in the cache) and the DataFrame
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        # Flatten the periods of every DataRequest into one list, noting which DataRequest each came from
+        periods = []; keys = []; group = []
+
+        for j, data_request in enumerate(data_request_list):
+            for period_start, period_finish in self._get_data_request_periods(
+                    data_request.start_date, data_request.finish_date, data_request.multithreading_params['cache_period']):
+
+                periods.append((period_start, period_finish))
+                keys.append(self._create_data_request_cache_key(data_store, data_request.ticker, period_start,
+                                                                period_finish, market_trade_order, data_offset_ms))
+                group.append(j)
+
+        df_list = [None] * len(keys)
+
+        # Only try cache if reload hasn't been requested!
+        cached = [i for i in range(0, len(keys)) if not(data_request_list[group[i]].reload)]
+
+        if cached != []:
+            df_cached = self.get([keys[i] for i in cached])
+
+            if df_cached is not None:
+                for i, df in zip(cached, df_cached):
+                    df_list[i] = df
+
+        missing = [i for i in range(0, len(keys)) if df_list[i] is None]
+
+        logger.debug("For " + str([d.ticker for d in data_request_list]) + " " + market_trade_order + " found " +
+                     str(len(keys) - len(missing)) + " of " + str(len(keys)) + " periods in cache")
+
+        fetched = []
+
+        if missing != []:
+            fetch = lambda i, start_date, finish_date: fetch_func(data_request_list[group[i]], start_date, finish_date)
+            fetch_chunks = None
+
+            if fetch_chunks_func is not None:
+                fetch_chunks = lambda i, start_date, finish_date: \
+                    fetch_chunks_func(data_request_list[group[i]], start_date, finish_date)
+
+            # If other callers are already loading some of these periods (single-flight), wait for them to publish them
+            # to the cache, rather than also loading them from the database
+            # Leases we already hold further up the call stack (eg. when fetching market data calls this again for
+            # the same periods), would otherwise deadlock
+            held = self._get_held_leases()
+            nested = [i for i in missing if keys[i] in held]
+            missing = [i for i in missing if keys[i] not in held]
+
+            leased = self._acquire_leases([keys[i] for i in missing])
+
+            owned = [i for i, l in zip(missing, leased) if l]
+            others = [i for i, l in zip(missing, leased) if not(l)]
+
+            held.update([keys[i] for i in owned])
+
+            try:
+                self._fetch_data_request_periods(sorted(owned + nested), periods, keys, group, df_list, fetch,
+                                                 fetch_chunks_func=fetch_chunks)
+            finally:
+                held.difference_update([keys[i] for i in owned])
+
+                self._release_leases([keys[i] for i in owned])
+
+            fetched = owned + nested
+
+            if others != []:
+                logger.debug("Waiting for " + str(len(others)) + " periods to be loaded by other callers")
+
+                self._wait_leases([keys[i] for i in others], constants.volatile_cache_lease_wait_seconds)
+
+                df_others = self.get([keys[i] for i in others])
+
+                if df_others is None:
+                    df_others = [None] * len(others)
+
+                for i, df in zip(others, df_others):
+                    df_list[i] = df
+
+                # If the other caller failed or took too long, load the periods ourselves
+                failed = [i for i in others if df_list[i] is None]
+
+                self._fetch_data_request_periods(failed, periods, keys, group, df_list, fetch,
+                                                 fetch_chunks_func=fetch_chunks)
+
+                fetched = fetched + failed
+
+        output = []
+
+        for j in range(0, len(data_request_list)):
+            ix = [i for i in range(0, len(keys)) if group[i] == j]
+
+            # If we only have a single period which was in the cache, we can refer to it directly with its key
+            cached_key = keys[ix[0]] if len(ix) == 1 and ix[0] not in fetched else None
+
+            df_group = [df_list[i] for i in ix if not(df_list[i].empty)]
+
+            if df_group == []:
+                df = pd.DataFrame()
+            elif len(df_group) == 1:
+                df = df_group[0]
+            else:
+                df = pd.concat(df_group)
+
+            output.append((periods[ix[0]][0], periods[ix[-1]][1], cached_key, df))
+
+        return output
+
+    def put_data_request_cache_chunks(self, data_request, data_store, market_trade_order, data_offset_ms,
+                                      fetch_chunks_func):
+        """Streams the data for a DataRequest into the cache, split into the whole periods (eg. months) used by
+        get_data_request_cache_stitched. fetch_chunks_func is called for the whole periods which cover the DataRequest
+        and should return a generator of DataFrames ordered by date (eg. DatabaseSourceSQL.fetch_trade_order_data_chunks).
+        Each period is pushed into the cache as soon as it is complete, so only one period (and chunk) needs to be held
+        in memory at once, even for multi-year requests. If fetch_chunks_func raises an exception part way through, it
+        is raised to the caller, and only the periods completed before it are cached.
+
+        Parameters
+        ----------
+        data_request : DataRequest
+            Request for market or trade/order data
+
+        data_store : str
+            Data store (eg. arctic-ncfx)
+
+        market_trade_order : str
+            Is it market data or trade data (eg. market_df or trade_df)
+
+        data_offset_ms : int
+            How much should we offset DataRequest by
+
+        fetch_chunks_func : function
+            Fetches data from the database between a start and finish date, as a generator of DataFrames ordered by
+            date, eg. fetch_chunks_func(start_date, finish_date)
+
+        Returns
+        -------
+        str (list)
+            Keys of the periods which have been cached
+        """
+        periods = self._get_data_request_periods(data_request.start_date, data_request.finish_date,
+                                                 data_request.multithreading_params['cache_period'])
+
+        keys = [self._create_data_request_cache_key(data_store, data_request.ticker, period_start, period_finish,
+                                                    market_trade_order, data_offset_ms)
+                for period_start, period_finish in periods]
+
+        self._put_data_request_periods_chunks(fetch_chunks_func(periods[0][0], periods[-1][1]), periods, keys)
+
+        return keys
+
+    def _put_data_request_periods_chunks(self, df_chunks, periods, keys, keep=False):
+        """Splits DataFrames (ordered by date, eg. from a generator) into periods, pushing each period into the cache as soon as
+        it is complete. The remaining (empty) periods are only noted once the generator has finished, so if it raises an
+        exception part way through, those periods aren't cached as empty.
+
+        Returns
+        -------
+        DataFrame (list)
+            DataFrame for each period (only if keep is set)
+        """
+        i = 0; period_df_list = []; output = []
+
+        def put_period(i, period_df_list):
+            # Make sure that empty periods are noted (no point hammering database for a dataset we know is empty!)
+            if period_df_list == []:
+                period_df = pd.DataFrame()
+            elif len(period_df_list) == 1:
+                period_df = period_df_list[0]
+            else:
+                period_df = pd.concat(period_df_list)
+
+            self.put(keys[i], period_df)
+
+            if keep:
+                output.append(period_df)
+
+        for df in df_chunks:
+            if df is None or df.empty:
+                continue
+
+            # A chunk may finish part way through a period or straddle several of them
+            while i < len(periods) and not(df.empty):
+                period_finish = periods[i][1]
+
+                if df.index[-1] <= period_finish:
+                    period_df_list.append(df)
+                    break
+
+                period_df_list.append(df[df.index <= period_finish])
+                put_period(i, [x for x in period_df_list if not(x.empty)])
+
+                df = df[df.index > period_finish]
+                i = i + 1; period_df_list = []
+
+        # Push the last period which had data, and any (empty) periods after it
+        while i < len(periods):
+            put_period(i, period_df_list)
+
+            i = i + 1; period_df_list = []
+
+        return output
+
+    def _fetch_data_request_periods(self, indices, periods, keys, group, df_list, fetch_func, fetch_chunks_func=None):
+        """Fetches periods from the database (merging consecutive periods of the same DataRequest into a single fetch),
+        filling them into df_list and pushing them all into the cache at once. If fetch_chunks_func is set, each gap is
+        instead streamed from the database, with each period pushed into the cache as soon as it is complete.
+        """
+        # Group consecutive missing periods into gaps, each of which needs a single fetch from the database
+        gaps = []
+
+        for i in indices:
+            if gaps != [] and gaps[-1][-1] == i - 1 and group[i] == group[i - 1]:
+                gaps[-1].append(i)
+            else:
+                gaps.append([i])
+
+        put_keys = []; put_df = []
+
+        block = constants.volatile_cache_fetch_block_periods
+
+        for gap in gaps:
+            if fetch_chunks_func is not None:
+                gap_start = periods[gap[0]][0]; gap_finish = periods[gap[-1]][1]
+
+                df_chunks = (df.loc[(df.index >= gap_start) & (df.index <= gap_finish)]
+                             for df in fetch_chunks_func(gap[0], gap_start, gap_finish) if df is not None)
+
+                period_df_list = self._put_data_request_periods_chunks(
+                    df_chunks, [periods[i] for i in gap], [keys[i] for i in gap], keep=True)
+
+                for i, df in zip(gap, period_df_list):
+                    df_list[i] = df
+
+                continue
+
+            # For large gaps, fetch a block of periods at a time, pushing each period into the cache as soon as it
+            # is complete (so we don't ask the database for too many dates at once)
+            if len(gap) > block:
+                for j in range(0, len(gap), block):
+                    block_gap = gap[j:j + block]
+                    block_start = periods[block_gap[0]][0]; block_finish = periods[block_gap[-1]][1]
+
+                    block_df = fetch_func(block_gap[0], block_start, block_finish)
+
+                    if block_df is not None and not(block_df.empty):
+                        if not(block_df.index.is_monotonic_increasing):
+                            block_df = block_df.sort_index()
+
+                        block_df = block_df.loc[(block_df.index >= block_start) & (block_df.index <= block_finish)]
+
+                    period_df_list = self._put_data_request_periods_chunks(
+                        [block_df], [periods[i] for i in block_gap], [keys[i] for i in block_gap], keep=True)
+
+                    for i, df in zip(block_gap, period_df_list):
+                        df_list[i] = df
+
+                continue
+
+            gap_df = fetch_func(gap[0], periods[gap[0]][0], periods[gap[-1]][1])
+
+            for i in gap:
+                period_start, period_finish = periods[i]
+
+                if gap_df is None or gap_df.empty:
+                    # Make sure that empty DataFrames are noted (no point hammering database for a dataset we know is empty!)
+                    df_list[i] = pd.DataFrame()
+                elif len(gap) == 1:
+                    df_list[i] = gap_df
+                else:
+                    df_list[i] = gap_df.loc[(gap_df.index >= period_start) & (gap_df.index <= period_finish)]
+
+                put_keys.append(keys[i]); put_df.append(df_list[i])
+
+        if put_keys != []:
+            self.put(put_keys, put_df)
+
+    def _get_held_leases(self):
+        """Gets the keys which the current thread holds leases on
+        """
+        if not(hasattr(VolatileAdvCache._held_leases, 'keys')):
+            VolatileAdvCache._held_leases.keys = set()
+
+        return VolatileAdvCache._held_leases.keys
+
+    def _acquire_leases(self, key):
+        """Tries to acquire leases on keys, so only one caller loads each of them from the database at once (single-flight).
+        By default, these are only shared within the process.
+
+        Parameters
+        ----------
+        key : str (list)
+            Keys to be loaded
+
+        Returns
+        -------
+        bool (list)
+            Whether each lease was acquired (if not, another caller is already loading that key)
+        """
+        leased = []
+
+        with VolatileAdvCache._volatile_adv_cache_lock:
+            for k in key:
+                if k in VolatileAdvCache._leases:
+                    leased.append(False)
+                else:
+                    VolatileAdvCache._leases[k] = threading.Event()
+                    leased.append(True)
+
+        return leased
+
+    def _release_leases(self, key):
+        """Releases leases on keys (after they have been pushed to the cache), waking up any callers waiting on them
+        """
+        with VolatileAdvCache._volatile_adv_cache_lock:
+            for k in key:
+                if k in VolatileAdvCache._leases:
+                    VolatileAdvCache._leases.pop(k).set()
+
+    def _wait_leases(self, key, timeout):
+        """Waits until leases on keys have been released (or until the timeout in seconds)
+        """
+        with VolatileAdvCache._volatile_adv_cache_lock:
+            events = [VolatileAdvCache._leases[k] for k in key if k in VolatileAdvCache._leases]
+
+        finish_time = time.time() + timeout
+
+        for e in events:
+            e.wait(max(0, finish_time - time.time()))
+
     def _create_cache_handle(self, obj, comp_add):
         fix = '_df'
 
@@ -394,6 +1114,12 @@ class VolatileAdvCache(VolatileCache):
         # otherwise we were just asking for a dataframe and didn't need to look up the key
         return df
 
+    def _convert_python_to_binary(self, obj, key):
+        """Converts a Python object into the binary form stored by the cache (which might also alter the key). Caches
+        which do their own serialization can override this.
+        """
+        return self._deltaize_serialize.convert_python_to_binary(obj, key)
+
     def put(self, key, obj, convert_cache_handle=True):
         """Puts a Python object in the cache with an associated key.
 
@@ -435,7 +1161,7 @@ class VolatileAdvCache(VolatileCache):
             if isinstance(obj[i], CacheHandle) and convert_cache_handle:
                 obj[i] = self.get_dataframe_handle(obj[i], burn_after_reading=True)
 
-            obj[i], key[i] = self._deltaize_serialize.convert_python_to_binary(obj[i], key[i])
+            obj[i], key[i] = self._convert_python_to_binary(obj[i], key[i])
 
             if not(isinstance(obj[i], list)):
                 obj[i] = [obj[i]]
@@ -494,9 +1220,29 @@ class VolatileAdvCache(VolatileCache):
 
         obj = None
 
+        # Objects which are burnt after reading (eg. CacheHandles) are only read once, so don't keep them locally
+        use_local_cache = VolatileAdvCache._local_cache is not None and not(burn_after_reading)
+
+        if use_local_cache:
+            obj = VolatileAdvCache._local_cache.get(key)
+            key_missing = [k for k, o in zip(key, obj) if o is None]
+        else:
+            key_missing = key
+
         try:
-            obj = self._get(key, burn_after_reading=burn_after_reading)
+            if key_missing != []:
+                obj_missing = self._get(key_missing, burn_after_reading=burn_after_reading)
+
+                if use_local_cache:
+                    VolatileAdvCache._local_cache.put(key_missing, obj_missing)
+
+                    obj_missing = iter(obj_missing)
+                    obj = [next(obj_missing) if o is None else o for o in obj]
+                else:
+                    obj = obj_missing
         except Exception as e:
+            obj = None
+
             logger.warning("Couldn't retrieve " + str(key) + " from cache: " + str(e))
 
         if ('market_df' in key):
@@ -512,11 +1258,20 @@ class VolatileAdvCache(VolatileCache):
 import redis
 
 class VolatileRedis(VolatileAdvCache):
+    """Stores Python objects in Redis. Each (serialized) object is stored as a list of chunks under its key, alongside a
+    small manifest hash (key + "_manifest") with the number of chunks and their total size. Hence, getting objects only
+    needs a single pipeline of HGETALL/LRANGE, without having to scan the key space with KEYS (which blocks Redis).
+
+    """
 
     _volatile_redis_lock = threading.Lock()
     _db = None
     _pool = None
 
+    _manifest_postfix = '_manifest'
+    _lease_postfix = '_lease'
+    _lease_tokens = {}
+
     def __init__(self):
         super(VolatileRedis, self).__init__()
 
@@ -533,61 +1288,57 @@ class VolatileRedis(VolatileAdvCache):
                                                       ssl=constants.volatile_cache_redis_ssl,
                                                       ssl_ca_certs=constants.volatile_cache_redis_ssl_ca_certs)
 
+    def _get_manifest_key(self, key):
+        return [k + self._manifest_postfix for k in key]
+
     def _get(self, key, burn_after_reading=False):
 
         logger = LoggerManager.getLogger(__name__)
         logger.debug('Attempting to get list from cache: ' + str(key))
 
-        old_key = key
-
-        # Use a pipeline which is quicker for multiple database operations
+        # Use a pipeline which is quicker for multiple database operations (a single round trip to Redis)
         pipeline = VolatileRedis._db.pipeline()
 
-        # Check if the key is inside Redis (may have the "size" after it, which will be needed to decompress)
+        # Get the manifest and the list of chunks for each key
         for k in key:
-            pipeline.keys(k + "*")
-
-        key = pipeline.execute()
-        key = self._util_func.flatten_list_of_lists(key)
+            pipeline.hgetall(k + self._manifest_postfix)
+            pipeline.lrange(k, 0, -1)
 
-        if key != []:
-            # Convert byte to string
-            key = [k.decode("utf-8") for k in key]
+        if burn_after_reading:
+            key_burn = [k for k in key if '_expiry_' in k]
 
-            pipeline = VolatileRedis._db.pipeline()
+            self.delete(key_burn, pipeline=pipeline)
 
-            # Get list of values for each element
-            for k in key:
-                pipeline.lrange(k, 0, -1)
+        pipeline_output = pipeline.execute()
 
-            if burn_after_reading:
-                key_burn = [k for k in key if '_expiry_' in k]
+        if burn_after_reading and len(pipeline_output) == 2 * len(key) + 1:
+            logger.debug("Deleted " + str(pipeline_output[-1]) + ' keys')
 
-                self.delete(key_burn, pipeline=pipeline)
+        cache_output = [None] * len(key)
 
-            cache_output = pipeline.execute()
-        else:
-            cache_output = [None] * len(old_key)
-            key = old_key
+        for i in range(0, len(key)):
+            manifest = pipeline_output[2 * i]
+            chunks = pipeline_output[2 * i + 1]
 
-        if burn_after_reading:
-            if len(cache_output) == len(key) + 1:
-                logger.debug("Deleted " + str(cache_output[-1]) + ' keys')
+            if chunks is None or chunks == []:
+                continue
 
-                cache_output = cache_output[:-1]
+            # Objects pushed before manifests were introduced won't have one, but can still be read
+            if manifest:
+                no_of_chunks = int(manifest[b'chunks'])
 
-        for i in range(0, len(key)):
-            if cache_output[i] is not None:
-                try:
-                    cache_output[i] = self._deltaize_serialize.convert_binary_to_python(cache_output[i], key[i])
-                except Exception as e:
-                    logger.error("Error converting binary object to Python for key: " + key[i] + " and " + str(e))
+                if no_of_chunks != len(chunks):
+                    logger.warning("Incomplete object in cache for key: " + key[i] + ", expected " + str(no_of_chunks)
+                                   + " chunks, but got " + str(len(chunks)))
 
-                    # print(cache_output[i])
+                    continue
 
-                    cache_output[i] = None
+            try:
+                cache_output[i] = self._deltaize_serialize.convert_binary_to_python(chunks, key[i])
+            except Exception as e:
+                logger.error("Error converting binary object to Python for key: " + key[i] + " and " + str(e))
 
-        # print(cache_output)
+                cache_output[i] = None
 
         return cache_output
 
@@ -606,50 +1357,513 @@ class VolatileRedis(VolatileAdvCache):
                 if obj[i] != [None]:
                     if obj[i] != []:
                         pipeline.rpush(key[i], *obj[i])
+                        pipeline.hset(key[i] + self._manifest_postfix,
+                                      mapping={'chunks': len(obj[i]), 'size': sum([len(o) for o in obj[i]])})
 
-        if not(isinstance(key, list)):
-            for k in key:
-                if "_expiry_" in k:
-                    pipeline.expire(k, constants.volatile_cache_expiry_seconds)
+                        # User data (eg. for a particular session) should expire
+                        if "_expiry_" in key[i]:
+                            pipeline.expire(key[i], constants.volatile_cache_expiry_seconds)
+                            pipeline.expire(key[i] + self._manifest_postfix, constants.volatile_cache_expiry_seconds)
 
         try:
             pipeline.execute()
         except Exception as err:
             print(str(err))
 
-    #def _get(self, key):
-    #    return self._db.lrange(key, 0, -1)
+    def _acquire_leases(self, key):
+        # Leases are stored in Redis (expiring in case the caller dies), so they are shared across processes
+        logger = LoggerManager.getLogger(__name__)
+
+        token = str(random.getrandbits(64))
+
+        try:
+            pipeline = VolatileRedis._db.pipeline()
+
+            for k in key:
+                pipeline.set(k + self._lease_postfix, token, nx=True,
+                             px=int(constants.volatile_cache_lease_expiry_seconds * 1000))
+
+            leased = [l is True for l in pipeline.execute()]
+        except Exception as e:
+            logger.warning("Couldn't acquire leases in Redis, so only using in-process leases: " + str(e))
+
+            return super(VolatileRedis, self)._acquire_leases(key)
+
+        with VolatileRedis._volatile_redis_lock:
+            for k, l in zip(key, leased):
+                if l: VolatileRedis._lease_tokens[k] = token
+
+        return leased
+
+    def _release_leases(self, key):
+        with VolatileRedis._volatile_redis_lock:
+            tokens = {k: VolatileRedis._lease_tokens.pop(k) for k in key if k in VolatileRedis._lease_tokens}
+
+        # Leases which were acquired in-process (if Redis was unavailable)
+        super(VolatileRedis, self)._release_leases([k for k in key if k not in tokens])
+
+        if tokens != {}:
+            lease_keys = [k + self._lease_postfix for k in tokens.keys()]
+
+            try:
+                # Only remove leases which are still ours (they might have expired and been taken by another caller)
+                current_tokens = VolatileRedis._db.mget(lease_keys)
+
+                lease_keys = [l for l, c, t in zip(lease_keys, current_tokens, tokens.values())
+                              if c is not None and c.decode('utf-8') == t]
+
+                if lease_keys != []:
+                    self._unlink(lease_keys)
+            except Exception as e:
+                LoggerManager.getLogger(__name__).warning("Couldn't release leases in Redis: " + str(e))
+
+    def _wait_leases(self, key, timeout):
+        finish_time = time.time() + timeout
+
+        lease_keys = [k + self._lease_postfix for k in key]
+
+        try:
+            while time.time() < finish_time:
+                if VolatileRedis._db.exists(*lease_keys) == 0:
+                    return
+
+                time.sleep(constants.volatile_cache_lease_poll_seconds)
+        except Exception:
+            super(VolatileRedis, self)._wait_leases(key, max(0, finish_time - time.time()))
 
     def clear_cache(self):
+        if VolatileAdvCache._local_cache is not None:
+            VolatileAdvCache._local_cache.clear_cache()
+
         try:
             VolatileRedis._db.flushall()
         except Exception as err:
             LoggerManager.getLogger(__name__).debug('Warn did not clear cache: ' + str(err))
 
     def clear_key_match(self, key_match):
-        # Allow deletion of keys by pattern matching
-        keys = VolatileRedis._db.keys(key_match)
+        # Allow deletion of keys by pattern matching (this will also match the manifests, which have a postfix), using
+        # SCAN in batches rather than KEYS, which would block Redis whilst it searches every key
+        if VolatileAdvCache._local_cache is not None:
+            VolatileAdvCache._local_cache.clear_key_match(key_match)
+
+        keys = []
+
+        for k in VolatileRedis._db.scan_iter(match=key_match, count=constants.volatile_cache_redis_scan_count):
+            keys.append(k)
+
+            if len(keys) >= constants.volatile_cache_redis_scan_count:
+                self._unlink(keys)
+
+                keys = []
 
         if len(keys) > 0:
-            VolatileRedis._db.delete(*keys)
+            self._unlink(keys)
 
     def delete(self, key, pipeline=None):
 
         if key is not None:
+            if not(isinstance(key, list)):
+                key = [key]
+
             if key != []:
+                if VolatileAdvCache._local_cache is not None:
+                    VolatileAdvCache._local_cache.delete(key)
+
+                self._unlink(key + self._get_manifest_key(key), pipeline=pipeline)
+
+    def _unlink(self, key, pipeline=None):
+
+        if pipeline is None:
+            pipeline = VolatileRedis._db
+
+        # UNLINK is *much* quicker when removing large valued keys compared to "delete" (only works with Redis 4 onwards)
+        try:
+            pipeline.execute_command('UNLINK', *key)
+        except:
+            # If fails try delete which works with older versions of Redis
+            pipeline.delete(*key)
+
+########################################################################################################################
+
+import contextlib
+import ctypes
+import os
+import struct
+
+import pyarrow as pa
+
+try:
+    import fcntl
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    # Shared memory is not supported on Windows (or before Python 3.8)
+    pass
+
+class VolatileSharedMemory(VolatileAdvCache):
+    """Stores Python objects in shared memory segments (using multiprocessing.shared_memory), so they can be exchanged
+    between processes on the same host (eg. Celery workers and the Dash/Flask web server) without going through Redis.
+    DataFrames are written as Arrow IPC streams directly into each segment, and are read back without copying the segment
+    (with volatile_cache_shm_zero_copy, the columns of the DataFrame also point to shared memory, but are read only).
+    Other objects (eg. Plotly figures) are serialized in the same way as for Redis.
+
+    Each key has its own segment (named from a hash of the key), with a small header recording its size, expiry, last
+    access time and a reference count. Reading with burn_after_reading decrements the reference count and the segment is
+    removed when it reaches zero. If the total size of the segments would exceed volatile_cache_shm_max_size_mb, expired
+    and then the least recently accessed segments are evicted. Removing a segment never invalidates a DataFrame which is
+    still reading it, as the memory is only freed once every process using it has unmapped it.
+
+    Requires a POSIX system (eg. Linux), where segments are listed in volatile_cache_shm_path (eg. /dev/shm).
+    """
+
+    _volatile_shm_lock = threading.Lock()
+
+    # magic, token, payload size, key size, reference count, is DataFrame, expiry time, last access time
+    _header_format = '<8sQQIIIdd'
+    _header_size = 64
+    _ref_count_offset = struct.calcsize('<8sQQI')
+    _last_access_offset = struct.calcsize('<8sQQIIId')
+    _alignment = 64
+    _magic = b'TCAPYSHM'
+
+    def __init__(self):
+        super(VolatileSharedMemory, self).__init__()
+
+        self._shm_path = constants.volatile_cache_shm_path
+        self._shm_prefix = constants.volatile_cache_shm_prefix
+        self._lock_path = os.path.join(self._shm_path, self._shm_prefix + 'lock')
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Locks the segments across threads and processes (whilst creating, evicting and removing them)
+        """
+        with VolatileSharedMemory._volatile_shm_lock:
+            with open(self._lock_path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
 
-                execute = False
+    def _get_segment_name(self, key):
+        return self._shm_prefix + hashlib.md5(key.encode('utf-8')).hexdigest()
 
-                if pipeline is None:
-                    pipeline = VolatileRedis._db
-                    execute = True
+    def _get_payload_offset(self, key_size):
+        return self._header_size + int(math.ceil(key_size / float(self._alignment))) * self._alignment
 
-                # UNLINK is *much* quicker when removing large valued keys compared to "delete" (only works with Redis 4 onwards)
+    def _open_shared_memory(self, name, create=False, size=0):
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+
+            # Before Python 3.13, segments are always tracked and removed when the process using them exits, but
+            # cached segments need to outlive the processes which create and read them
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+        return shm
+
+    def _read_header(self, path):
+        """Reads the header and key of a segment, returning None if it is still being written
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(self._header_size)
+
+                if len(header) < self._header_size or header[0:len(self._magic)] != self._magic:
+                    return None, None
+
+                header = struct.unpack_from(self._header_format, header, 0)
+
+                return header, f.read(header[3]).decode('utf-8')
+        except FileNotFoundError:
+            return None, None
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _list_segments(self):
+        return [entry for entry in os.scandir(self._shm_path)
+                if entry.name.startswith(self._shm_prefix) and entry.path != self._lock_path]
+
+    def _evict(self, size_bytes, now):
+        """Removes expired segments, and then the least recently accessed segments, until there is space for a new
+        segment (should be called whilst locked)
+        """
+        logger = LoggerManager.getLogger(__name__)
+
+        max_size_bytes = constants.volatile_cache_shm_max_size_mb * 1024 * 1024
+
+        total_size_bytes = 0
+        segments = []
+
+        for entry in self._list_segments():
+            header, key = self._read_header(entry.path)
+
+            try:
+                segment_size_bytes = entry.stat().st_size
+            except FileNotFoundError:
+                continue
+
+            if header is not None:
+                if header[6] > 0 and header[6] < now:
+                    self._unlink(entry.path)
+
+                    continue
+
+                segments.append((header[7], entry.path, segment_size_bytes, key))
+
+            total_size_bytes = total_size_bytes + segment_size_bytes
+
+        segments.sort()
+
+        while total_size_bytes + size_bytes > max_size_bytes and segments != []:
+            _, path, segment_size_bytes, key = segments.pop(0)
+
+            self._unlink(path)
+
+            total_size_bytes = total_size_bytes - segment_size_bytes
+
+            logger.debug("Evicted " + key + " from shared memory")
+
+    def _convert_python_to_binary(self, obj, key):
+        # DataFrames are written straight into shared memory as Arrow IPC streams by _put
+        if isinstance(obj, pd.DataFrame):
+            return obj, key
+
+        return super(VolatileSharedMemory, self)._convert_python_to_binary(obj, key)
+
+    def _put(self, key, obj):
+
+        if obj is None:
+            return
+
+        logger = LoggerManager.getLogger(__name__)
+
+        for i in range(0, len(key)):
+            if obj[i] is None or obj[i] == []:
+                continue
+
+            o = obj[i][0] if isinstance(obj[i], list) else obj[i]
+
+            if o is None:
+                continue
+
+            key_bytes = key[i].encode('utf-8')
+
+            if isinstance(o, pd.DataFrame):
+                o = pa.Table.from_pandas(o, preserve_index=True)
+
+                # Find the size of the Arrow IPC stream first, so we can write it directly into the segment
+                mock_stream = pa.MockOutputStream()
+
+                with pa.ipc.new_stream(mock_stream, o.schema) as writer:
+                    writer.write_table(o)
+
+                payload_size = mock_stream.size()
+                is_df = 1
+            else:
+                if not(isinstance(o, bytes)):
+                    o = str(o).encode('utf-8')
+
+                payload_size = len(o)
+                is_df = 0
+
+            payload_offset = self._get_payload_offset(len(key_bytes))
+            size_bytes = payload_offset + payload_size
+
+            if size_bytes > constants.volatile_cache_shm_max_size_mb * 1024 * 1024:
+                logger.warning("Couldn't push " + key[i] + " to shared memory, as it is larger than the maximum size")
+
+                continue
+
+            now = time.time()
+
+            with self._lock():
+                name = self._get_segment_name(key[i])
+
+                self._unlink(os.path.join(self._shm_path, name))
+                self._evict(size_bytes, now)
+
+                shm = self._open_shared_memory(name, create=True, size=size_bytes)
+
+            # Write the payload/key outside the lock, and the header last, so readers will only see complete segments
+            try:
+                if is_df:
+                    payload_buf = shm.buf[payload_offset:size_bytes]
+                    sink = pa.FixedSizeBufferWriter(pa.py_buffer(payload_buf))
+
+                    with pa.ipc.new_stream(sink, o.schema) as writer:
+                        writer.write_table(o)
+
+                    sink.close()
+
+                    del sink, writer
+                    payload_buf.release()
+                else:
+                    shm.buf[payload_offset:size_bytes] = o
+
+                shm.buf[self._header_size:self._header_size + len(key_bytes)] = key_bytes
+
+                expiry = now + constants.volatile_cache_expiry_seconds if '_expiry_' in key[i] else 0
+
+                struct.pack_into(self._header_format, shm.buf, 0, self._magic, random.getrandbits(64), payload_size,
+                                 len(key_bytes), 1, is_df, expiry, now)
+            finally:
+                shm.close()
+
+    def _get(self, key, burn_after_reading=False):
+
+        logger = LoggerManager.getLogger(__name__)
+        logger.debug('Attempting to get from shared memory: ' + str(key))
+
+        cache_output = []
+
+        for k in key:
+            name = self._get_segment_name(k)
+
+            try:
+                shm = self._open_shared_memory(name)
+            except FileNotFoundError:
+                cache_output.append(None)
+
+                continue
+
+            obj = None
+
+            try:
+                obj = self._read_segment(shm, k)
+
+                if obj is not None and burn_after_reading and '_expiry_' in k:
+                    self._release(name, struct.unpack_from('<Q', shm.buf, len(self._magic))[0])
+            except Exception as e:
+                logger.error("Error reading object from shared memory for key: " + k + " and " + str(e))
+
+                obj = None
+
+            # The segment will stay open if the DataFrame is still using it
+            del shm
+
+            cache_output.append(obj)
+
+        return cache_output
+
+    def _read_segment(self, shm, key):
+        """Reads the object in a segment (or None, if it is incomplete, has expired or belongs to a different key)
+        """
+        if bytes(shm.buf[0:len(self._magic)]) != self._magic:
+            return None
+
+        _, _, payload_size, key_size, _, is_df, expiry, _ = struct.unpack_from(self._header_format, shm.buf, 0)
+
+        now = time.time()
+
+        if (expiry > 0 and expiry < now) or \
+                bytes(shm.buf[self._header_size:self._header_size + key_size]).decode('utf-8') != key:
+            return None
+
+        struct.pack_into('<d', shm.buf, self._last_access_offset, now)
+
+        payload_offset = self._get_payload_offset(key_size)
+
+        if not(is_df):
+            return self._deltaize_serialize.convert_binary_to_python(
+                [bytes(shm.buf[payload_offset:payload_offset + payload_size])], key)
+
+        # Wrap the segment in an Arrow buffer (which keeps the segment open for as long as it's referenced)
+        address = ctypes.c_char.from_buffer(shm.buf)
+        payload_buf = pa.foreign_buffer(ctypes.addressof(address) + payload_offset, payload_size, base=shm)
+
+        del address
+
+        table = pa.ipc.open_stream(payload_buf).read_all()
+
+        return table.to_pandas(split_blocks=constants.volatile_cache_shm_zero_copy)
+
+    def _release(self, name, token):
+        """Decrements the reference count of a segment, removing it when it reaches zero (provided the segment hasn't
+        been replaced in the meantime)
+        """
+        with self._lock():
+            try:
+                shm = self._open_shared_memory(name)
+            except FileNotFoundError:
+                return
+
+            try:
+                if struct.unpack_from('<Q', shm.buf, len(self._magic))[0] == token:
+                    ref_count = struct.unpack_from('<I', shm.buf, self._ref_count_offset)[0] - 1
+
+                    if ref_count <= 0:
+                        self._unlink(os.path.join(self._shm_path, name))
+                    else:
+                        struct.pack_into('<I', shm.buf, self._ref_count_offset, ref_count)
+            finally:
+                shm.close()
+
+    def incr_ref_count(self, key, amount=1):
+        """Increments the reference count of keys, so they can be read that many more times with burn_after_reading,
+        before being removed (eg. if a CacheHandle is going to be read by several processes)
+
+        Parameters
+        ----------
+        key : str or CacheHandle (list)
+            Keys to increment
+
+        amount : int (default: 1)
+            How much to increment the reference count
+        """
+        if not(isinstance(key, list)):
+            key = [key]
+
+        key = [k.handle_name if isinstance(k, CacheHandle) else k for k in key]
+
+        with self._lock():
+            for k in key:
                 try:
-                    pipeline.execute_command('UNLINK', *key)
-                except:
-                    # If fails try delete which works with older versions of Redis
-                    pipeline.delete(*key)
+                    shm = self._open_shared_memory(self._get_segment_name(k))
+                except FileNotFoundError:
+                    continue
+
+                try:
+                    ref_count = struct.unpack_from('<I', shm.buf, self._ref_count_offset)[0]
+                    struct.pack_into('<I', shm.buf, self._ref_count_offset, ref_count + amount)
+                finally:
+                    shm.close()
+
+    def clear_cache(self):
+        if VolatileAdvCache._local_cache is not None:
+            VolatileAdvCache._local_cache.clear_cache()
+
+        with self._lock():
+            for entry in self._list_segments():
+                self._unlink(entry.path)
+
+    def clear_key_match(self, key_match):
+        # Allow deletion of keys by pattern matching (using the same glob style patterns as Redis)
+        if VolatileAdvCache._local_cache is not None:
+            VolatileAdvCache._local_cache.clear_key_match(key_match)
+
+        with self._lock():
+            for entry in self._list_segments():
+                _, key = self._read_header(entry.path)
+
+                if key is not None and fnmatch.fnmatchcase(key, key_match):
+                    self._unlink(entry.path)
+
+    def delete(self, key):
+
+        if key is not None:
+            if not(isinstance(key, list)):
+                key = [key]
+
+            if key != []:
+                if VolatileAdvCache._local_cache is not None:
+                    VolatileAdvCache._local_cache.delete(key)
 
-                if execute:
-                    pipeline.execute()
\ No newline at end of file
+                with self._lock():
+                    for k in key:
+                        self._unlink(os.path.join(self._shm_path, self._get_segment_name(k)))
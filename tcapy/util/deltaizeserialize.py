@@ -10,8 +10,9 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 
 import math
 import json
+import numpy as np
 import pandas as pd
-# import pyarrow as pa
+import pyarrow as pa
 
 from plotly.utils import PlotlyJSONEncoder
 import plotly.graph_objs as go
@@ -24,6 +25,8 @@ from tcapy.util.loggermanager import LoggerManager
 # context = pa.default_serialization_context()
 import io
 
+from concurrent.futures import ThreadPoolExecutor as PoolExecutor
+
 constants = Constants()
 
 class DeltaizeSerialize(object):
@@ -33,10 +36,17 @@ class DeltaizeSerialize(object):
 
     """
 
+    _delta_metadata_key = b'tcapy_delta'
+    _delta_index_column = '__index_delta__'
+
     def __init__(self):
         self._time_series_ops = TimeSeriesOps()
         self._util_func = UtilFunc()
 
+    def _is_delta_encode_key(self, key):
+        # Market tick data is cached with "market_df" in its key
+        return constants.volatile_cache_delta_encode_market_data and 'market_df' in key
+
     def convert_python_to_binary(self, obj, key):
         """
 
@@ -80,6 +90,14 @@ class DeltaizeSerialize(object):
                             ser.seek(0)
 
                             obj_list[i] = ser.read()
+
+                elif constants.volatile_cache_redis_format == 'arrow_ipc':
+                    for i in range(0, len(obj_list)):
+                        if obj_list[i] is not None:
+                            obj_list[i] = self._dataframe_to_arrow_ipc(obj_list[i],
+                                compression=constants.volatile_cache_redis_compression[
+                                    constants.volatile_cache_redis_format],
+                                delta_encode=self._is_delta_encode_key(key))
                 else:
                     raise Exception("Invalid volatile cache format specified " + constants.volatile_cache_redis_format)
             elif '_comp' not in key:
@@ -99,6 +117,12 @@ class DeltaizeSerialize(object):
                             ser.seek(0)
 
                             obj_list[i] = ser.read()
+
+                elif constants.volatile_cache_redis_format == 'arrow_ipc':
+                    for i in range(0, len(obj_list)):
+                        if obj_list[i] is not None:
+                            obj_list[i] = self._dataframe_to_arrow_ipc(obj_list[i],
+                                                                       delta_encode=self._is_delta_encode_key(key))
                 else:
                     raise Exception("Invalid volatile cache format specified " + constants.volatile_cache_redis_format)
 
@@ -131,6 +155,9 @@ class DeltaizeSerialize(object):
 
                         obj[i] = io.BytesIO(obj[i])
                         obj[i] = pd.read_parquet(obj[i])#, compression=constants.volatile_cache_redis_compression[constants.volatile_cache_redis_format])
+
+            elif constants.volatile_cache_redis_format == 'arrow_ipc':
+                obj = [self._arrow_ipc_to_dataframe(obj)]
             else:
                 raise Exception("Invalid volatile cache format specified "
                                 + str(constants.volatile_cache_redis_format))
@@ -148,11 +175,196 @@ class DeltaizeSerialize(object):
 
         return obj
 
+    def _dataframe_to_arrow_ipc(self, df, compression=None, delta_encode=False):
+        """Serializes a DataFrame as an Arrow IPC stream, with optional (lz4 or zstd) compression of its buffers, and
+        optionally encoding market ticks with encode_delta first
+        """
+        delta_dict = None
+
+        if delta_encode:
+            df, delta_dict = self.encode_delta(df)
+
+        table = pa.Table.from_pandas(df, preserve_index=delta_dict is None)
+
+        if delta_dict is not None:
+            metadata = table.schema.metadata
+            metadata[self._delta_metadata_key] = json.dumps(delta_dict)
+
+            table = table.replace_schema_metadata(metadata)
+
+        sink = pa.BufferOutputStream()
+
+        with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+            writer.write_table(table)
+
+        return sink.getvalue().to_pybytes()
+
+    def _arrow_ipc_to_dataframe(self, obj):
+        """Deserializes chunks of Arrow IPC streams (decompressing them in parallel threads) and then combines them into
+        a single table (without copying), before converting it to a DataFrame
+        """
+        obj = [o for o in obj if o is not None]
+
+        if obj == []:
+            return None
+
+        def read_table(binary):
+            table = pa.ipc.open_stream(pa.py_buffer(binary)).read_all()
+
+            metadata = table.schema.metadata
+
+            # Market ticks which have been encoded by encode_delta (each chunk will have its own base prices etc.)
+            if metadata is not None and self._delta_metadata_key in metadata:
+                return self.decode_delta(table.to_pandas(), json.loads(metadata[self._delta_metadata_key]))
+
+            return table
+
+        if len(obj) == 1:
+            table_list = [read_table(obj[0])]
+        else:
+            with PoolExecutor(max_workers=min(len(obj), constants.volatile_cache_redis_decode_threads)) as executor:
+                table_list = list(executor.map(read_table, obj))
+
+        if all([isinstance(t, pa.Table) for t in table_list]):
+            return pa.concat_tables(table_list).to_pandas()
+
+        df_list = [t.to_pandas() if isinstance(t, pa.Table) else t for t in table_list]
+
+        if len(df_list) == 1:
+            return df_list[0]
+
+        return pd.concat(df_list)
+
     def encode_delta(self, df):
-        pass
+        """Encodes a DataFrame of market ticks so that it compresses much better. The DatetimeIndex is stored as the
+        delta-of-delta of its nanosecond timestamps (mostly zeros for regular ticks) and the price fields (eg. bid/ask/mid)
+        as integer offsets from the first price, scaled by the number of decimal places in the prices (eg. pips). Price
+        fields are only encoded when this is exactly reversible (eg. if there are no NaNs).
+
+        Parameters
+        ----------
+        df : DataFrame
+            Market tick data to be encoded
+
+        Returns
+        -------
+        DataFrame (or the original if it can't be encoded), dict (with what's needed to decode or None)
+        """
+        if not(isinstance(df.index, pd.DatetimeIndex)) or len(df.index) == 0 or df.index.hasnans:
+            return df, None
+
+        time_int64 = df.index.asi8
+
+        # Ticks are often only timestamped to the millisecond etc., so we can store smaller deltas
+        time_unit = 1
+
+        for unit in [10 ** 9, 10 ** 6, 10 ** 3]:
+            if np.all(time_int64 % unit == 0):
+                time_unit = unit
+
+                break
+
+        time_delta = np.zeros(len(time_int64), dtype=np.int64)
+        time_delta[2:] = np.diff(time_int64 // time_unit, n=2)
+
+        delta_dict = {'index': {'name': df.index.name, 'tz': None if df.index.tz is None else str(df.index.tz),
+                                'start': int(time_int64[0]), 'unit': time_unit,
+                                'delta': int(time_int64[1] - time_int64[0]) // time_unit if len(time_int64) > 1 else 0},
+                      'columns': [c for c in df.columns], 'fields': {}}
+
+        encoded = {self._delta_index_column: self._downcast_int(time_delta)}
+
+        for c in df.columns:
+            if c in constants.delta_encode_fields and df[c].dtype == np.float64:
+                price = df[c].values
+
+                decimals = self._get_price_decimals(price)
+
+                if decimals is not None:
+                    price_int64 = np.round(price * 10 ** decimals).astype(np.int64)
+
+                    delta_dict['fields'][c] = {'base': int(price_int64[0]), 'decimals': decimals}
+                    encoded[c] = self._downcast_int(price_int64 - price_int64[0])
+
+                    continue
+
+            encoded[c] = df[c].values
+
+        return pd.DataFrame(encoded), delta_dict
+
+    def decode_delta(self, df, delta_dict):
+        """Decodes a DataFrame of market ticks which was encoded by encode_delta
+
+        Parameters
+        ----------
+        df : DataFrame
+            Encoded market tick data
+
+        delta_dict : dict
+            Describes how the DataFrame was encoded (returned by encode_delta)
+
+        Returns
+        -------
+        DataFrame
+        """
+        if delta_dict is None:
+            return df
+
+        index_dict = delta_dict['index']
+
+        time_delta = np.zeros(len(df.index), dtype=np.int64)
+        time_delta[1:] = index_dict['delta'] + np.cumsum(df[self._delta_index_column].values[1:].astype(np.int64))
+
+        index = pd.DatetimeIndex(index_dict['start'] + np.cumsum(time_delta) * index_dict['unit'], name=index_dict['name'])
+
+        if index_dict['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(index_dict['tz'])
+
+        decoded = {}
+
+        for c in delta_dict['columns']:
+            if c in delta_dict['fields']:
+                field_dict = delta_dict['fields'][c]
+
+                decoded[c] = (field_dict['base'] + df[c].values.astype(np.int64)).astype(np.float64) \
+                             / 10 ** field_dict['decimals']
+            else:
+                decoded[c] = df[c].values
+
+        return pd.DataFrame(decoded, index=index, columns=delta_dict['columns'])
+
+    def _get_price_decimals(self, price):
+        """Finds the smallest number of decimal places which represents all the prices exactly (or None if there isn't one)
+        """
+        if not(np.all(np.isfinite(price))) or np.max(np.abs(price)) * 10 ** constants.delta_encode_max_decimals > 2 ** 53:
+            return None
+
+        # Find candidate on a sample first, which is much quicker than checking every price for each number of decimals
+        sample = price[0:1000]
+
+        for decimals in range(0, constants.delta_encode_max_decimals + 1):
+            if self._is_price_decimals(sample, decimals) and self._is_price_decimals(price, decimals):
+                return decimals
+
+        return None
+
+    def _is_price_decimals(self, price, decimals):
+        return np.array_equal(np.round(price * 10 ** decimals).astype(np.int64).astype(np.float64) / 10 ** decimals,
+                              price)
+
+    def _downcast_int(self, values):
+        """Stores integers in the smallest dtype which they fit in
+        """
+        if len(values) == 0:
+            return values
+
+        min_value, max_value = np.min(values), np.max(values)
+
+        for dtype in [np.int8, np.int16, np.int32]:
+            if min_value >= np.iinfo(dtype).min and max_value <= np.iinfo(dtype).max:
+                return values.astype(dtype)
 
-    def decode_delta(self, df):
-        pass
+        return values
 
     def _plotly_fig_2_json(self, fig):
         """Serialize a plotly figure object to JSON so it can be persisted to disk.
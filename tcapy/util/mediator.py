@@ -61,9 +61,9 @@ class Mediator(object):
                     from tcapy.data.volatilecache import VolatileRedis
                     Mediator._volatile_cache[volatile_cache_engine] = VolatileRedis()
 
-                elif volatile_cache_engine == 'plasma':
-                    from tcapy.data.volatilecache import VolatilePlasma
-                    Mediator._volatile_cache[volatile_cache_engine] = VolatilePlasma()
+                elif volatile_cache_engine == 'shared_memory':
+                    from tcapy.data.volatilecache import VolatileSharedMemory
+                    Mediator._volatile_cache[volatile_cache_engine] = VolatileSharedMemory()
 
 
         return Mediator._volatile_cache[volatile_cache_engine]
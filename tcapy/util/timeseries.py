@@ -88,6 +88,54 @@ class TimeSeriesOps(object):
 
         return None
 
+    def merge_ordered_chunks(self, df_chunks_list):
+        """Merges several generators of DataFrames, each of which is ordered by date (eg. streamed from a database), into
+        a single generator of DataFrames ordered by date. Only the latest chunk of each generator is held at once.
+
+        Parameters
+        ----------
+        df_chunks_list : DataFrame (generator) (list)
+            Generators of DataFrames ordered by date
+
+        Returns
+        -------
+        DataFrame (generator)
+        """
+        df_chunks_list = [iter(df_chunks) for df_chunks in df_chunks_list]
+
+        buffer = [None] * len(df_chunks_list)
+        exhausted = [False] * len(df_chunks_list)
+
+        while True:
+            # Refill the buffer of any generator which has been used up
+            for i in range(0, len(df_chunks_list)):
+                while not(exhausted[i]) and (buffer[i] is None or buffer[i].empty):
+                    try:
+                        buffer[i] = next(df_chunks_list[i])
+                    except StopIteration:
+                        exhausted[i] = True; buffer[i] = None
+
+            active = [i for i in range(0, len(buffer)) if buffer[i] is not None and not(buffer[i].empty)]
+
+            if active == []:
+                return
+
+            # Can only output up to the end of the earliest buffered chunk (later generators might have earlier dates)
+            bound = min([buffer[i].index[-1] for i in active])
+
+            df_list = []
+
+            for i in active:
+                df_list.append(buffer[i][buffer[i].index <= bound])
+                buffer[i] = buffer[i][buffer[i].index > bound]
+
+            df_list = [df for df in df_list if not(df.empty)]
+
+            if len(df_list) == 1:
+                yield df_list[0]
+            else:
+                yield pd.concat(df_list).sort_index(kind='mergesort')
+
     def nanify_array_based_on_other(self, array_to_match, matching_value, array_to_filter):
         """Make elements of an array NaN, depending on matches in another (same-sized) array.
 
@@ -512,6 +560,39 @@ class TimeSeriesOps(object):
 
         return indices
 
+    def search_int64_index(self, index_int64, dt_int64, just_before_point=True):
+        """Vectorised version of search_series, which works directly on int64 nanosecond timestamps (eg. from
+        DatetimeIndex.asi8), rather than DataFrames. The times to search for can be of any shape (eg. a matrix of
+        trades x markout windows), so they can be all be resolved with a single binary search.
+
+        Parameters
+        ----------
+        index_int64 : np.ndarray (int64)
+            Sorted timestamps we wish to search (eg. from market data)
+
+        dt_int64 : np.ndarray (int64)
+            Timestamps to be looked up
+
+        just_before_point : bool (default: True)
+            Should we fetch the point just before (in the case of not matching), otherwise gets the point just after
+
+        Returns
+        -------
+        np.ndarray (int)
+        """
+        indices = np.searchsorted(index_int64, dt_int64)
+
+        last_index = len(index_int64) - 1
+
+        if just_before_point:
+            # For exact matches we don't wish to move the point, so only move inexact matches to the point before
+            is_inexact_match = dt_int64 != index_int64[np.minimum(indices, last_index)]
+
+            indices = indices - is_inexact_match
+
+        # Any points outside the series are assumed to be the start/end of the series
+        return np.clip(indices, 0, last_index)
+
     def outer_join(self, df_list):
         """Does an outer join of a list of DataFrames, into a single DataFrame, can also
 
@@ -1174,38 +1255,82 @@ class TimeSeriesOps(object):
             if isinstance(unweighted_data_col, list) and len(unweighted_data_col) > 0:
                 unweighted_data_col = unweighted_data_col[0]
 
-            df = pd.DataFrame(index=df.index,
-                                  data={'_data_times_weight': df[data_col].values * df[weight_col].values,
-                                        '_weight_where_notnull': df[weight_col].values * pd.notnull(
-                                            df[data_col].values),
-                                        by_col_agg: df[by_col_agg].values,
-                                        unweighted_data_col: df[unweighted_data_col].values})
+            is_data = pd.notnull(df[data_col].values)
 
         # All columns to be weighted when taking the average
         else:
-            df = pd.DataFrame(index=df.index,
-                                  data={'_data_times_weight': df[data_col].values * df[weight_col].values,
-                                        '_weight_where_notnull': df[weight_col].values * np.isfinite(
-                                            df[data_col].values),
-                                        by_col_agg: df[by_col_agg].values})
-        g = df.groupby(by_col_agg)
+            is_data = np.isfinite(df[data_col].values)
+
+        # Factorize the keys once, then use bincount to sum every group in a single pass (rather than a groupby)
+        codes, keys = self.factorize_groups(df[by_col_agg].values)
+
+        weights = df[weight_col].values
+
+        data_times_weight = self.sum_by_group(codes, len(keys), df[data_col].values * weights)
+        weight_where_notnull = self.sum_by_group(codes, len(keys), weights * is_data)
 
-        result = g['_data_times_weight'].sum() / g['_weight_where_notnull'].sum()
-        result.name = by_col_agg
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = pd.Series(index=pd.Index(keys, name=by_col_agg), data=data_times_weight / weight_where_notnull,
+                               name=by_col_agg)
 
         if unweighted_data_col is not None:
-            if unweighted_agg == 'sum':
-                unweighted_data_col_agg = g[unweighted_data_col].sum()
-            elif unweighted_agg == 'mean':
-                unweighted_data_col_agg = g[unweighted_data_col].mean()
+            unweighted_values = df[unweighted_data_col].values
+
+            unweighted_data_col_agg = self.sum_by_group(codes, len(keys), unweighted_values)
+
+            if unweighted_agg == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    unweighted_data_col_agg = unweighted_data_col_agg \
+                        / self.sum_by_group(codes, len(keys), pd.notnull(unweighted_values))
 
             return pd.DataFrame(index=result.index,
-                                    data={data_col: result, unweighted_data_col: unweighted_data_col_agg})
+                                    data={data_col: result.values, unweighted_data_col: unweighted_data_col_agg})
 
         result.name = data_col
 
         return result
 
+    def factorize_groups(self, keys):
+        """Converts keys (eg. order IDs) into integer group codes, so that we can do grouped aggregations directly with
+        numpy (eg. with sum_by_group). Missing keys are given a code of -1 (and are ignored when aggregating), similar
+        to a pandas groupby.
+
+        Parameters
+        ----------
+        keys : np.ndarray
+            Keys to group by
+
+        Returns
+        -------
+        np.ndarray (int), np.ndarray (sorted unique keys)
+        """
+        codes, uniques = pd.factorize(keys, sort=True)
+
+        return codes, np.asarray(uniques)
+
+    def sum_by_group(self, codes, no_of_groups, values):
+        """Sums values for each group code, ignoring any NaN values (and missing codes of -1)
+
+        Parameters
+        ----------
+        codes : np.ndarray (int)
+            Group code for each value (eg. from factorize_groups)
+
+        no_of_groups : int
+            Number of groups
+
+        values : np.ndarray
+            Values to sum
+
+        Returns
+        -------
+        np.ndarray (float)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        is_valid = (codes >= 0) & ~np.isnan(values)
+
+        return np.bincount(codes[is_valid], weights=values[is_valid], minlength=no_of_groups)
+
     def weighted_average_lambda(self, group, avg_name, weighting_field):
         """ http://stackoverflow.com/questions/10951341/pd-dataframe-aggregate-function-using-multiple-columns
         In rare instance, we may not have weights, so just return the mean. Customize this if your business case
@@ -239,4 +239,15 @@ class TCACaller(ComputationCaller, ABC):
         -------
         dict
         """
-        return self._tca_engine.calculate_tca(tca_request)
\ No newline at end of file
+        if not(constants.volatile_cache_share_tca_results):
+            return self._tca_engine.calculate_tca(tca_request)
+
+        # Somebody else might have already done the same TCA calculation
+        key, dict_of_df = self._glob_volatile_cache.get_tca_request_cache(tca_request)
+
+        if dict_of_df is None:
+            dict_of_df = self._tca_engine.calculate_tca(tca_request)
+
+            self._glob_volatile_cache.put_tca_request_cache(key, dict_of_df)
+
+        return dict_of_df
\ No newline at end of file
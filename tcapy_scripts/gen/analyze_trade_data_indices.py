@@ -0,0 +1,41 @@
+"""Script to verify that the trade/order tables in a SQL database have their indices on date, (ticker, date) and
+(ticker, tag, date) for common tags like venue, creating any which are missing (eg. for tables created by older versions
+of tcapy), and then update the statistics of the tables. Worth running after large uploads of trade/order data.
+"""
+
+from __future__ import division, print_function
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+from tcapy.conf.constants import Constants
+
+constants = Constants()
+
+if __name__ == '__main__':
+    # 'ms_sql_server', 'mysql' or 'sqlite'
+    sql_dialect = 'ms_sql_server'
+    trade_data_database_name = 'trade_database'
+
+    if sql_dialect == 'ms_sql_server':
+        from tcapy.data.databasesource import DatabaseSourceMSSQLServer as DatabaseSource
+    elif sql_dialect == 'mysql':
+        from tcapy.data.databasesource import DatabaseSourceMySQL as DatabaseSource
+    elif sql_dialect == 'sqlite':
+        from tcapy.data.databasesource import DatabaseSourceSQLite as DatabaseSource
+
+    # Get the actual table names in the database which may differ from "nicknames"
+    trade_order_mapping = constants.trade_order_mapping[sql_dialect]
+
+    database_source = DatabaseSource(trade_data_database_name=trade_data_database_name)
+
+    index_status = database_source.analyze_indices(table_name=list(trade_order_mapping.values()))
+
+    for table_name in index_status.keys():
+        for index_name in index_status[table_name].keys():
+            print(table_name + ': ' + index_name + ' ' + index_status[table_name][index_name])
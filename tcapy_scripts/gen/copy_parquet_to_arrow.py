@@ -1,5 +1,6 @@
-"""Copies a folder of parquet files into another into arrow folder for use with vaex. Note you need to install vaex
-library in addition to use this.
+"""Copies a folder of parquet files (eg. dumped by DatabasePopulator) into Arrow IPC (Feather v2) files, one for each
+ticker, which can be memory mapped by DatabaseSourceArrow (eg. with data_store 'arrow-dukascopy'), so many processes
+can share the same market data in the OS page cache.
 """
 
 from __future__ import print_function, division
@@ -14,34 +15,39 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 
 if __name__ == '__main__':
     import time
-    import vaex
-    import pandas as pd
 
-    import glob
-    import os
+    from tcapy.conf.constants import Constants
+    from tcapy.data.databasesource import DatabaseSourceArrow
+    from tcapy.util.loggermanager import LoggerManager
 
-    from findatapy.util.loggermanager import LoggerManager
+    constants = Constants()
 
     start = time.time()
 
     data_vendor = 'dukascopy' # 'ncfx' or 'dukascopy'
 
+    ticker_mkt = ['EURUSD', 'GBPUSD', 'AUDUSD', 'NZDUSD', 'USDCAD', 'USDCHF',
+                  'EURNOK', 'EURSEK', 'USDJPY',
+                  'USDNOK', 'USDSEK', 'EURJPY',
+                  'USDMXN', 'USDTRY', 'USDZAR', 'EURPLN']
+
     source_folder = '/data/csv_dump/' + data_vendor + '/'
-    destination_folder = '/data/csv_dump/' + data_vendor + '_arrow/'
 
-    logger = LoggerManager().getLogger(__name__)
+    # Arrow files are written into constants.arrow_path/table_name
+    table_name = constants.arrow_market_data_database_table
 
-    parquet_list = glob.glob(source_folder + '/*.parquet')
+    logger = LoggerManager().getLogger(__name__)
 
-    for p in parquet_list:
-        df = pd.read_parquet(p)
+    database_source = DatabaseSourceArrow(postfix=data_vendor)
 
-        df = vaex.from_pandas(df, name='pandas', copy_index=True, index_name='Date')
+    # Files dumped by DatabasePopulator look like this (and are sorted in time by their names)
+    ## 'AUDUSD_dukascopy_2016-01-03_22_00_01.868000+00_002016-01-31_23_59_57.193000+00_00.parquet'
+    parquet_list = [source_folder + x + '_' + data_vendor + '_20*.parquet' for x in ticker_mkt]
 
-        logger.info("Converting " + p + "...")
-        filename = os.path.basename(p)
+    logger.info("Converting " + str(parquet_list) + "...")
 
-        df.export(destination_folder + "/" + filename.replace('parquet', 'arrow'))
+    database_source.convert_csv_to_table(parquet_list, ticker_mkt, table_name, if_exists_table='replace',
+                                         if_exists_ticker='replace', remove_duplicates=False)
 
     finish = time.time()
     print('Status: calculated ' + str(round(finish - start, 3)) + "s")
@@ -0,0 +1,42 @@
+"""Rebuilds the manifests (first/last timestamp, rows, tickers and schema of each file) for folders of market/trade data
+files, such as those dumped by DatabasePopulator, so that wildcard reads with DatabaseSourceCSV/DatabaseSourceCSVBinary
+only open the files which overlap a request. Manifests are otherwise updated on demand, when they are missing files, or
+files have been modified, but this can be worth running after copying in large numbers of files.
+"""
+
+from __future__ import division, print_function
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+if __name__ == '__main__':
+    import time
+
+    from tcapy.data.databasesource import DatabaseSourceCSVBinary
+    from tcapy.data.filemanifest import FileManifest
+
+    start = time.time()
+
+    data_vendor = 'dukascopy' # 'ncfx' or 'dukascopy'
+
+    # Paths of the files (with wildcards)
+    file_glob_list = ['/data/csv_dump/' + data_vendor + '/*.parquet']
+
+    database_source = DatabaseSourceCSVBinary()
+    file_manifest = FileManifest()
+
+    for file_glob in file_glob_list:
+        # Read every file again, even if they already have entries
+        entries = file_manifest.rebuild_manifest(file_glob, lambda f: database_source._fetch_table(f), force=True)
+
+        for f in sorted(entries.keys(), key=lambda f: str(entries[f]['start_date'])):
+            print(f + ': ' + str(entries[f]['start_date']) + ' - ' + str(entries[f]['finish_date']) + ', '
+                  + str(entries[f]['rows']) + ' rows')
+
+    finish = time.time()
+    print('Status: calculated ' + str(round(finish - start, 3)) + "s")
@@ -22,7 +22,7 @@ if __name__ == '__main__':
     plot_back_data = False
     data_vendor = 'dukascopy'  # 'dukascopy' or 'ncfx'
 
-    # Either use 'arctic' or 'pystore' or 'influxdb' or 'kdb' to store market tick data
+    # Either use 'arctic' or 'pystore' or 'parquet' or 'influxdb' or 'kdb' to store market tick data
     market_data_store = 'arctic'
 
     # If left as None, will pick up from constants
@@ -23,6 +23,8 @@ sql_trade_order_mapping = {
     'mysql':            {'trade_df': 'trade_database_test_harness.trade',   # Name of table which has broker messages to client
                          'order_df': 'trade_database_test_harness.order'},  # Name of table which has orders from client
     'sqlite':           {'trade_df': 'test_trade_table',  # Name of table which has broker messages to client
+                         'order_df': 'test_order_table'}, # Name of table which has orders from client
+    'duckdb':           {'trade_df': 'test_trade_table',  # Name of table which has broker messages to client
                          'order_df': 'test_order_table'}  # Name of table which has orders from client
 }
 
@@ -52,6 +54,15 @@ test_harness_questdb_market_data_store = 'questdb-testharness' # InfluxDB measur
 test_harness_pystore_market_data_table = 'market_data_table_test_harness' # PyStore
 test_harness_pystore_market_data_store = 'pystore-testharness' # PyStore folder
 
+test_harness_parquet_market_data_table = 'market_data_table_test_harness' # Parquet dataset table
+test_harness_parquet_market_data_store = 'parquet-testharness' # Parquet dataset folder
+
+test_harness_arrow_market_data_table = 'market_data_table_test_harness' # Arrow folder
+test_harness_arrow_market_data_store = 'arrow-testharness' # Arrow files
+
+test_harness_duckdb_market_data_table = 'market_data_table_test_harness' # DuckDB table
+test_harness_duckdb_market_data_store = 'duckdb-testharness' # DuckDB database
+
 # Default format is CHUNK_STORE, so should be last, so we can read in later
 arctic_lib_type = ['TICK_STORE', 'VERSION_STORE', 'CHUNK_STORE']
 
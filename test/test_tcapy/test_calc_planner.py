@@ -0,0 +1,123 @@
+"""Tests that CalcPlanner only selects the benchmarks/metrics needed for the results of a TCARequest (when lazy_calcs is
+set), alongside the benchmarks they depend upon
+"""
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+from tcapy.analysis.tcarequest import TCARequest
+from tcapy.analysis.calcplanner import CalcPlanner
+from tcapy.analysis.algos.benchmark import BenchmarkArrival, BenchmarkVWAP, BenchmarkTradeOffset, BenchmarkMarketMid
+from tcapy.analysis.algos.metric import MetricSlippage, MetricImpShortfall, MetricTransientMarketImpact, MetricMarkout
+from tcapy.analysis.algos.resultsform import BarResultsForm, TimelineResultsForm, JoinTables
+
+from test.config import *
+
+arrival = BenchmarkArrival(); vwap = BenchmarkVWAP(); offset = BenchmarkTradeOffset(trade_offset_ms=1)
+mid = BenchmarkMarketMid()
+
+slippage = MetricSlippage(); imp_shortfall = MetricImpShortfall(); market_impact = MetricTransientMarketImpact()
+markout = MetricMarkout()
+
+def _create_tca_request(results_form=[], metric_display=[], join_tables=[], lazy_calcs=True, tca_type='aggregated',
+                        summary_display=None):
+    return TCARequest(start_date='01 May 2017', finish_date='30 May 2017', ticker='EURUSD', tca_type=tca_type,
+                      summary_display=summary_display, trade_data_store='csv', trade_order_mapping=csv_trade_order_mapping,
+                      benchmark_calcs=[mid, vwap, offset, arrival],
+                      metric_calcs=[imp_shortfall, markout, market_impact, slippage],
+                      results_form=results_form, metric_display=metric_display, join_tables=join_tables,
+                      lazy_calcs=lazy_calcs)
+
+def test_plan_calcs():
+    """Tests that only the closure of benchmarks/metrics needed by the results forms is calculated
+    """
+    planner = CalcPlanner()
+
+    # Just slippage bars, so don't need markouts, market impact etc.
+    benchmark_calcs, metric_calcs = planner.plan_calcs(
+        _create_tca_request(results_form=[BarResultsForm(metric_name='slippage', aggregate_by_field='venue')]), 'trade_df')
+
+    assert benchmark_calcs == [mid, offset]
+    assert metric_calcs == [slippage]
+
+    # Implementation shortfall needs the arrival price and only for the orders
+    tca_request = _create_tca_request(results_form=[
+        TimelineResultsForm(market_trade_order_list='order_df', metric_name='impshortfall', by_date='date')],
+        metric_display=['markout'])
+
+    benchmark_calcs, metric_calcs = planner.plan_calcs(tca_request, 'order_df')
+
+    assert benchmark_calcs == [mid, offset, arrival]
+    assert metric_calcs == [imp_shortfall, markout]
+
+    benchmark_calcs, metric_calcs = planner.plan_calcs(tca_request, 'trade_df')
+
+    assert benchmark_calcs == [mid, offset]
+    assert metric_calcs == [markout]
+
+def test_plan_plotted_calcs():
+    """Tests that the benchmarks which are plotted alongside the market data (eg. VWAP and arrival) are calculated for
+    'detailed' TCA and candlestick summaries, even if no results form displays them
+    """
+    planner = CalcPlanner()
+
+    results_form = [BarResultsForm(metric_name='slippage', aggregate_by_field='venue')]
+
+    for tca_request in [_create_tca_request(results_form=results_form, tca_type='detailed'),
+                        _create_tca_request(results_form=results_form, summary_display='candlestick')]:
+
+        assert {'vwap', 'twap', 'arrival', 'executed_price', 'side'}.issubset(
+            planner.get_required_fields(tca_request, 'trade_df'))
+
+        benchmark_calcs, metric_calcs = planner.plan_calcs(tca_request, 'trade_df')
+
+        assert benchmark_calcs == [mid, vwap, offset, arrival]
+        assert metric_calcs == [slippage]
+
+    # Otherwise, VWAP and arrival aren't needed
+    benchmark_calcs, _ = planner.plan_calcs(_create_tca_request(results_form=results_form), 'trade_df')
+
+    assert benchmark_calcs == [mid, offset]
+
+def test_plan_all_calcs():
+    """Tests that all the benchmarks/metrics are calculated if lazy_calcs is not set, or if the trade/orders are output
+    in full
+    """
+    planner = CalcPlanner()
+
+    results_form = [BarResultsForm(metric_name='slippage', aggregate_by_field='venue')]
+
+    for tca_request in [_create_tca_request(results_form=results_form, lazy_calcs=False),
+                        _create_tca_request(results_form=results_form,
+                            join_tables=[JoinTables(tables_dict={'table_name': 'joined', 'table_list': ['trade_df']})])]:
+
+        benchmark_calcs, metric_calcs = planner.plan_calcs(tca_request, 'trade_df')
+
+        assert benchmark_calcs == tca_request.benchmark_calcs
+        assert metric_calcs == tca_request.metric_calcs
+
+def test_trade_order_fields():
+    """Tests that only the columns needed by the results forms, calculations and filters are loaded for trades/orders
+    (when lazy_calcs is set)
+    """
+    from tcapy.analysis.tradeorderfilter import TradeOrderFilterTag
+
+    planner = CalcPlanner()
+
+    tca_request = _create_tca_request(results_form=[BarResultsForm(metric_name='slippage', aggregate_by_field='venue')])
+    tca_request.trade_order_filter = [TradeOrderFilterTag(tag_value_combinations={'trader_id': 'trader1'})]
+
+    fields = planner.get_trade_order_fields(tca_request, 'trade_df')
+
+    assert 'trader_id' in fields and 'venue' in fields and 'executed_price' in fields and 'date' in fields
+    assert 'portfolio_manager_id' not in fields
+
+    # Without lazy_calcs, or when outputting the raw trades, every column is needed
+    assert planner.get_trade_order_fields(_create_tca_request(lazy_calcs=False), 'trade_df') is None
+    assert planner.get_trade_order_fields(_create_tca_request(
+        join_tables=[JoinTables(tables_dict={'table_name': 'joined', 'table_list': ['trade_df']})]), 'trade_df') is None
@@ -14,9 +14,12 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 #
 
 import datetime
+import glob
 import os
 from collections import OrderedDict
 
+from sqlalchemy.sql import text
+
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -30,8 +33,9 @@ from tcapy.data.datafactory import MarketRequest, TradeRequest
 
 from tcapy.data.databasesource import DatabaseSourceCSVBinary as DatabaseSourceCSV
 from tcapy.data.databasesource import \
-    DatabaseSourceMSSQLServer, DatabaseSourceMySQL, DatabaseSourceSQLite, \
-    DatabaseSourceArctic, DatabaseSourceKDB, DatabaseSourceInfluxDB, DatabaseSourceQuestDB, DatabaseSourcePyStore
+    DatabaseSourceMSSQLServer, DatabaseSourceMySQL, DatabaseSourceSQLite, DatabaseSourcePostgres, \
+    DatabaseSourceArctic, DatabaseSourceKDB, DatabaseSourceInfluxDB, DatabaseSourceQuestDB, DatabaseSourcePyStore, \
+    DatabaseSourceParquet, DatabaseSourceArrow, DatabaseSourceDuckDB
 
 from tcapy.util.mediator import Mediator
 from tcapy.util.customexceptions import *
@@ -53,6 +57,7 @@ Mediator.get_volatile_cache().clear_cache()
 # For market data
 run_arctic_tests = True
 run_pystore_tests = False
+run_parquet_dataset_tests = False
 run_influx_db_tests = False
 run_quest_db_tests = False
 run_kdb_tests = False
@@ -61,6 +66,7 @@ run_kdb_tests = False
 run_ms_sql_server_tests = False
 run_mysql_server_tests = False
 run_sqlite_server_tests = False
+run_postgres_server_tests = False
 
 start_date = '26 Apr 2017'
 finish_date = '05 Jun 2017'
@@ -426,6 +432,11 @@ def _get_db_market_database_source():
         test_harness_market_data_table_list.append(test_harness_pystore_market_data_table)
         test_harness_data_store_list.append(test_harness_pystore_market_data_store)
 
+    if run_parquet_dataset_tests:
+        database_source_list.append(DatabaseSourceParquet(postfix='testharness'))
+        test_harness_market_data_table_list.append(test_harness_parquet_market_data_table)
+        test_harness_data_store_list.append(test_harness_parquet_market_data_store)
+
     return database_source_list, test_harness_market_data_table_list, test_harness_data_store_list
 
 def test_write_market_data_db():
@@ -543,6 +554,248 @@ def test_delete_market_data_db():
         # Both pandas and KDB/InfluxDB implementation should be the same
         assert_frame_equal(market_df_old, market_df_new)
 
+def test_parquet_dataset_market_data():
+    """Tests that we can write market data to a partitioned Parquet dataset, and read back date ranges/columns from it,
+    as well as deleting sections of it
+    """
+    import numpy as np
+
+    database_source = DatabaseSourceParquet(postfix='testharness', row_group_size=1000,
+                                            parquet_dataset_path=os.path.join(constants.temp_data_folder, 'parquet_dataset'))
+
+    # Market data over several months, so there are several year/month partitions
+    market_df = pd.DataFrame(index=pd.date_range(start=start_date, end=finish_date, freq='30s', tz='utc'))
+    market_df['mid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(market_df.index)))
+    market_df['bid'] = market_df['mid'] - 0.0001; market_df['ask'] = market_df['mid'] + 0.0001
+    market_df.index.name = 'Date'
+
+    market_data_file = os.path.join(constants.temp_data_folder, 'test_parquet_dataset_market_df.parquet')
+    market_df.to_parquet(market_data_file)
+
+    database_source.convert_csv_to_table(market_data_file, ticker, test_harness_parquet_market_data_table,
+                                         if_exists_table='replace', if_exists_ticker='replace',
+                                         market_trade_data='market', remove_duplicates=False)
+
+    # Across all the partitions and only for a few hours
+    for db_start_date, db_finish_date in [(start_date, finish_date), ('02 May 2017 10:00', '02 May 2017 13:00')]:
+        market_df_load = database_source.fetch_market_data(start_date=db_start_date, finish_date=db_finish_date,
+                                                           ticker=ticker, table_name=test_harness_parquet_market_data_table)
+
+        market_df_slice = market_df.loc[pd.Timestamp(db_start_date).tz_localize('utc'):
+                                        pd.Timestamp(db_finish_date).tz_localize('utc')]
+
+        assert all(market_df_load.index == market_df_slice.index)
+        assert all(abs(market_df_load['mid'] - market_df_slice['mid']) < eps)
+
+    # Only read the columns we need
+    market_df_load = database_source.fetch_market_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                       table_name=test_harness_parquet_market_data_table, fields=['mid'])
+
+    assert list(market_df_load.columns) == ['mid']
+
+    # Can't append data which overlaps with what's already there
+    overlap_error = False
+
+    try:
+        database_source.append_market_data(market_df, ticker, table_name=test_harness_parquet_market_data_table,
+                                           if_exists_ticker='append', remove_duplicates=False)
+    except ErrorWritingOverlapDataException as e:
+        overlap_error = True
+
+    assert overlap_error
+
+    # Delete a section, which is within a single month
+    db_start_cut_off = '02 May 2017 00:00'; db_finish_cut_off = '03 May 2017 00:50'
+
+    database_source.delete_market_data(ticker, start_date=db_start_cut_off, finish_date=db_finish_cut_off,
+                                       table_name=test_harness_parquet_market_data_table)
+
+    market_df_load = database_source.fetch_market_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                       table_name=test_harness_parquet_market_data_table)
+
+    market_df_cut = market_df.loc[(market_df.index <= pd.Timestamp(db_start_cut_off).tz_localize('utc')) |
+                                  (market_df.index >= pd.Timestamp(db_finish_cut_off).tz_localize('utc'))]
+
+    assert all(market_df_load.index == market_df_cut.index)
+
+def test_arrow_market_data():
+    """Tests that we can write market data to memory mapped Arrow files and read back date ranges from them, without
+    copying the data if it's in a single record batch
+    """
+    import numpy as np
+
+    database_source = DatabaseSourceArrow(postfix='testharness',
+                                          arrow_path=os.path.join(constants.temp_data_folder, 'arrow'))
+
+    market_df = pd.DataFrame(index=pd.date_range(start=start_date, end=finish_date, freq='30s', tz='utc'))
+    market_df['mid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(market_df.index)))
+    market_df['bid'] = market_df['mid'] - 0.0001; market_df['ask'] = market_df['mid'] + 0.0001
+
+    market_df_lower, market_df_higher = TimeSeriesOps().split_array_chunks(market_df, chunks=2)
+
+    # Each append is a different record batch
+    database_source.append_market_data(market_df_lower, ticker, table_name=test_harness_arrow_market_data_table,
+                                       if_exists_table='replace', if_exists_ticker='replace', remove_duplicates=False)
+    database_source.append_market_data(market_df_higher, ticker, table_name=test_harness_arrow_market_data_table,
+                                       if_exists_ticker='append', remove_duplicates=False)
+
+    # Can't append data which overlaps with what's already there
+    overlap_error = False
+
+    try:
+        database_source.append_market_data(market_df_lower, ticker, table_name=test_harness_arrow_market_data_table,
+                                           if_exists_ticker='append', remove_duplicates=False)
+    except ErrorWritingOverlapDataException as e:
+        overlap_error = True
+
+    assert overlap_error
+
+    # Across both record batches and only for a few hours
+    for db_start_date, db_finish_date in [(start_date, finish_date), ('02 May 2017 10:00', '02 May 2017 13:00')]:
+        market_df_load = database_source.fetch_market_data(start_date=db_start_date, finish_date=db_finish_date,
+                                                           ticker=ticker, table_name=test_harness_arrow_market_data_table)
+
+        market_df_slice = market_df.loc[pd.Timestamp(db_start_date).tz_localize('utc'):
+                                        pd.Timestamp(db_finish_date).tz_localize('utc')]
+
+        assert all(market_df_load.index == market_df_slice.index)
+        assert all(abs(market_df_load['mid'] - market_df_slice['mid']) < eps)
+
+    # Within a single record batch, the values are a view on the (read only) memory mapped file
+    assert not(market_df_load['mid'].values.flags.writeable)
+
+def test_stream_chunks_pipeline():
+    """Tests that every chunk of CSV files is written in order (and none are dropped) when reading and tidying chunks
+    is pipelined in threads, with both the pandas and pyarrow CSV readers
+    """
+    import numpy as np
+
+    database_source = DatabaseSourceArrow(postfix='testharness',
+                                          arrow_path=os.path.join(constants.temp_data_folder, 'arrow'))
+
+    market_df = pd.DataFrame(index=pd.date_range(start=start_date, end=finish_date, freq='30s', tz='utc'))
+    market_df['mid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(market_df.index)))
+    market_df.index.name = 'Date'
+
+    # Split over several files, which are sorted in time by their names
+    csv_files = []
+
+    for j, df in enumerate(TimeSeriesOps().split_array_chunks(market_df, chunks=3)):
+        csv_files.append(os.path.join(constants.temp_data_folder, 'test_stream_chunks_' + str(j) + '.csv'))
+        df.to_csv(csv_files[-1])
+
+    for csv_read_engine in ['pandas', 'pyarrow']:
+        Constants.csv_read_engine = csv_read_engine
+
+        try:
+            # Lots of small chunks, so there are many more than the pipeline can hold at once
+            database_source.convert_csv_to_table(os.path.join(constants.temp_data_folder, 'test_stream_chunks_*.csv'),
+                                                 ticker, test_harness_arrow_market_data_table, if_exists_table='replace',
+                                                 if_exists_ticker='replace', csv_read_chunksize=5000,
+                                                 remove_duplicates=False)
+        finally:
+            Constants.csv_read_engine = 'pandas'
+
+        market_df_load = database_source.fetch_market_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                           table_name=test_harness_arrow_market_data_table)
+
+        assert all(market_df_load.index == market_df.index)
+        assert all(abs(market_df_load['mid'] - market_df['mid']) < eps)
+
+def test_duckdb_market_trade_data():
+    """Tests that we can write market and trade/order data to DuckDB and read it back, with the dates, ticker, filters
+    and columns pushed down into the query, both from DuckDB tables and directly from Parquet files
+    """
+    import numpy as np
+
+    duckdb_database = os.path.join(constants.temp_data_folder, 'duckdb', 'tcapy_test_harness.duckdb')
+
+    database_source = DatabaseSourceDuckDB(postfix='testharness', duckdb_database=duckdb_database)
+
+    market_df = pd.DataFrame(index=pd.date_range(start=start_date, end=finish_date, freq='30s', tz='utc'))
+    market_df['mid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(market_df.index)))
+    market_df['bid'] = market_df['mid'] - 0.0001; market_df['ask'] = market_df['mid'] + 0.0001
+
+    database_source.append_market_data(market_df, ticker, table_name=test_harness_duckdb_market_data_table,
+                                       if_exists_table='replace', if_exists_ticker='replace', remove_duplicates=False)
+
+    # Can't append data which overlaps with what's already there
+    overlap_error = False
+
+    try:
+        database_source.append_market_data(market_df, ticker, table_name=test_harness_duckdb_market_data_table,
+                                           if_exists_ticker='append', remove_duplicates=False)
+    except ErrorWritingOverlapDataException as e:
+        overlap_error = True
+
+    assert overlap_error
+
+    for db_start_date, db_finish_date in [(start_date, finish_date), ('02 May 2017 10:00', '02 May 2017 13:00')]:
+        market_df_load = database_source.fetch_market_data(start_date=db_start_date, finish_date=db_finish_date,
+                                                           ticker=ticker, table_name=test_harness_duckdb_market_data_table)
+
+        market_df_slice = market_df.loc[pd.Timestamp(db_start_date).tz_localize('utc'):
+                                        pd.Timestamp(db_finish_date).tz_localize('utc')]
+
+        assert all(market_df_load.index == market_df_slice.index)
+        assert all(abs(market_df_load['mid'] - market_df_slice['mid']) < eps)
+
+    # Only the columns we asked for, returned as Arrow
+    market_table = database_source.fetch_market_data_arrow(start_date=start_date, finish_date=finish_date,
+                                                           ticker=ticker, table_name=test_harness_duckdb_market_data_table,
+                                                           fields=['mid'])
+
+    assert market_table.column_names == ['date', 'mid']
+
+    # Query Parquet files directly
+    market_data_file = os.path.join(constants.temp_data_folder, 'test_duckdb_market_df.parquet')
+
+    market_df_parquet = market_df.copy(); market_df_parquet.index = market_df_parquet.index.tz_localize(None)
+    market_df_parquet.index.name = 'date'; market_df_parquet['ticker'] = ticker + '-testharness'
+    market_df_parquet.reset_index().to_parquet(market_data_file)
+
+    market_df_load = database_source.fetch_market_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                       table_name=market_data_file)
+
+    assert all(market_df_load.index == market_df.index)
+
+    # Parquet files without Hive partitions can still be read by versions of DuckDB without hive_partitioning
+    hive_partitioning = DatabaseSourceDuckDB._hive_partitioning
+    DatabaseSourceDuckDB._hive_partitioning = False
+
+    try:
+        market_df_load = database_source.fetch_market_data(start_date=start_date, finish_date=finish_date,
+                                                           ticker=ticker, table_name=market_data_file)
+    finally:
+        DatabaseSourceDuckDB._hive_partitioning = hive_partitioning
+
+    assert all(market_df_load.index == market_df.index)
+
+    for t in trade_order_list:
+        database_source.convert_csv_to_table(csv_trade_order_mapping[t], None, sql_trade_order_mapping['duckdb'][t],
+                                             if_exists_table='replace', market_trade_data='trade')
+
+        trade_order_df_duckdb = database_source.fetch_trade_order_data(
+            start_date=start_date, finish_date=finish_date, ticker=ticker,
+            table_name=sql_trade_order_mapping['duckdb'][t])
+
+        trade_order_df_csv = DatabaseSourceCSV().fetch_trade_order_data(
+            start_date=start_date, finish_date=finish_date, ticker=ticker, table_name=csv_trade_order_mapping[t])
+
+        assert all(trade_order_df_duckdb.index == trade_order_df_csv.index)
+
+        for c in ['executed_price', 'notional', 'side']:
+            if c in trade_order_df_csv.columns:
+                assert all(abs(trade_order_df_duckdb[c] - trade_order_df_csv[c]) < eps)
+
+    # Filters and columns pushed down into the query
+    trade_df_duckdb = database_source.fetch_trade_order_data(
+        start_date=start_date, finish_date=finish_date, ticker=ticker, table_name=sql_trade_order_mapping['duckdb']['trade_df'],
+        fields=['executed_price', 'venue'], filters=[('venue', ['venue1'])])
+
+    assert list(trade_df_duckdb.columns) == ['executed_price', 'venue']
+    assert len(trade_df_duckdb.index) > 0 and all(trade_df_duckdb['venue'] == 'venue1')
+
 ########################################################################################################################
 #### READING DATA ######################################################################################################
 ########################################################################################################################
@@ -611,6 +864,75 @@ def test_fetch_market_trade_data_csv():
                              and trade_order_df.index[0] >= pd.Timestamp(start_date).tz_localize('utc') \
                              and trade_order_df.index[-1] <= pd.Timestamp(finish_date).tz_localize('utc')
 
+def test_fetch_wildcard_csv_file_manifest():
+    """Tests that for wildcard paths, only the files which overlap the dates of a request are read (using the manifest
+    of the folder), in time order, even if their names are not in time order
+    """
+    import shutil
+    import numpy as np
+
+    from tcapy.data.filemanifest import FileManifest
+
+    folder = os.path.join(constants.temp_data_folder, 'test_file_manifest')
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+
+    market_df = pd.DataFrame(index=pd.date_range(start='01 May 2017', end='05 May 2017 23:59', freq='1min'))
+    market_df['mid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(market_df.index)))
+    market_df['ticker'] = ticker
+    market_df.index.name = 'Date'
+
+    # One file a day, with names in reverse time order
+    for j, day in enumerate(['01', '02', '03', '04', '05']):
+        market_df.loc['2017-05-' + day].to_csv(os.path.join(folder, 'EURUSD_' + str(5 - j) + '.csv'))
+
+    database_source = DatabaseSourceCSV()
+
+    file_list = []
+    fetch_table = database_source._fetch_table
+
+    def count_fetch_table(csv_file_path, date_format=None):
+        file_list.append(os.path.basename(csv_file_path))
+
+        return fetch_table(csv_file_path, date_format=date_format)
+
+    database_source._fetch_table = count_fetch_table
+
+    # First time every file needs to be read to build the manifest
+    market_df_load = database_source.fetch_market_data(start_date='02 May 2017', finish_date='03 May 2017 23:59',
+                                                       ticker=ticker, table_name=os.path.join(folder, 'EURUSD_*.csv'))
+
+    assert sorted(file_list) == ['EURUSD_' + str(j) + '.csv' for j in range(1, 6)]
+    assert all(market_df_load.index == market_df.loc['2017-05-02':'2017-05-03'].index.tz_localize('utc'))
+
+    # After that, only the files overlapping the dates, and wrong tickers are skipped too
+    del file_list[:]
+
+    market_df_load = database_source.fetch_market_data(start_date='02 May 2017 12:00', finish_date='04 May 2017 12:00',
+                                                       ticker=ticker, table_name=os.path.join(folder, 'EURUSD_*.csv'))
+
+    assert file_list == ['EURUSD_4.csv', 'EURUSD_3.csv', 'EURUSD_2.csv']
+    assert all(market_df_load.index == market_df.loc['2017-05-02 12:00':'2017-05-04 12:00'].index.tz_localize('utc'))
+
+    del file_list[:]
+
+    assert database_source.fetch_market_data(start_date='02 May 2017', finish_date='03 May 2017', ticker='GBPUSD',
+                                             table_name=os.path.join(folder, 'EURUSD_*.csv')) is None
+    assert file_list == []
+
+    # Modified files are read again (only once, when updating the manifest)
+    market_df.loc[pd.Timestamp('06 May 2017')] = [1.2, ticker]
+    market_df.loc['2017-05-05':].to_csv(os.path.join(folder, 'EURUSD_1.csv'))
+
+    market_df_load = database_source.fetch_market_data(start_date='06 May 2017', finish_date='07 May 2017',
+                                                       ticker=ticker, table_name=os.path.join(folder, 'EURUSD_*.csv'))
+
+    assert file_list == ['EURUSD_1.csv'] and len(market_df_load.index) == 1
+
+    # Files are sorted in time order, from the manifest
+    assert [os.path.basename(f) for f in FileManifest().sort_files(glob.glob(os.path.join(folder, 'EURUSD_*.csv')))] == \
+           ['EURUSD_' + str(j) + '.csv' for j in range(5, 0, -1)]
 
 def test_trade_data_connection():
     """Tests the connection with the trade databases
@@ -626,6 +948,140 @@ def test_trade_data_connection():
 
         assert connection is not None
 
+def test_sql_engine_pool():
+    """Tests that SQL engines are shared by connection string, rather than recreated on every fetch, and that they are
+    recreated if the process has been forked (eg. Celery prefork workers)
+    """
+    from tcapy.data.databasesource import DatabaseSourceSQL
+
+    database_name = os.path.join(constants.temp_data_folder, 'test_sql_engine_pool.db')
+
+    engine, connection_expression = DatabaseSourceSQLite()._get_database_engine(database_name=database_name)
+    engine_other, _ = DatabaseSourceSQLite()._get_database_engine(database_name=database_name)
+
+    assert engine is engine_other
+
+    # Pretend engine was created in a parent process
+    DatabaseSourceSQL._engine_pool[connection_expression] = (-1, engine)
+
+    engine_forked, _ = DatabaseSourceSQLite()._get_database_engine(database_name=database_name)
+
+    assert engine_forked is not engine
+
+def test_sql_trade_order_push_down():
+    """Tests that columns and filters pushed down into SQL trade/order queries give the same result as selecting
+    everything and filtering afterwards
+    """
+    database_name = os.path.join(constants.temp_data_folder, 'test_sql_trade_order_push_down.db')
+
+    database_source = DatabaseSourceSQLite(trade_data_database_name=database_name)
+    engine, _ = database_source._get_database_engine(database_name=database_name)
+
+    read_pd('small_test_trade_df.csv', index_col=0).to_sql('trade', engine, if_exists='replace', index=True)
+
+    trade_df = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                      table_name='trade')
+
+    trade_push_down_df = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date,
+        ticker=ticker, table_name='trade', fields=['date', 'venue', 'side', 'executed_price', 'not_a_column'],
+        filters=[('venue', ['venue1', 'venue4']), ('event_type', ['trade'])])
+
+    trade_df = trade_df[trade_df['venue'].isin(['venue1', 'venue4']) & (trade_df['event_type'] == 'trade')]
+
+    assert_frame_equal(trade_df[trade_push_down_df.columns], trade_push_down_df)
+    assert set(trade_push_down_df.columns) == set(['venue', 'side', 'executed_price'])
+
+def test_sql_trade_order_chunks():
+    """Tests that streaming SQL trade/order queries in chunks gives the same result as fetching them in one go
+    """
+    database_name = os.path.join(constants.temp_data_folder, 'test_sql_trade_order_chunks.db')
+
+    database_source = DatabaseSourceSQLite(trade_data_database_name=database_name)
+    engine, _ = database_source._get_database_engine(database_name=database_name)
+
+    read_pd('small_test_trade_df.csv', index_col=0).to_sql('trade', engine, if_exists='replace', index=True)
+
+    trade_df = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                                                      table_name='trade')
+
+    trade_df_list = list(database_source.fetch_trade_order_data_chunks(start_date=start_date, finish_date=finish_date,
+                                                                       ticker=ticker, table_name='trade', chunksize=5))
+
+    assert max([len(df.index) for df in trade_df_list]) == 5
+
+    assert_frame_equal(pd.concat(trade_df_list), trade_df)
+
+def test_sql_bulk_load():
+    """Tests that bulk loading trade/order data into SQL (in batches) gives the same result as writing it with to_sql,
+    for SQLite and (if enabled) Postgres, which uses COPY, and MySQL, with and without LOAD DATA LOCAL INFILE (which
+    falls back to executemany if the server has local_infile=OFF)
+    """
+    database_source_list = [(DatabaseSourceSQLite(
+        trade_data_database_name=os.path.join(constants.temp_data_folder, 'test_sql_bulk_load.db')), False)]
+
+    if run_postgres_server_tests:
+        database_source_list.append((DatabaseSourcePostgres(), False))
+
+    if run_mysql_server_tests:
+        database_source_list.append((DatabaseSourceMySQL(), False))
+        database_source_list.append((DatabaseSourceMySQL(), True))
+
+    trade_df = read_pd('small_test_trade_df.csv', index_col=0)
+    trade_df.index = pd.to_datetime(trade_df.index); trade_df.index.name = 'date'
+
+    mysql_bulk_load_local_infile = Constants.mysql_bulk_load_local_infile
+
+    for database_source, local_infile in database_source_list:
+        engine, _ = database_source._get_database_engine(database_name=database_source._trade_data_database_name)
+
+        # Reference table written with pandas and an empty table with the same schema to bulk load into
+        trade_df.to_sql('trade_to_sql', engine, if_exists='replace', index=True)
+        trade_df.head(0).to_sql('trade_bulk', engine, if_exists='replace', index=True)
+
+        Constants.mysql_bulk_load_local_infile = local_infile
+
+        try:
+            report = database_source._bulk_insert(trade_df, engine, 'trade_bulk', batch_size=100)
+        finally:
+            Constants.mysql_bulk_load_local_infile = mysql_bulk_load_local_infile
+
+        assert report['rows'] == len(trade_df.index)
+
+        trade_df_to_sql = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date,
+                                                                 ticker=ticker, table_name='trade_to_sql')
+        trade_df_bulk = database_source.fetch_trade_order_data(start_date=start_date, finish_date=finish_date,
+                                                               ticker=ticker, table_name='trade_bulk')
+
+        assert_frame_equal(trade_df_bulk, trade_df_to_sql)
+
+def test_sql_trade_order_indices():
+    """Tests that the maintenance of SQL trade/order tables creates any missing indices on (ticker, date) etc. and that
+    these are used by trade/order queries
+    """
+    database_name = os.path.join(constants.temp_data_folder, 'test_sql_trade_order_indices.db')
+
+    database_source = DatabaseSourceSQLite(trade_data_database_name=database_name)
+    engine, _ = database_source._get_database_engine(database_name=database_name)
+
+    read_pd('small_test_trade_df.csv', index_col=0).to_sql('trade', engine, if_exists='replace', index=True)
+
+    index_status = database_source.analyze_indices(table_name='trade')['trade']
+
+    assert index_status == OrderedDict([('trade_idx_date', 'created'), ('trade_idx_ticker_date', 'created'),
+                                        ('trade_idx_ticker_venue_date', 'created'),
+                                        ('trade_idx_ticker_broker_id_date', 'created')])
+
+    # Second time around, should already have all the indices
+    assert set(database_source.analyze_indices()['trade'].values()) == {'exists'}
+
+    sql_query, params = database_source._create_trade_order_query(
+        start_date=start_date, finish_date=finish_date, ticker=ticker, table_name='trade', database_name=database_name)
+
+    with engine.connect() as con:
+        query_plan = str(con.execute(text('EXPLAIN QUERY PLAN ' + sql_query), params).fetchall())
+
+    assert 'trade_idx_ticker_date' in query_plan
+
 ### SQL dialects #######################################################################################################
 
 def _get_db_trade_database_source():
@@ -793,6 +1249,10 @@ def _get_db_market_data_store():
         market_data_store_list.append(test_harness_influxdb_market_data_store)
         market_data_database_table_list.append(test_harness_influxdb_market_data_table)
 
+    if run_parquet_dataset_tests:
+        market_data_store_list.append(test_harness_parquet_market_data_store)
+        market_data_database_table_list.append(test_harness_parquet_market_data_table)
+
     return market_data_store_list, market_data_database_table_list
 
 def test_fetch_market_data_db():
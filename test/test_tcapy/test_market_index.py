@@ -0,0 +1,200 @@
+"""Tests the vectorised market data indices used by benchmarks and metrics, against simple brute force calculations on
+synthetic market and order data
+"""
+
+__author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
+
+#
+# Copyright 2021 Cuemacro Ltd. - http//www.cuemacro.com / @cuemacro
+#
+# See the License for the specific language governing permissions and limitations under the License.
+#
+
+import pandas as pd
+import numpy as np
+
+from tcapy.analysis.algos.benchmark import BenchmarkArrival, BenchmarkVWAP, BenchmarkTWAP, BenchmarkMedian, \
+    BenchmarkBest, BenchmarkWorst
+from tcapy.analysis.algos.marketindex import RangeMinMaxIndex, RangeMedianIndex, MarketContext
+from tcapy.analysis.algos.metric import MetricMarkout, MetricSlippage, MetricTransientMarketImpact
+from tcapy.util.timeseries import TimeSeriesOps
+
+from test.config import *
+
+def _create_market_order_data(orders=200):
+    """Creates random tick market data with volumes, alongside random orders over windows of that market data
+    """
+    dt = pd.date_range(start='01 Jan 2018 00:00:00', end='01 Jan 2018 06:00:00', freq='1s').tz_localize('utc')
+
+    market_df = pd.DataFrame(index=dt)
+    market_df['bid'] = 1.1 + np.cumsum(np.random.normal(0, 0.0001, len(dt)))
+    market_df['ask'] = market_df['bid'] + 0.0002
+    market_df['mid'] = (market_df['bid'] + market_df['ask']) / 2.0
+    market_df['volume'] = np.random.randint(1, 100, len(dt)).astype(float)
+
+    # Remove random ticks, so the market data is irregularly spaced (for TWAP)
+    market_df = market_df[np.random.random(len(dt)) > 0.3]
+
+    start = np.sort(np.random.randint(10, len(market_df.index) - 2000, orders))
+    length = np.random.randint(0, 2000, orders)
+
+    order_df = pd.DataFrame(index=market_df.index[start])
+    order_df['benchmark_date_start'] = market_df.index[start]
+    order_df['benchmark_date_end'] = market_df.index[start + length]
+    order_df['side'] = np.where(np.random.random(orders) > 0.5, 1, -1)
+
+    return market_df, order_df
+
+def _brute_force_benchmark(market_df, order_df, func):
+    benchmark = []
+
+    for i in range(0, len(order_df.index)):
+        field = 'ask' if order_df['side'].values[i] == 1 else 'bid'
+
+        start = market_df.index.searchsorted(order_df['benchmark_date_start'].iloc[i])
+        end = market_df.index.searchsorted(order_df['benchmark_date_end'].iloc[i])
+
+        if start == end:
+            benchmark.append(market_df[field].values[start])
+        else:
+            benchmark.append(func(market_df, field, start, end))
+
+    return np.array(benchmark)
+
+def test_vwap_twap_benchmark():
+    """Tests that the VWAP and TWAP benchmarks (calculated using cumulative sums) match explicitly averaging market data
+    over each order
+    """
+    market_df, order_df = _create_market_order_data()
+
+    order_df, _ = BenchmarkVWAP(bid_benchmark='bid', ask_benchmark='ask').calculate_benchmark(
+        trade_order_df=order_df, market_df=market_df)
+
+    order_df, _ = BenchmarkTWAP(bid_benchmark='bid', ask_benchmark='ask').calculate_benchmark(
+        trade_order_df=order_df, market_df=market_df)
+
+    time_diff = market_df.index.tz_convert(None).to_series().diff().values / np.timedelta64(1, 's')
+    time_diff[0] = 0
+
+    vwap = _brute_force_benchmark(market_df, order_df, lambda df, field, start, end: np.average(
+        df[field].values[start:end], weights=df['volume'].values[start:end]))
+
+    twap = _brute_force_benchmark(market_df, order_df, lambda df, field, start, end: np.average(
+        df[field].values[start:end], weights=time_diff[start:end]))
+
+    assert np.all(np.abs(order_df['vwap'].values - vwap) < eps)
+    assert np.all(np.abs(order_df['twap'].values - twap) < eps)
+
+def test_median_best_worst_benchmark():
+    """Tests that the median, best and worst benchmarks (calculated using range indices) match explicitly finding those
+    over the market data for each order
+    """
+    market_df, order_df = _create_market_order_data()
+
+    for b in [BenchmarkMedian, BenchmarkBest, BenchmarkWorst]:
+        order_df, _ = b(bid_benchmark='bid', ask_benchmark='ask').calculate_benchmark(
+            trade_order_df=order_df, market_df=market_df)
+
+    median = _brute_force_benchmark(market_df, order_df, lambda df, field, start, end: np.median(
+        df[field].values[start:end]))
+
+    best = _brute_force_benchmark(market_df, order_df, lambda df, field, start, end:
+        np.min(df[field].values[start:end]) if field == 'ask' else np.max(df[field].values[start:end]))
+
+    worst = _brute_force_benchmark(market_df, order_df, lambda df, field, start, end:
+        np.max(df[field].values[start:end]) if field == 'ask' else np.min(df[field].values[start:end]))
+
+    assert np.all(np.abs(order_df['median'].values - median) < eps)
+    assert np.all(np.abs(order_df['best'].values - best) < eps)
+    assert np.all(np.abs(order_df['worst'].values - worst) < eps)
+
+def test_range_index():
+    """Tests the range min/max/median indices on prices with many repeated values, over windows of every length up to
+    several blocks (including those finishing at the very last point)
+    """
+    price = np.round(np.random.random(1000) * 50) / 10.0
+
+    start = np.concatenate([np.arange(0, 1000 - length) for length in range(1, 300, 7)])
+    end = np.concatenate([np.arange(length, 1000) for length in range(1, 300, 7)])
+
+    min_max_index = RangeMinMaxIndex(price, block_size=16)
+    median_index = RangeMedianIndex(price)
+
+    assert np.all(min_max_index.min(start, end) == [np.min(price[s:e]) for s, e in zip(start, end)])
+    assert np.all(min_max_index.max(start, end) == [np.max(price[s:e]) for s, e in zip(start, end)])
+    assert np.all(np.abs(median_index.median(start, end) - [np.median(price[s:e]) for s, e in zip(start, end)]) < eps)
+
+def test_markout_metric():
+    """Tests that the markouts (calculated with a single search over every trade and markout window) match searching the
+    market data separately for each window
+    """
+    market_df, trade_df = _create_market_order_data()
+
+    trade_df.index = trade_df.index + pd.Timedelta(milliseconds=250)
+    trade_df['id'] = np.arange(0, len(trade_df.index))
+
+    markout_windows = [-60, -5, 0, 5, 60, 600]
+
+    _, metric_df = MetricMarkout(bid_benchmark='bid', ask_benchmark='ask', markout_windows=markout_windows,
+                                 markout_unit_of_measure='s').calculate_metric(trade_order_df=trade_df, market_df=market_df)
+
+    field = np.where(trade_df['side'].values == 1, 'ask', 'bid')
+
+    def get_price(window):
+        ix = TimeSeriesOps().search_series(market_df, trade_df.index, timedelta_amount=pd.Timedelta(seconds=window),
+                                           just_before_point=False)
+
+        return np.array([market_df[f].values[i] for f, i in zip(field, ix)])
+
+    zero_price = get_price(0)
+
+    for window in markout_windows:
+        markout = ((get_price(window) / zero_price) - 1.0) * trade_df['side'].values
+
+        assert np.all(np.abs(metric_df['markout_' + str(window) + 's'].values - markout) < eps)
+
+def test_shared_market_context():
+    """Tests that benchmarks and metrics sharing a MarketContext (as in TCATickerLoader) give the same results as
+    calculating each on its own, and that the arrival price and slippage share the same search of market data
+    """
+    market_df, trade_df = _create_market_order_data()
+
+    trade_df.index = trade_df.index + pd.Timedelta(milliseconds=250)
+    trade_df['id'] = np.arange(0, len(trade_df.index))
+    trade_df['executed_price'] = market_df['mid'].values[market_df.index.searchsorted(trade_df.index)]
+
+    def calculate_benchmarks_metrics(trade_df, market_context=None):
+        trade_df = trade_df.copy()
+
+        for b in [BenchmarkArrival(bid_benchmark='bid', ask_benchmark='ask'),
+                  BenchmarkVWAP(bid_benchmark='bid', ask_benchmark='ask')]:
+            trade_df, _ = b.calculate_benchmark(trade_order_df=trade_df, market_df=market_df,
+                                                market_context=market_context)
+
+        for m in [MetricSlippage(bid_benchmark='bid', ask_benchmark='ask'),
+                  MetricTransientMarketImpact(bid_benchmark='bid', ask_benchmark='ask'),
+                  MetricMarkout(bid_benchmark='bid', ask_benchmark='ask', markout_windows=[-5, 0, 5],
+                                markout_unit_of_measure='s')]:
+            trade_df, _ = m.calculate_metric(trade_order_df=trade_df, market_df=market_df,
+                                             market_context=market_context)
+
+        return trade_df
+
+    market_context = MarketContext(market_df)
+
+    shared_df = calculate_benchmarks_metrics(trade_df, market_context=market_context)
+    separate_df = calculate_benchmarks_metrics(trade_df)
+
+    pd.testing.assert_frame_equal(shared_df, separate_df)
+
+    # Arrival price should match a VLOOKUP on the market data for each side
+    is_buy = trade_df['side'].values == 1
+
+    arrival, _ = TimeSeriesOps().vlookup_style_data_frame(trade_df.index[is_buy], market_df, 'ask')
+
+    assert np.all(np.abs(shared_df['arrival'].values[is_buy] - arrival.values) < eps)
+
+    # Arrival and slippage (both the point just before each trade) share the same search, whilst VWAP (start/end),
+    # transient market impact and markouts have their own (ie. only searched once each, despite doing buys and sells
+    # separately)
+    assert len(market_context._positions) == 5
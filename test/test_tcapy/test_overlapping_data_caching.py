@@ -11,8 +11,12 @@ __author__ = 'saeedamen'  # Saeed Amen / saeed@cuemacro.com
 # See the License for the specific language governing permissions and limitations under the License.
 #
 import pandas as pd
+import numpy as np
 import os
 
+from datetime import timedelta
+from pandas.testing import assert_frame_equal
+
 from tcapy.analysis.tcaengine import TCAEngineImpl
 
 from tcapy.analysis.tcarequest import TCARequest
@@ -72,3 +76,460 @@ def test_overlapping_full_detailed_tca_calculation():
     sparse_market_trade_df = dict_of_df['sparse_market_trade_df']
 
     assert len(sparse_market_trade_df.index[sparse_market_trade_df.index < '01 Jun 2017']) > 0
+
+def test_stitched_period_cache():
+    """Tests that requests for overlapping dates are assembled from periods which are already in the cache, only fetching
+    the missing periods from the database
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='01 May 2017', end='31 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    fetched = []
+
+    def fetch_func(start_date, finish_date):
+        fetched.append((start_date, finish_date))
+
+        return df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+    multithreading_params = dict(constants.multithreading_params, cache_period='day')
+
+    def get_data(start_date, finish_date):
+        market_request = MarketRequest(start_date=start_date, finish_date=finish_date, ticker='TESTSTITCH',
+                                       data_store='stitch_test', multithreading_params=multithreading_params)
+
+        return volatile_cache.get_data_request_cache_stitched(market_request, 'stitch_test', 'market_df', 0, fetch_func)
+
+    try:
+        # First request fetches everything, in one go
+        _, _, key, df_1 = get_data('10 May 2017', '12 May 2017')
+
+        assert key is None and len(fetched) == 1
+        assert_frame_equal(df_1, df.loc['10 May 2017':'12 May 2017'])
+
+        # Shifting the dates, only needs the two new days from the database
+        del fetched[:]
+
+        start_date, finish_date, key, df_2 = get_data('11 May 2017', '14 May 2017')
+
+        assert fetched == [(pd.Timestamp('13 May 2017', tz='utc'),
+                            pd.Timestamp('14 May 2017', tz='utc') + timedelta(days=1) - timedelta(microseconds=1))]
+        assert_frame_equal(df_2, df.loc['11 May 2017':'14 May 2017'])
+
+        # Single period which is already cached, so can refer to it by key
+        _, _, key, _ = get_data('11 May 2017', '11 May 2017')
+
+        assert key is not None
+    finally:
+        volatile_cache.clear_key_match('stitch_test_TESTSTITCH_*')
+
+def test_bulk_period_cache():
+    """Tests that the periods for several tickers are fetched from the cache in a single call, with only the contiguous
+    gaps of missing periods fetched from the database for each ticker
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='01 May 2017', end='31 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    fetched = []
+
+    def fetch_func(data_request, start_date, finish_date):
+        fetched.append((data_request.ticker, start_date, finish_date))
+
+        return df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+    multithreading_params = dict(constants.multithreading_params, cache_period='day')
+
+    def create_request(ticker, start_date, finish_date):
+        return MarketRequest(start_date=start_date, finish_date=finish_date, ticker=ticker,
+                             data_store='bulk_test', multithreading_params=multithreading_params)
+
+    get_calls = []
+    get = volatile_cache.get
+
+    def count_get(key, burn_after_reading=False):
+        get_calls.append(key)
+
+        return get(key, burn_after_reading=burn_after_reading)
+
+    volatile_cache.get = count_get
+
+    try:
+        # Cache a few days in the middle for one ticker
+        volatile_cache.get_data_request_cache_bulk(
+            [create_request('TESTBULK1', '12 May 2017', '13 May 2017')], 'bulk_test', 'market_df', 0, fetch_func)
+
+        del fetched[:]; del get_calls[:]
+
+        output = volatile_cache.get_data_request_cache_bulk(
+            [create_request('TESTBULK1', '10 May 2017', '15 May 2017'),
+             create_request('TESTBULK2', '10 May 2017', '15 May 2017')], 'bulk_test', 'market_df', 0, fetch_func)
+
+        # One call to the cache for all the periods, and one fetch for each gap
+        assert len(get_calls) == 1 and len(get_calls[0]) == 12
+        assert [(f[0], f[1].day, f[2].day) for f in fetched] == \
+               [('TESTBULK1', 10, 11), ('TESTBULK1', 14, 15), ('TESTBULK2', 10, 15)]
+
+        for _, _, _, df_bulk in output:
+            assert_frame_equal(df_bulk, df.loc['10 May 2017':'15 May 2017'])
+    finally:
+        volatile_cache.clear_key_match('bulk_test_TESTBULK*')
+
+def test_batch_market_trade_holder_list():
+    """Tests that date chunks loaded in batches (as by each Celery task), returned as CacheHandles, are combined back into
+    the same market and trade data as the whole request
+    """
+    from tcapy.analysis.tcamarkettradeloaderimpl import TCAMarketTradeLoaderImpl
+    from tcapy.analysis.tcatickerloaderimpl import TCATickerLoaderImpl
+    from tcapy.data.volatilecache import CacheHandle
+
+    trade_df = read_pd('small_test_trade_df.csv', index_col=0)
+    trade_df.index = pd.to_datetime(trade_df.index); trade_df.index.name = 'date'
+    trade_df = trade_df[(trade_df['ticker'] == 'EURUSD') & (trade_df['notional_currency'] == 'EUR')]
+
+    dt = pd.date_range(start='24 Apr 2017', end='06 May 2017', freq='1min', tz='utc')
+    market_df = pd.DataFrame(index=dt, data={'mid': 1.09, 'bid': 1.0899, 'ask': 1.0901, 'ticker': 'EURUSD'})
+    market_df.index.name = 'Date'
+
+    tca_request = TCARequest(start_date='25 Apr 2017', finish_date='05 May 2017', ticker='EURUSD',
+                             reporting_currency='EUR', trade_data_store='dataframe', market_data_store=market_df,
+                             trade_order_mapping={'trade_df': trade_df}, use_multithreading=True,
+                             multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    tca_market_trade_loader = TCAMarketTradeLoaderImpl()
+    tca_ticker_loader = TCATickerLoaderImpl()
+
+    tca_request_date_split = tca_market_trade_loader._split_tca_request_by_date(tca_request, 'EURUSD', period='day')
+    tca_request_date_batch = tca_market_trade_loader._batch_tca_request_by_date(tca_request_date_split, 4)
+
+    assert [len(b) for b in tca_request_date_batch] == [4, 4, 3]
+
+    market_trade_order_list = [tca_ticker_loader.get_market_trade_order_holder_list(b, return_cache_handles=True)
+                               for b in tca_request_date_batch]
+
+    assert isinstance(market_trade_order_list[0][0][0], CacheHandle)
+
+    market_df_combined, trade_order_holder = tca_ticker_loader._convert_tuple_to_market_trade(market_trade_order_list)
+
+    assert_frame_equal(market_df_combined, market_df.loc['25 Apr 2017':'05 May 2017 23:59'], check_freq=False)
+
+    trade_df_combined = trade_order_holder.get_combined_dataframe_dict()['trade_df']
+
+    assert list(trade_df_combined.index) == list(trade_df.loc['25 Apr 2017':'05 May 2017 23:59'].index)
+
+def test_stream_period_cache():
+    """Tests that chunks streamed from a database (which can straddle periods) are written into the cache period by
+    period, and can then be read back in full without going to the database
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='10 May 2017', end='13 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    def fetch_chunks_func(start_date, finish_date):
+        df_range = df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+        # Chunks which don't line up with the days
+        for i in range(0, len(df_range.index), 30):
+            yield df_range[i:i + 30]
+
+    market_request = MarketRequest(start_date='10 May 2017', finish_date='15 May 2017', ticker='TESTSTREAM',
+                                   data_store='stream_test',
+                                   multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    try:
+        keys = volatile_cache.put_data_request_cache_chunks(market_request, 'stream_test', 'market_df', 0,
+                                                            fetch_chunks_func)
+
+        assert len(keys) == 6
+
+        def fetch_func(start_date, finish_date):
+            raise Exception("Shouldn't need to go to the database")
+
+        _, _, _, df_stream = volatile_cache.get_data_request_cache_stitched(market_request, 'stream_test', 'market_df',
+                                                                           0, fetch_func)
+
+        assert_frame_equal(df_stream, df)
+    finally:
+        volatile_cache.clear_key_match('stream_test_TESTSTREAM*')
+
+def test_stream_period_cache_error():
+    """Tests that if the database fails part way through streaming chunks, the error is raised and the remaining periods
+    aren't cached as empty
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='10 May 2017', end='13 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    def fetch_chunks_func(start_date, finish_date):
+        # First 30 hours, then the database fails
+        yield df[0:30]
+
+        raise Exception("Database connection lost")
+
+    market_request = MarketRequest(start_date='10 May 2017', finish_date='13 May 2017', ticker='TESTSTREAMERR',
+                                   data_store='stream_test',
+                                   multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    try:
+        try:
+            volatile_cache.put_data_request_cache_chunks(market_request, 'stream_test', 'market_df', 0,
+                                                         fetch_chunks_func)
+
+            assert False
+        except Exception as e:
+            assert str(e) == "Database connection lost"
+
+        fetched = []
+
+        def fetch_func(start_date, finish_date):
+            fetched.append((start_date.day, finish_date.day))
+
+            return df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+        _, _, _, df_stitched = volatile_cache.get_data_request_cache_stitched(market_request, 'stream_test',
+                                                                             'market_df', 0, fetch_func)
+
+        # Only the first day was complete, so the others need to be fetched again (rather than being empty)
+        assert fetched == [(11, 13)]
+        assert_frame_equal(df_stitched, df)
+    finally:
+        volatile_cache.clear_key_match('stream_test_TESTSTREAMERR*')
+
+def test_block_period_cache():
+    """Tests that large gaps in the cache are fetched from the database in blocks of periods, with periods cached as each
+    block completes, so a failure part way through only needs the remaining periods to be fetched again
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='01 May 2017', end='31 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    fetched = []
+
+    def fetch_func(start_date, finish_date):
+        fetched.append((start_date.day, finish_date.day))
+
+        return df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+    def fetch_fail_func(start_date, finish_date):
+        if len(fetched) > 0:
+            raise Exception("Database connection lost")
+
+        return fetch_func(start_date, finish_date)
+
+    market_request = MarketRequest(start_date='10 May 2017', finish_date='15 May 2017', ticker='TESTBLOCK',
+                                   data_store='block_test',
+                                   multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    block_periods = Constants.volatile_cache_fetch_block_periods
+    Constants.volatile_cache_fetch_block_periods = 2
+
+    try:
+        _, _, _, df_block = volatile_cache.get_data_request_cache_stitched(market_request, 'block_test', 'market_df', 0,
+                                                                          fetch_func)
+
+        assert fetched == [(10, 11), (12, 13), (14, 15)]
+        assert_frame_equal(df_block, df.loc['10 May 2017':'15 May 2017'])
+
+        volatile_cache.clear_key_match('block_test_TESTBLOCK*'); del fetched[:]
+
+        # Fails on the second block, but the first block is still cached
+        try:
+            volatile_cache.get_data_request_cache_stitched(market_request, 'block_test', 'market_df', 0,
+                                                           fetch_fail_func)
+
+            assert False
+        except Exception as e:
+            assert str(e) == "Database connection lost"
+
+        del fetched[:]
+
+        _, _, _, df_block = volatile_cache.get_data_request_cache_stitched(market_request, 'block_test', 'market_df', 0,
+                                                                          fetch_func)
+
+        assert fetched == [(12, 13), (14, 15)]
+        assert_frame_equal(df_block, df.loc['10 May 2017':'15 May 2017'])
+    finally:
+        Constants.volatile_cache_fetch_block_periods = block_periods
+
+        volatile_cache.clear_key_match('block_test_TESTBLOCK*')
+
+def test_stream_stitched_period_cache():
+    """Tests that when filling gaps in the cache with chunks streamed from a database, each period is cached and the
+    stitched DataFrame is the same as fetching the whole gap in one go
+    """
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='10 May 2017', end='15 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    fetched = []
+
+    def fetch_func(start_date, finish_date):
+        raise Exception("Should stream from the database")
+
+    def fetch_chunks_func(start_date, finish_date):
+        fetched.append((start_date.day, finish_date.day))
+
+        df_range = df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+        # Chunks which don't line up with the days
+        for i in range(0, len(df_range.index), 30):
+            yield df_range[i:i + 30]
+
+    market_request = MarketRequest(start_date='10 May 2017', finish_date='15 May 2017', ticker='TESTSTREAMGAP',
+                                   data_store='stream_test',
+                                   multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    try:
+        # Only the gaps around a day which is already cached are streamed
+        volatile_cache.put_data_request_cache_chunks(
+            MarketRequest(start_date='12 May 2017', finish_date='12 May 2017', ticker='TESTSTREAMGAP',
+                          data_store='stream_test',
+                          multithreading_params=dict(constants.multithreading_params, cache_period='day')),
+            'stream_test', 'market_df', 0, fetch_chunks_func)
+
+        del fetched[:]
+
+        _, _, _, df_stream = volatile_cache.get_data_request_cache_stitched(
+            market_request, 'stream_test', 'market_df', 0, fetch_func, fetch_chunks_func=fetch_chunks_func)
+
+        assert fetched == [(10, 11), (13, 15)]
+        assert_frame_equal(df_stream, df)
+
+        def fetch_cache_func(start_date, finish_date):
+            raise Exception("Shouldn't need to go to the database")
+
+        _, _, _, df_cache = volatile_cache.get_data_request_cache_stitched(
+            market_request, 'stream_test', 'market_df', 0, fetch_cache_func, fetch_chunks_func=fetch_cache_func)
+
+        assert_frame_equal(df_cache, df)
+    finally:
+        volatile_cache.clear_key_match('stream_test_TESTSTREAMGAP*')
+
+def test_stream_trade_order_data():
+    """Tests that trade data streamed in chunks from an SQL database into the cache (with
+    constants.volatile_cache_stream_trade_order_data) is the same as fetching it in one go
+    """
+    from tcapy.analysis.tcatickerloaderimpl import TCATickerLoaderImpl
+    from tcapy.data.databasesource import DatabaseSourceSQLite
+
+    database_name = os.path.join(constants.temp_data_folder, 'test_stream_trade_order_data.db')
+
+    trade_df = read_pd('small_test_trade_df.csv', index_col=0)
+    trade_df = trade_df[(trade_df['ticker'] == 'EURUSD') & (trade_df['notional_currency'] == 'EUR')]
+
+    engine, _ = DatabaseSourceSQLite(trade_data_database_name=database_name)._get_database_engine(
+        database_name=database_name)
+
+    trade_df.to_sql('trade', engine, if_exists='replace', index=True)
+
+    dt = pd.date_range(start='24 Apr 2017', end='06 May 2017', freq='1min', tz='utc')
+    market_df = pd.DataFrame(index=dt, data={'mid': 1.09, 'bid': 1.0899, 'ask': 1.0901, 'ticker': 'EURUSD'})
+    market_df.index.name = 'Date'
+
+    def create_tca_request():
+        return TCARequest(start_date='25 Apr 2017', finish_date='05 May 2017', ticker='EURUSD',
+                          reporting_currency='EUR', trade_data_store='sqlite', trade_data_database_name=database_name,
+                          market_data_store=market_df, trade_order_mapping={'trade_df': 'trade'}, reload=True,
+                          multithreading_params=dict(constants.multithreading_params, cache_period='day'))
+
+    tca_ticker_loader = TCATickerLoaderImpl()
+
+    stream_trade_order_data = Constants.volatile_cache_stream_trade_order_data
+    sql_fetch_chunksize = Constants.sql_fetch_chunksize
+
+    try:
+        trade_df_full = tca_ticker_loader.get_trade_order_data(create_tca_request(), 'trade_df',
+                                                               return_cache_handles=False)
+
+        # Stream a few trades at a time, which will straddle the days
+        Constants.volatile_cache_stream_trade_order_data = True
+        Constants.sql_fetch_chunksize = 5
+
+        trade_df_stream = tca_ticker_loader.get_trade_order_data(create_tca_request(), 'trade_df',
+                                                                 return_cache_handles=False)
+
+        assert len(trade_df_full.index) > 5
+        assert_frame_equal(trade_df_stream, trade_df_full)
+    finally:
+        Constants.volatile_cache_stream_trade_order_data = stream_trade_order_data
+        Constants.sql_fetch_chunksize = sql_fetch_chunksize
+
+def test_single_flight_period_cache():
+    """Tests that when several callers ask for the same data at once, only one of them loads it from the database, and
+    the others wait for it to be published to the cache
+    """
+    import threading
+    import time
+
+    from tcapy.analysis.tcarequest import MarketRequest
+    from tcapy.data.volatilecache import VolatileSharedMemory
+
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='01 May 2017', end='31 May 2017 23:00', freq='1h', tz='utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.arange(0, len(dt), dtype=float)})
+    df.index.freq = None
+
+    fetched = []
+
+    def fetch_func(start_date, finish_date):
+        fetched.append((start_date, finish_date))
+
+        # Simulate a slow database
+        time.sleep(0.5)
+
+        return df.loc[(df.index >= start_date) & (df.index <= finish_date)]
+
+    multithreading_params = dict(constants.multithreading_params, cache_period='day')
+
+    results = []
+
+    def get_data():
+        market_request = MarketRequest(start_date='10 May 2017', finish_date='12 May 2017', ticker='TESTFLIGHT',
+                                       data_store='flight_test', multithreading_params=multithreading_params)
+
+        results.append(volatile_cache.get_data_request_cache_stitched(
+            market_request, 'flight_test', 'market_df', 0, fetch_func)[3])
+
+    try:
+        threads = [threading.Thread(target=get_data) for i in range(0, 5)]
+
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        assert len(fetched) == 1 and len(results) == 5
+
+        for r in results:
+            assert_frame_equal(r, df.loc['10 May 2017':'12 May 2017'])
+    finally:
+        volatile_cache.clear_key_match('flight_test_TESTFLIGHT_*')
@@ -171,6 +171,76 @@ def test_chunk():
 
     assert_frame_equal(df_chunk, df)
 
+def test_weighted_average_by_agg():
+    """Tests the grouped weighted average (using bincount) matches a pandas groupby, including missing values/keys
+    """
+    df = pd.DataFrame({'executed_price': np.random.random(1000), 'executed_notional': np.random.random(1000) * 100,
+                       'order_pointer_id': np.random.choice(['order' + str(i) for i in range(0, 50)], 1000)})
+
+    df.loc[df.index[::7], 'executed_price'] = np.nan
+    df.loc[df.index[::11], 'order_pointer_id'] = np.nan
+
+    results_df = TimeSeriesOps().weighted_average_by_agg(df, 'executed_price', 'executed_notional', 'order_pointer_id',
+                                                         unweighted_data_col=['executed_notional', 'notional'])
+
+    g = df.assign(_data_times_weight=df['executed_price'] * df['executed_notional'],
+                  _weight=df['executed_notional'] * pd.notnull(df['executed_price'])).groupby('order_pointer_id')
+
+    comparison_df = pd.DataFrame({'executed_price': g['_data_times_weight'].sum() / g['_weight'].sum(),
+                                  'executed_notional': g['executed_notional'].sum()})
+
+    assert_frame_equal(results_df, comparison_df)
+
+def test_arrow_ipc_serialize():
+    """Tests that DataFrames serialized as (compressed) Arrow IPC streams, including those split into several chunks, are
+    deserialized correctly
+    """
+    from tcapy.util.deltaizeserialize import DeltaizeSerialize
+
+    deltaize_serialize = DeltaizeSerialize()
+
+    dt = pd.date_range(start='01 Jan 2018', end='05 Jan 2018', freq='1min').tz_localize('utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.random.random(len(dt)), 'ticker': 'EURUSD'})
+    df.index.freq = None
+
+    for compression in [None, 'lz4', 'zstd']:
+        df_list = TimeSeriesOps().split_array_chunks(df, chunks=4)
+
+        binary = [deltaize_serialize._dataframe_to_arrow_ipc(d, compression=compression) for d in df_list]
+
+        assert_frame_equal(df, deltaize_serialize._arrow_ipc_to_dataframe(binary))
+
+def test_delta_encode():
+    """Tests that market ticks encoded by DeltaizeSerialize (delta-of-delta timestamps, integer price offsets) are decoded
+    exactly, including prices which can't be encoded (which are left as they are)
+    """
+    from tcapy.util.deltaizeserialize import DeltaizeSerialize
+
+    deltaize_serialize = DeltaizeSerialize()
+
+    dt = pd.Timestamp('01 Jan 2018', tz='utc').value + np.cumsum(np.random.randint(1, 5000, 10000) * 10 ** 6)
+
+    df = pd.DataFrame(index=pd.DatetimeIndex(dt, tz='utc').tz_convert('Europe/London'))
+    df['bid'] = np.round(1.1 + np.cumsum(np.random.randint(-2, 3, len(df.index))) / 10 ** 5, 5)
+    df['ask'] = np.round(df['bid'] + 0.00012, 5)
+    df['mid'] = np.random.random(len(df.index))
+    df['ticker'] = 'EURUSD'
+
+    df.loc[df.index[10], 'ask'] = np.nan
+
+    df_encoded, delta_dict = deltaize_serialize.encode_delta(df)
+
+    assert delta_dict['index']['unit'] == 10 ** 6 and list(delta_dict['fields'].keys()) == ['bid']
+    assert np.issubdtype(df_encoded['bid'].dtype, np.integer)
+
+    assert_frame_equal(df, deltaize_serialize.decode_delta(df_encoded, delta_dict))
+
+    # Each chunk is encoded separately
+    binary = [deltaize_serialize._dataframe_to_arrow_ipc(d, compression='lz4', delta_encode=True)
+              for d in TimeSeriesOps().split_array_chunks(df, chunks=3)]
+
+    assert_frame_equal(df, deltaize_serialize._arrow_ipc_to_dataframe(binary))
+
 def test_cache_handle():
     """Tests the storing of DataFrames in the CacheHandle
     """
@@ -187,6 +257,163 @@ def test_cache_handle():
 
     assert_frame_equal(df, df_1)
 
+def test_cache_manifest():
+    """Tests that getting several keys from the cache (using their manifests) returns None for missing keys, and that
+    clearing keys by pattern also removes their manifests
+    """
+    from tcapy.data.volatilecache import VolatileRedis as VolatileCache
+    volatile_cache = VolatileCache()
+
+    dt = pd.date_range(start='01 Jan 2017', end='02 Jan 2017', freq='1min')
+    df = pd.DataFrame(index=dt, data={'mid': np.random.random(len(dt))})
+    df.index.freq = None
+
+    volatile_cache.put(['test_manifest_expiry_df_comp'], [df])
+
+    df_list = volatile_cache.get(['test_manifest_missing_df_comp', 'test_manifest_expiry_df_comp'])
+
+    assert df_list[0] is None
+    assert_frame_equal(df, df_list[1])
+
+    volatile_cache.clear_key_match('test_manifest_*')
+
+    assert volatile_cache.get(['test_manifest_expiry_df_comp']) == [None]
+    assert list(VolatileCache._db.scan_iter(match='test_manifest_*')) == []
+
+def test_local_cache():
+    """Tests the in-process LocalCache evicts the least recently used DataFrames when it is full, expires them and can
+    be cleared by pattern
+    """
+    from tcapy.data.volatilecache import LocalCache
+
+    dt = pd.date_range(start='01 Jan 2018', end='05 Jan 2018', freq='1min')
+    df = pd.DataFrame(index=dt, data={'mid': np.random.random(len(dt))})
+
+    size_bytes = df.memory_usage(index=True).sum()
+
+    # Room for two DataFrames
+    local_cache = LocalCache(max_size_bytes=size_bytes * 2.5, expiry_seconds=60)
+
+    local_cache.put(['a_df', 'b_df'], [df, df])
+    local_cache.get(['a_df'])
+    local_cache.put(['c_df'], [df])
+
+    # 'b_df' was least recently used, so should have been evicted
+    a_df, b_df, c_df = local_cache.get(['a_df', 'b_df', 'c_df'])
+
+    assert_frame_equal(a_df, df)
+    assert b_df is None
+    assert_frame_equal(c_df, df)
+
+    # Altering the returned DataFrame shouldn't change the cached one
+    a_df['mid'] = 0
+    assert_frame_equal(local_cache.get(['a_df'])[0], df)
+
+    stats = local_cache.get_stats()
+    assert stats['hits'] == 4 and stats['misses'] == 1 and stats['evictions'] == 1 and stats['keys'] == 2
+
+    local_cache.clear_key_match('a_*')
+    assert local_cache.get(['a_df', 'c_df'])[0] is None
+
+    # Should expire immediately
+    local_cache = LocalCache(max_size_bytes=size_bytes * 2.5, expiry_seconds=-1)
+    local_cache.put(['a_df'], [df])
+
+    assert local_cache.get(['a_df']) == [None] and local_cache.get_stats()['size_bytes'] == 0
+
+def test_shared_memory_cache():
+    """Tests storing DataFrames in shared memory, including reading CacheHandles several times (by incrementing their
+    reference count), before they are burnt
+    """
+    from tcapy.data.volatilecache import VolatileSharedMemory
+    volatile_cache = VolatileSharedMemory()
+
+    dt = pd.date_range(start='01 Jan 2018', end='05 Jan 2018', freq='1min').tz_localize('utc')
+    df = pd.DataFrame(index=dt, data={'mid': np.random.random(len(dt)), 'ticker': 'EURUSD'})
+    df.index.freq = None
+
+    ch = volatile_cache.put_dataframe_handle(df, use_cache_handles=True)
+    volatile_cache.incr_ref_count(ch)
+
+    assert_frame_equal(df, volatile_cache.get_dataframe_handle(ch, burn_after_reading=True))
+    assert_frame_equal(df, volatile_cache.get_dataframe_handle(ch, burn_after_reading=True))
+    assert volatile_cache.get_dataframe_handle(ch, burn_after_reading=True) is None
+
+    volatile_cache.put(['test_shm_expiry_df', 'test_shm_other_df'], [df, df])
+    volatile_cache.clear_key_match('test_shm_expiry*')
+
+    df_list = volatile_cache.get(['test_shm_expiry_df', 'test_shm_other_df'])
+
+    assert df_list[0] is None
+    assert_frame_equal(df, df_list[1])
+
+    volatile_cache.delete('test_shm_other_df')
+
+    assert volatile_cache.get('test_shm_other_df') is None
+
+def test_tca_request_cache():
+    """Tests that TCA output is shared between identical TCARequests (even with tickers in a different order), but not
+    once the data store it used has been written to
+    """
+    from tcapy.analysis.tcarequest import TCARequest
+    from tcapy.analysis.algos.metric import MetricSlippage, MetricMarkout
+    from tcapy.data.volatilecache import VolatileSharedMemory
+    volatile_cache = VolatileSharedMemory()
+
+    def create_tca_request(ticker, markout_windows=[-5, 0, 5]):
+        return TCARequest(start_date='01 May 2017', finish_date='30 May 2017', ticker=ticker, tca_type='aggregated',
+                          market_data_store='arctic-testcache', trade_data_store='mysql',
+                          metric_calcs=[MetricSlippage(), MetricMarkout(markout_windows=markout_windows)])
+
+    assert create_tca_request(['EURUSD', 'USDJPY']).get_fingerprint() \
+           == create_tca_request(['USDJPY', 'EURUSD']).get_fingerprint()
+
+    assert create_tca_request(['EURUSD', 'USDJPY']).get_fingerprint() \
+           != create_tca_request(['EURUSD', 'USDJPY'], markout_windows=[0, 5]).get_fingerprint()
+
+    dt = pd.date_range(start='01 May 2017', end='02 May 2017', freq='1min').tz_localize('utc')
+    df = pd.DataFrame(index=dt, data={'slippage': np.random.random(len(dt))})
+    df.index.freq = None
+
+    try:
+        key, dict_of_df = volatile_cache.get_tca_request_cache(create_tca_request(['EURUSD', 'USDJPY']))
+
+        assert dict_of_df is None
+
+        volatile_cache.put_tca_request_cache(key, {'trade_df': df, 'bar_slippage_df': df})
+
+        _, dict_of_df = volatile_cache.get_tca_request_cache(create_tca_request(['USDJPY', 'EURUSD']))
+
+        assert list(dict_of_df.keys()) == ['trade_df', 'bar_slippage_df']
+        assert_frame_equal(df, dict_of_df['bar_slippage_df'])
+
+        # After uploading new market data, we shouldn't use the old TCA output
+        volatile_cache.invalidate_tca_request_cache('arctic-testcache')
+
+        key, dict_of_df = volatile_cache.get_tca_request_cache(create_tca_request(['EURUSD', 'USDJPY']))
+
+        assert dict_of_df is None
+
+        # Also when a DatabaseSource writes to that type of data store (eg. any 'arctic-*' or 'mysql')
+        for data_store in ['arctic', 'mysql']:
+            volatile_cache.put_tca_request_cache(key, {'trade_df': df})
+
+            assert volatile_cache.get_tca_request_cache(create_tca_request(['EURUSD', 'USDJPY']))[1] is not None
+
+            volatile_cache.invalidate_tca_request_cache(data_store)
+
+            key, dict_of_df = volatile_cache.get_tca_request_cache(create_tca_request(['EURUSD', 'USDJPY']))
+
+            assert dict_of_df is None
+
+        # If the data version tokens are evicted, we shouldn't match TCA output cached before they were evicted
+        volatile_cache.put_tca_request_cache(key, {'trade_df': df})
+        volatile_cache.clear_key_match('tca_data_version_*')
+
+        assert volatile_cache.get_tca_request_cache(create_tca_request(['EURUSD', 'USDJPY']))[1] is None
+    finally:
+        volatile_cache.clear_key_match('tca_*')
+
 def test_data_frame_holder():
     """Tests the storing of DataFrameHolder object which is like an enhanced dict specifically for storing DataFrames,
     alongside using the VolatileCache